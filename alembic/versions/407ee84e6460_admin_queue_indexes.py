@@ -0,0 +1,49 @@
+"""admin queue indexes for deposits / redemption_requests
+
+Revision ID: 407ee84e6460
+Revises: b3fac114ca94
+Create Date: 2026-10-19
+
+"""
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "407ee84e6460"
+down_revision = "b3fac114ca94"
+branch_labels = None
+depends_on = None
+
+
+INDEXES = [
+    ("ix_deposits_status_id", "deposits", "status, id"),
+    ("ix_deposits_user_status_id", "deposits", "user_id, status, id"),
+    ("ix_redemption_requests_status_id", "redemption_requests", "status, id"),
+    ("ix_redemption_requests_user_status_id", "redemption_requests", "user_id, status, id"),
+]
+
+
+def _has_table(name: str) -> bool:
+    bind = op.get_bind()
+    insp = sa.inspect(bind)
+    return insp.has_table(name, schema="public")
+
+
+def upgrade() -> None:
+    # CONCURRENTLY: queues are live tables in production, don't block writers
+    with op.get_context().autocommit_block():
+        for name, table, cols in INDEXES:
+            if _has_table(table):
+                op.execute(sa.text(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON public.{table} ({cols})"))
+        for table in ("deposits", "redemption_requests"):
+            if _has_table(table):
+                # seed pg_stats so /counts can answer from estimates right away
+                op.execute(sa.text(f"ANALYZE public.{table}"))
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, _table, _cols in reversed(INDEXES):
+            op.execute(sa.text(f"DROP INDEX CONCURRENTLY IF EXISTS public.{name}"))
@@ -0,0 +1,56 @@
+"""staking_accrual_runs (chunked, restartable accrual checkpoints)
+
+Revision ID: 5c1f0e9d7a42
+Revises: 814ecc1350ab
+Create Date: 2026-10-19
+
+"""
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "5c1f0e9d7a42"
+down_revision = "814ecc1350ab"
+branch_labels = None
+depends_on = None
+
+
+def _exec(sql: str) -> None:
+    op.execute(sa.text(sql))
+
+
+def upgrade() -> None:
+    _exec(
+        """
+        CREATE TABLE IF NOT EXISTS public.staking_accrual_runs (
+            id               VARCHAR(36) PRIMARY KEY,
+            status           VARCHAR(16) NOT NULL DEFAULT 'RUNNING',
+            as_of            TIMESTAMPTZ NOT NULL,
+            chunk_size       INTEGER NOT NULL,
+            cursor           VARCHAR(36),
+            chunks_done      INTEGER NOT NULL DEFAULT 0,
+            positions_done   INTEGER NOT NULL DEFAULT 0,
+            rewards_inserted INTEGER NOT NULL DEFAULT 0,
+            reward_total     NUMERIC(38, 18) NOT NULL DEFAULT 0,
+            error            TEXT,
+            started_at       TIMESTAMPTZ NOT NULL DEFAULT timezone('utc', now()),
+            updated_at       TIMESTAMPTZ NOT NULL DEFAULT timezone('utc', now()),
+            finished_at      TIMESTAMPTZ
+        )
+        """
+    )
+    _exec(
+        "CREATE INDEX IF NOT EXISTS ix_staking_accrual_runs_status_started "
+        "ON public.staking_accrual_runs (status, started_at)"
+    )
+    _exec(
+        "CREATE INDEX IF NOT EXISTS ix_staking_positions_active_id "
+        "ON public.staking_positions (id) WHERE state = 'ACTIVE'"
+    )
+
+
+def downgrade() -> None:
+    _exec("DROP INDEX IF EXISTS public.ix_staking_positions_active_id")
+    _exec("DROP TABLE IF EXISTS public.staking_accrual_runs")
@@ -0,0 +1,43 @@
+"""redemption_requests.decision_key (approval idempotency)
+
+Revision ID: 814ecc1350ab
+Revises: 407ee84e6460
+Create Date: 2026-10-19
+
+"""
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "814ecc1350ab"
+down_revision = "407ee84e6460"
+branch_labels = None
+depends_on = None
+
+
+def _has_table(name: str) -> bool:
+    bind = op.get_bind()
+    insp = sa.inspect(bind)
+    return insp.has_table(name, schema="public")
+
+
+def _exec(sql: str) -> None:
+    op.execute(sa.text(sql))
+
+
+def upgrade() -> None:
+    if not _has_table("redemption_requests"):
+        return
+    _exec("ALTER TABLE public.redemption_requests ADD COLUMN IF NOT EXISTS decision_key VARCHAR(64)")
+    _exec(
+        "CREATE UNIQUE INDEX IF NOT EXISTS uq_redemption_requests_decision_key "
+        "ON public.redemption_requests (decision_key)"
+    )
+
+
+def downgrade() -> None:
+    _exec("DROP INDEX IF EXISTS public.uq_redemption_requests_decision_key")
+    if _has_table("redemption_requests"):
+        _exec("ALTER TABLE public.redemption_requests DROP COLUMN IF EXISTS decision_key")
@@ -0,0 +1,52 @@
+"""staking_positions keyset indexes for per-user listings (created_at DESC, id DESC)
+
+Revision ID: a3d5e7c19b42
+Revises: f19c3a6b8e25
+Create Date: 2026-10-19
+
+"""
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "a3d5e7c19b42"
+down_revision = "f19c3a6b8e25"
+branch_labels = None
+depends_on = None
+
+
+def _exec(sql: str) -> None:
+    op.execute(sa.text(sql))
+
+
+def _replace_index(name: str, cols: str) -> None:
+    """
+    Build `name` on (cols) next to the existing one and swap them, CONCURRENTLY: writers are
+    never blocked and the old index serves queries until the new one is valid.
+    """
+    tmp = f"{name}_new"
+    # an interrupted run can leave an INVALID tmp index behind
+    _exec(f"DROP INDEX CONCURRENTLY IF EXISTS public.{tmp}")
+    _exec(f"CREATE INDEX CONCURRENTLY {tmp} ON public.staking_positions ({cols})")
+    _exec(f"DROP INDEX CONCURRENTLY IF EXISTS public.{name}")
+    _exec(f"ALTER INDEX public.{tmp} RENAME TO {name}")
+
+
+def upgrade() -> None:
+    # CONCURRENTLY: staking_positions is written by every stake / accrual, don't block writers
+    with op.get_context().autocommit_block():
+        # unfiltered pages: one ordered range scan per page
+        _exec(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_staking_positions_user_created "
+            "ON public.staking_positions (user_telegram_id, created_at DESC, id DESC)"
+        )
+        # state-filtered pages: same order inside (user, state); still serves plain (user, state) lookups
+        _replace_index("ix_staking_positions_user_state", "user_telegram_id, state, created_at DESC, id DESC")
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        _replace_index("ix_staking_positions_user_state", "user_telegram_id, state")
+        _exec("DROP INDEX CONCURRENTLY IF EXISTS public.ix_staking_positions_user_created")
@@ -0,0 +1,47 @@
+"""staking reward index (per-pool accumulator, position snapshots)
+
+Revision ID: a81d3c6e52f0
+Revises: 5c1f0e9d7a42
+Create Date: 2026-10-19
+
+"""
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "a81d3c6e52f0"
+down_revision = "5c1f0e9d7a42"
+branch_labels = None
+depends_on = None
+
+
+def _exec(sql: str) -> None:
+    op.execute(sa.text(sql))
+
+
+def upgrade() -> None:
+    _exec("ALTER TABLE public.staking_pools ADD COLUMN IF NOT EXISTS reward_index NUMERIC(38, 0) NOT NULL DEFAULT 0")
+    _exec("ALTER TABLE public.staking_pools ADD COLUMN IF NOT EXISTS reward_index_at TIMESTAMPTZ")
+    _exec("ALTER TABLE public.staking_positions ADD COLUMN IF NOT EXISTS reward_index_snapshot NUMERIC(38, 0)")
+    _exec(
+        """
+        CREATE TABLE IF NOT EXISTS public.staking_pool_index_points (
+            id           BIGSERIAL PRIMARY KEY,
+            pool_id      VARCHAR(36) NOT NULL REFERENCES public.staking_pools(id) ON DELETE CASCADE,
+            at           TIMESTAMPTZ NOT NULL,
+            reward_index NUMERIC(38, 0) NOT NULL,
+            apy_bps      INTEGER NOT NULL,
+            created_at   TIMESTAMPTZ NOT NULL DEFAULT timezone('utc', now()),
+            CONSTRAINT uq_staking_pool_index_points_pool_at UNIQUE (pool_id, at)
+        )
+        """
+    )
+
+
+def downgrade() -> None:
+    _exec("DROP TABLE IF EXISTS public.staking_pool_index_points")
+    _exec("ALTER TABLE public.staking_positions DROP COLUMN IF EXISTS reward_index_snapshot")
+    _exec("ALTER TABLE public.staking_pools DROP COLUMN IF EXISTS reward_index_at")
+    _exec("ALTER TABLE public.staking_pools DROP COLUMN IF EXISTS reward_index")
@@ -0,0 +1,59 @@
+"""slh_balances summary table
+
+Revision ID: b3fac114ca94
+Revises: 27a0485a5534
+Create Date: 2026-10-19
+
+"""
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "b3fac114ca94"
+down_revision = "27a0485a5534"
+branch_labels = None
+depends_on = None
+
+
+def _has_table(name: str) -> bool:
+    bind = op.get_bind()
+    insp = sa.inspect(bind)
+    return insp.has_table(name, schema="public")
+
+
+def _exec(sql: str) -> None:
+    op.execute(sa.text(sql))
+
+
+def upgrade() -> None:
+    _exec(
+        """
+        CREATE TABLE IF NOT EXISTS public.slh_balances (
+            user_id     INTEGER PRIMARY KEY,
+            balance_slh NUMERIC(28, 8) NOT NULL DEFAULT 0,
+            updated_at  TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT (now() at time zone 'utc')
+        )
+        """
+    )
+
+    # investments tables predate Alembic in production; only backfill where they exist
+    if _has_table("slh_ledger"):
+        _exec("CREATE INDEX IF NOT EXISTS ix_slh_ledger_user_id_id ON public.slh_ledger (user_id, id)")
+        _exec(
+            """
+            INSERT INTO public.slh_balances (user_id, balance_slh, updated_at)
+            SELECT user_id, COALESCE(SUM(amount_slh), 0), (now() at time zone 'utc')
+            FROM public.slh_ledger
+            GROUP BY user_id
+            ON CONFLICT (user_id) DO UPDATE
+              SET balance_slh = EXCLUDED.balance_slh,
+                  updated_at = EXCLUDED.updated_at
+            """
+        )
+
+
+def downgrade() -> None:
+    _exec("DROP INDEX IF EXISTS public.ix_slh_ledger_user_id_id")
+    _exec("DROP TABLE IF EXISTS public.slh_balances")
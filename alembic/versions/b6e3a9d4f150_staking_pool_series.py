@@ -0,0 +1,53 @@
+"""staking_pool_series (hourly per-pool TVL / APY / flow metrics)
+
+Revision ID: b6e3a9d4f150
+Revises: d8c1f4a26e93
+Create Date: 2026-10-19
+
+"""
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "b6e3a9d4f150"
+down_revision = "d8c1f4a26e93"
+branch_labels = None
+depends_on = None
+
+
+def _exec(sql: str) -> None:
+    op.execute(sa.text(sql))
+
+
+def upgrade() -> None:
+    # filled by app.core.staking.pool_series.sample: the first run seeds levels from
+    # user_staking_summary, later runs tail staking_events (consumer "pool_series")
+    _exec(
+        """
+        CREATE TABLE IF NOT EXISTS public.staking_pool_series (
+            pool_id           VARCHAR(36) NOT NULL,
+            bucket_start      TIMESTAMPTZ NOT NULL,
+            tvl               NUMERIC(38, 18) NOT NULL DEFAULT 0,
+            open_positions    INTEGER NOT NULL DEFAULT 0,
+            active_positions  INTEGER NOT NULL DEFAULT 0,
+            apy_bps           INTEGER,
+            staked            NUMERIC(38, 18) NOT NULL DEFAULT 0,
+            withdrawn         NUMERIC(38, 18) NOT NULL DEFAULT 0,
+            rewards_accrued   NUMERIC(38, 18) NOT NULL DEFAULT 0,
+            rewards_claimed   NUMERIC(38, 18) NOT NULL DEFAULT 0,
+            positions_opened  INTEGER NOT NULL DEFAULT 0,
+            positions_closed  INTEGER NOT NULL DEFAULT 0,
+            claims            INTEGER NOT NULL DEFAULT 0,
+            events            INTEGER NOT NULL DEFAULT 0,
+            updated_at        TIMESTAMPTZ NOT NULL DEFAULT timezone('utc', now()),
+            PRIMARY KEY (pool_id, bucket_start)
+        )
+        """
+    )
+
+
+def downgrade() -> None:
+    _exec("DELETE FROM public.staking_event_consumers WHERE name = 'pool_series'")
+    _exec("DROP TABLE IF EXISTS public.staking_pool_series")
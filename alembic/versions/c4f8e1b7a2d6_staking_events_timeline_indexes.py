@@ -0,0 +1,65 @@
+"""staking_events keyset indexes for the event timeline (occurred_at DESC, id DESC)
+
+Revision ID: c4f8e1b7a2d6
+Revises: b6e3a9d4f150
+Create Date: 2026-10-19
+
+"""
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "c4f8e1b7a2d6"
+down_revision = "b6e3a9d4f150"
+branch_labels = None
+depends_on = None
+
+
+def _exec(sql: str) -> None:
+    op.execute(sa.text(sql))
+
+
+def _replace_index(name: str, cols: str) -> None:
+    """
+    Build `name` on (cols) next to the existing one and swap them, CONCURRENTLY: writers are
+    never blocked and the old index serves queries until the new one is valid.
+    """
+    tmp = f"{name}_new"
+    # an interrupted run can leave an INVALID tmp index behind
+    _exec(f"DROP INDEX CONCURRENTLY IF EXISTS public.{tmp}")
+    _exec(f"CREATE INDEX CONCURRENTLY {tmp} ON public.staking_events ({cols})")
+    _exec(f"DROP INDEX CONCURRENTLY IF EXISTS public.{name}")
+    _exec(f"ALTER INDEX public.{tmp} RENAME TO {name}")
+
+
+def upgrade() -> None:
+    # CONCURRENTLY: staking_events takes every accrual / claim / stake, don't block writers
+    with op.get_context().autocommit_block():
+        # per-user and per-position pages: one ordered range scan each, with id as tiebreaker
+        _replace_index("ix_staking_events_user_time", "user_telegram_id, occurred_at DESC, id DESC")
+        _replace_index("ix_staking_events_position_time", "position_id, occurred_at DESC, id DESC")
+        # type-filtered pages: one range per (user, type), merged in order
+        _exec(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_staking_events_user_type_time "
+            "ON public.staking_events (user_telegram_id, event_type, occurred_at DESC, id DESC)"
+        )
+        # prefixes of the composites above; dropping them keeps the per-insert index count flat
+        _exec("DROP INDEX CONCURRENTLY IF EXISTS public.ix_staking_events_user_telegram_id")
+        _exec("DROP INDEX CONCURRENTLY IF EXISTS public.ix_staking_events_position_id")
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        _exec(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_staking_events_position_id "
+            "ON public.staking_events (position_id)"
+        )
+        _exec(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_staking_events_user_telegram_id "
+            "ON public.staking_events (user_telegram_id)"
+        )
+        _exec("DROP INDEX CONCURRENTLY IF EXISTS public.ix_staking_events_user_type_time")
+        _replace_index("ix_staking_events_position_time", "position_id, occurred_at")
+        _replace_index("ix_staking_events_user_time", "user_telegram_id, occurred_at")
@@ -0,0 +1,42 @@
+"""staking_accrual_runs history columns (trigger, totals, duration)
+
+Revision ID: c7e2b9d41f06
+Revises: a81d3c6e52f0
+Create Date: 2026-10-19
+
+"""
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "c7e2b9d41f06"
+down_revision = "a81d3c6e52f0"
+branch_labels = None
+depends_on = None
+
+
+def _exec(sql: str) -> None:
+    op.execute(sa.text(sql))
+
+
+def upgrade() -> None:
+    _exec("ALTER TABLE public.staking_accrual_runs ADD COLUMN IF NOT EXISTS trigger VARCHAR(16) NOT NULL DEFAULT 'cli'")
+    _exec("ALTER TABLE public.staking_accrual_runs ADD COLUMN IF NOT EXISTS positions_total INTEGER")
+    _exec("ALTER TABLE public.staking_accrual_runs ADD COLUMN IF NOT EXISTS index_positions INTEGER NOT NULL DEFAULT 0")
+    _exec("ALTER TABLE public.staking_accrual_runs ADD COLUMN IF NOT EXISTS duration_ms BIGINT NOT NULL DEFAULT 0")
+    _exec("ALTER TABLE public.staking_accrual_runs ADD COLUMN IF NOT EXISTS resumed_at TIMESTAMPTZ")
+    _exec(
+        "CREATE INDEX IF NOT EXISTS ix_staking_accrual_runs_started "
+        "ON public.staking_accrual_runs (started_at DESC)"
+    )
+
+
+def downgrade() -> None:
+    _exec("DROP INDEX IF EXISTS public.ix_staking_accrual_runs_started")
+    _exec("ALTER TABLE public.staking_accrual_runs DROP COLUMN IF EXISTS resumed_at")
+    _exec("ALTER TABLE public.staking_accrual_runs DROP COLUMN IF EXISTS duration_ms")
+    _exec("ALTER TABLE public.staking_accrual_runs DROP COLUMN IF EXISTS index_positions")
+    _exec("ALTER TABLE public.staking_accrual_runs DROP COLUMN IF EXISTS positions_total")
+    _exec("ALTER TABLE public.staking_accrual_runs DROP COLUMN IF EXISTS trigger")
@@ -0,0 +1,69 @@
+"""user_staking_summary (maintained per-user, per-pool position aggregates)
+
+Revision ID: d8c1f4a26e93
+Revises: a3d5e7c19b42
+Create Date: 2026-10-19
+
+"""
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "d8c1f4a26e93"
+down_revision = "a3d5e7c19b42"
+branch_labels = None
+depends_on = None
+
+
+def _exec(sql: str) -> None:
+    op.execute(sa.text(sql))
+
+
+def upgrade() -> None:
+    _exec(
+        """
+        CREATE TABLE IF NOT EXISTS public.user_staking_summary (
+            user_telegram_id     BIGINT NOT NULL,
+            pool_id              VARCHAR(36) NOT NULL,
+            positions_count      INTEGER NOT NULL DEFAULT 0,
+            created_count        INTEGER NOT NULL DEFAULT 0,
+            active_count         INTEGER NOT NULL DEFAULT 0,
+            completed_count      INTEGER NOT NULL DEFAULT 0,
+            withdrawn_count      INTEGER NOT NULL DEFAULT 0,
+            cancelled_count      INTEGER NOT NULL DEFAULT 0,
+            principal_staked     NUMERIC(38, 18) NOT NULL DEFAULT 0,
+            principal_total      NUMERIC(38, 18) NOT NULL DEFAULT 0,
+            total_reward_accrued NUMERIC(38, 18) NOT NULL DEFAULT 0,
+            total_reward_claimed NUMERIC(38, 18) NOT NULL DEFAULT 0,
+            updated_at           TIMESTAMPTZ NOT NULL DEFAULT timezone('utc', now()),
+            PRIMARY KEY (user_telegram_id, pool_id)
+        )
+        """
+    )
+    # writes that race the backfill are caught by tools/verify_staking_summary.py --fix
+    _exec(
+        """
+        INSERT INTO public.user_staking_summary (
+            user_telegram_id, pool_id, positions_count,
+            created_count, active_count, completed_count, withdrawn_count, cancelled_count,
+            principal_staked, principal_total, total_reward_accrued, total_reward_claimed
+        )
+        SELECT user_telegram_id, pool_id, count(*),
+               count(*) FILTER (WHERE state = 'CREATED'),
+               count(*) FILTER (WHERE state = 'ACTIVE'),
+               count(*) FILTER (WHERE state = 'COMPLETED'),
+               count(*) FILTER (WHERE state = 'WITHDRAWN'),
+               count(*) FILTER (WHERE state = 'CANCELLED'),
+               COALESCE(sum(principal_amount) FILTER (WHERE state IN ('CREATED', 'ACTIVE', 'COMPLETED')), 0),
+               sum(principal_amount), sum(total_reward_accrued), sum(total_reward_claimed)
+        FROM public.staking_positions
+        GROUP BY user_telegram_id, pool_id
+        ON CONFLICT (user_telegram_id, pool_id) DO NOTHING
+        """
+    )
+
+
+def downgrade() -> None:
+    _exec("DROP TABLE IF EXISTS public.user_staking_summary")
@@ -0,0 +1,100 @@
+"""staking_events outbox (seq, tx_id, NOTIFY trigger, consumer offsets)
+
+Revision ID: e4b8d2a7c391
+Revises: c7e2b9d41f06
+Create Date: 2026-10-19
+
+"""
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "e4b8d2a7c391"
+down_revision = "c7e2b9d41f06"
+branch_labels = None
+depends_on = None
+
+
+def _exec(sql: str) -> None:
+    op.execute(sa.text(sql))
+
+
+def upgrade() -> None:
+    # seq: insertion order; tx_id: writing transaction, so a consumer can read only
+    # transactions that can no longer commit behind its cursor
+    _exec("CREATE SEQUENCE IF NOT EXISTS public.staking_events_seq_seq")
+    _exec("ALTER TABLE public.staking_events ADD COLUMN IF NOT EXISTS seq BIGINT")
+    _exec("ALTER TABLE public.staking_events ADD COLUMN IF NOT EXISTS tx_id BIGINT")
+    # existing rows: seq in event time order, one pseudo transaction (0)
+    _exec(
+        """
+        UPDATE public.staking_events e
+        SET seq = o.rn, tx_id = 0
+        FROM (
+            SELECT id, row_number() OVER (ORDER BY occurred_at, id) AS rn
+            FROM public.staking_events
+            WHERE seq IS NULL
+        ) o
+        WHERE o.id = e.id
+        """
+    )
+    _exec(
+        "SELECT setval('public.staking_events_seq_seq', "
+        "GREATEST((SELECT COALESCE(max(seq), 0) FROM public.staking_events), 1), "
+        "(SELECT max(seq) IS NOT NULL FROM public.staking_events))"
+    )
+    _exec("ALTER TABLE public.staking_events ALTER COLUMN seq SET DEFAULT nextval('public.staking_events_seq_seq')")
+    _exec("ALTER TABLE public.staking_events ALTER COLUMN tx_id SET DEFAULT txid_current()")
+    _exec("ALTER TABLE public.staking_events ALTER COLUMN seq SET NOT NULL")
+    _exec("ALTER TABLE public.staking_events ALTER COLUMN tx_id SET NOT NULL")
+    _exec("ALTER SEQUENCE public.staking_events_seq_seq OWNED BY public.staking_events.seq")
+    _exec("CREATE UNIQUE INDEX IF NOT EXISTS ux_staking_events_seq ON public.staking_events (seq)")
+    _exec("CREATE INDEX IF NOT EXISTS ix_staking_events_tx_seq ON public.staking_events (tx_id, seq)")
+
+    # one wake-up per inserting statement (bulk accrual inserts stay one NOTIFY)
+    _exec(
+        """
+        CREATE OR REPLACE FUNCTION public.staking_events_notify() RETURNS trigger
+        LANGUAGE plpgsql AS $$
+        BEGIN
+            PERFORM pg_notify('staking_events', '');
+            RETURN NULL;
+        END
+        $$
+        """
+    )
+    _exec("DROP TRIGGER IF EXISTS trg_staking_events_notify ON public.staking_events")
+    _exec(
+        """
+        CREATE TRIGGER trg_staking_events_notify
+        AFTER INSERT ON public.staking_events
+        FOR EACH STATEMENT EXECUTE FUNCTION public.staking_events_notify()
+        """
+    )
+
+    _exec(
+        """
+        CREATE TABLE IF NOT EXISTS public.staking_event_consumers (
+            name        VARCHAR(64) PRIMARY KEY,
+            last_tx_id  BIGINT NOT NULL DEFAULT 0,
+            last_seq    BIGINT NOT NULL DEFAULT 0,
+            delivered   BIGINT NOT NULL DEFAULT 0,
+            last_error  TEXT,
+            created_at  TIMESTAMPTZ NOT NULL DEFAULT timezone('utc', now()),
+            updated_at  TIMESTAMPTZ NOT NULL DEFAULT timezone('utc', now())
+        )
+        """
+    )
+
+
+def downgrade() -> None:
+    _exec("DROP TABLE IF EXISTS public.staking_event_consumers")
+    _exec("DROP TRIGGER IF EXISTS trg_staking_events_notify ON public.staking_events")
+    _exec("DROP FUNCTION IF EXISTS public.staking_events_notify()")
+    _exec("DROP INDEX IF EXISTS public.ix_staking_events_tx_seq")
+    _exec("DROP INDEX IF EXISTS public.ux_staking_events_seq")
+    _exec("ALTER TABLE public.staking_events DROP COLUMN IF EXISTS tx_id")
+    _exec("ALTER TABLE public.staking_events DROP COLUMN IF EXISTS seq")
+    _exec("DROP SEQUENCE IF EXISTS public.staking_events_seq_seq")
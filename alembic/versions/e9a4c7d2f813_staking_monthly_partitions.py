@@ -0,0 +1,196 @@
+"""staking_events / staking_rewards range-partitioned by month
+
+Revision ID: e9a4c7d2f813
+Revises: c4f8e1b7a2d6
+Create Date: 2026-10-19
+
+"""
+from __future__ import annotations
+
+from datetime import datetime, timezone
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "e9a4c7d2f813"
+down_revision = "c4f8e1b7a2d6"
+branch_labels = None
+depends_on = None
+
+# months created after the current one; app.core.staking.partitions keeps this rolling
+AHEAD_MONTHS = 3
+
+# table -> partition key
+TABLES = {"staking_events": "occurred_at", "staking_rewards": "created_at"}
+
+# built after the copy, on the parent (cascading to every partition)
+PARTITIONED_INDEXES = {
+    "staking_events": [
+        "ALTER TABLE public.staking_events ADD CONSTRAINT staking_events_pkey PRIMARY KEY (id, occurred_at)",
+        "CREATE INDEX ix_staking_events_request_id ON public.staking_events (request_id) "
+        "WHERE request_id IS NOT NULL",
+        "CREATE INDEX ix_staking_events_tx_seq ON public.staking_events (tx_id, seq)",
+        "CREATE INDEX ix_staking_events_event_type ON public.staking_events (event_type)",
+        "CREATE INDEX ix_staking_events_occurred_at ON public.staking_events (occurred_at)",
+        "CREATE INDEX ix_staking_events_pool_id ON public.staking_events (pool_id)",
+        "CREATE INDEX ix_staking_events_position_time "
+        "ON public.staking_events (position_id, occurred_at DESC, id DESC)",
+        "CREATE INDEX ix_staking_events_user_time "
+        "ON public.staking_events (user_telegram_id, occurred_at DESC, id DESC)",
+        "CREATE INDEX ix_staking_events_user_type_time "
+        "ON public.staking_events (user_telegram_id, event_type, occurred_at DESC, id DESC)",
+    ],
+    "staking_rewards": [
+        "ALTER TABLE public.staking_rewards ADD CONSTRAINT staking_rewards_pkey PRIMARY KEY (id, created_at)",
+        "ALTER TABLE public.staking_rewards ADD CONSTRAINT staking_rewards_position_id_fkey "
+        "FOREIGN KEY (position_id) REFERENCES public.staking_positions (id) ON DELETE CASCADE",
+        "CREATE INDEX ix_staking_rewards_position_id ON public.staking_rewards (position_id)",
+        "CREATE INDEX ix_staking_rewards_reward_type ON public.staking_rewards (reward_type)",
+        "CREATE INDEX ix_staking_rewards_period_end ON public.staking_rewards (period_end)",
+    ],
+}
+
+# the pre-partitioning layout, for downgrade
+PLAIN_INDEXES = {
+    "staking_events": [
+        "ALTER TABLE public.staking_events ADD CONSTRAINT staking_events_pkey PRIMARY KEY (id)",
+        "ALTER TABLE public.staking_events ADD CONSTRAINT uq_staking_events_request_id UNIQUE (request_id)",
+        "CREATE UNIQUE INDEX ux_staking_events_seq ON public.staking_events (seq)",
+        "CREATE INDEX ix_staking_events_tx_seq ON public.staking_events (tx_id, seq)",
+        "CREATE INDEX ix_staking_events_event_type ON public.staking_events (event_type)",
+        "CREATE INDEX ix_staking_events_occurred_at ON public.staking_events (occurred_at)",
+        "CREATE INDEX ix_staking_events_pool_id ON public.staking_events (pool_id)",
+        "CREATE INDEX ix_staking_events_position_time "
+        "ON public.staking_events (position_id, occurred_at DESC, id DESC)",
+        "CREATE INDEX ix_staking_events_user_time "
+        "ON public.staking_events (user_telegram_id, occurred_at DESC, id DESC)",
+        "CREATE INDEX ix_staking_events_user_type_time "
+        "ON public.staking_events (user_telegram_id, event_type, occurred_at DESC, id DESC)",
+    ],
+    "staking_rewards": [
+        "ALTER TABLE public.staking_rewards ADD CONSTRAINT staking_rewards_pkey PRIMARY KEY (id)",
+        "ALTER TABLE public.staking_rewards ADD CONSTRAINT staking_rewards_position_id_fkey "
+        "FOREIGN KEY (position_id) REFERENCES public.staking_positions (id) ON DELETE CASCADE",
+        "CREATE INDEX ix_staking_rewards_position_id ON public.staking_rewards (position_id)",
+        "CREATE INDEX ix_staking_rewards_reward_type ON public.staking_rewards (reward_type)",
+        "CREATE INDEX ix_staking_rewards_period_end ON public.staking_rewards (period_end)",
+    ],
+}
+
+
+def _exec(sql: str) -> None:
+    op.execute(sa.text(sql))
+
+
+def _month_start(at: datetime) -> datetime:
+    at = at.astimezone(timezone.utc)
+    return datetime(at.year, at.month, 1, tzinfo=timezone.utc)
+
+
+def _add_months(month: datetime, n: int) -> datetime:
+    i = month.year * 12 + month.month - 1 + n
+    return datetime(i // 12, i % 12 + 1, 1, tzinfo=timezone.utc)
+
+
+def _rebuild(table: str, partition_key: str | None) -> None:
+    """
+    Move `table` into a fresh table with the same columns, defaults and CHECKs, partitioned
+    by month on partition_key (or plain when None). Indexes are built after the copy.
+    """
+    old = f"{table}_old"
+    _exec(f"ALTER TABLE public.{table} RENAME TO {old}")
+    if table == "staking_events":
+        # owned by the old column, it would go with the old table
+        _exec("ALTER SEQUENCE public.staking_events_seq_seq OWNED BY NONE")
+    _exec(
+        f"CREATE TABLE public.{table} (LIKE public.{old} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"
+        + (f" PARTITION BY RANGE ({partition_key})" if partition_key else "")
+    )
+
+    if partition_key:
+        bind = op.get_bind()
+        lo, hi = bind.execute(sa.text(f"SELECT min({partition_key}), max({partition_key}) FROM public.{old}")).one()
+        now = datetime.now(timezone.utc)
+        month = _month_start(min(lo, now) if lo else now)
+        last = _add_months(_month_start(now), AHEAD_MONTHS + 1)
+        if hi is not None:
+            last = max(last, _add_months(_month_start(hi), 1))
+        while month < last:
+            upper = _add_months(month, 1)
+            _exec(
+                f"CREATE TABLE public.{table}_p{month:%Y%m} PARTITION OF public.{table} "
+                f"FOR VALUES FROM ('{month.isoformat()}') TO ('{upper.isoformat()}')"
+            )
+            month = upper
+
+    _exec(f"INSERT INTO public.{table} SELECT * FROM public.{old}")
+    if table == "staking_events" and partition_key:
+        _exec(
+            """
+            INSERT INTO public.staking_event_requests (request_id, event_id, occurred_at)
+            SELECT request_id, id, occurred_at FROM public.staking_events_old
+            WHERE request_id IS NOT NULL
+            """
+        )
+    _exec(f"DROP TABLE public.{old}")
+
+    for sql in (PARTITIONED_INDEXES if partition_key else PLAIN_INDEXES)[table]:
+        _exec(sql)
+    if table == "staking_events":
+        _exec("ALTER SEQUENCE public.staking_events_seq_seq OWNED BY public.staking_events.seq")
+        _exec(
+            """
+            CREATE TRIGGER trg_staking_events_notify
+            AFTER INSERT ON public.staking_events
+            FOR EACH STATEMENT EXECUTE FUNCTION public.staking_events_notify()
+            """
+        )
+    _exec(f"ANALYZE public.{table}")
+
+
+def upgrade() -> None:
+    # request_id can't be unique across partitions (the key would have to include
+    # occurred_at): the keys live here instead, one row per event that carries one
+    _exec(
+        """
+        CREATE TABLE IF NOT EXISTS public.staking_event_requests (
+            request_id   VARCHAR(36) PRIMARY KEY,
+            event_id     VARCHAR(36) NOT NULL,
+            occurred_at  TIMESTAMPTZ NOT NULL
+        )
+        """
+    )
+
+    for table, key in TABLES.items():
+        _rebuild(table, key)
+
+    # a duplicate request_id fails the event insert with a unique violation, as before
+    _exec(
+        """
+        CREATE OR REPLACE FUNCTION public.staking_events_request_key() RETURNS trigger
+        LANGUAGE plpgsql AS $$
+        BEGIN
+            INSERT INTO public.staking_event_requests (request_id, event_id, occurred_at)
+            VALUES (NEW.request_id, NEW.id, NEW.occurred_at);
+            RETURN NEW;
+        END
+        $$
+        """
+    )
+    _exec(
+        """
+        CREATE TRIGGER trg_staking_events_request_key
+        BEFORE INSERT ON public.staking_events
+        FOR EACH ROW WHEN (NEW.request_id IS NOT NULL)
+        EXECUTE FUNCTION public.staking_events_request_key()
+        """
+    )
+
+
+def downgrade() -> None:
+    _exec("DROP TRIGGER IF EXISTS trg_staking_events_request_key ON public.staking_events")
+    _exec("DROP FUNCTION IF EXISTS public.staking_events_request_key()")
+    for table in TABLES:
+        _rebuild(table, None)
+    _exec("DROP TABLE IF EXISTS public.staking_event_requests")
@@ -0,0 +1,64 @@
+"""staking_pools config-change trigger (updated_at bump + NOTIFY for pool caches)
+
+Revision ID: f19c3a6b8e25
+Revises: e4b8d2a7c391
+Create Date: 2026-10-19
+
+"""
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "f19c3a6b8e25"
+down_revision = "e4b8d2a7c391"
+branch_labels = None
+depends_on = None
+
+
+def _exec(sql: str) -> None:
+    op.execute(sa.text(sql))
+
+
+def upgrade() -> None:
+    # reward_index / reward_index_at move on every accrual run and are not config;
+    # only the start of an index (NULL -> set) is announced
+    _exec(
+        """
+        CREATE OR REPLACE FUNCTION public.staking_pools_touch() RETURNS trigger
+        LANGUAGE plpgsql AS $$
+        BEGIN
+            IF TG_OP = 'UPDATE' THEN
+                IF (to_jsonb(NEW) - 'reward_index' - 'reward_index_at' - 'updated_at')
+                   IS DISTINCT FROM
+                   (to_jsonb(OLD) - 'reward_index' - 'reward_index_at' - 'updated_at') THEN
+                    NEW.updated_at := timezone('utc', now());
+                ELSIF NOT (OLD.reward_index_at IS NULL AND NEW.reward_index_at IS NOT NULL) THEN
+                    -- index advance only
+                    RETURN NEW;
+                END IF;
+            END IF;
+            IF TG_OP = 'DELETE' THEN
+                PERFORM pg_notify('staking_pools', OLD.id);
+                RETURN OLD;
+            END IF;
+            PERFORM pg_notify('staking_pools', NEW.id);
+            RETURN NEW;
+        END
+        $$
+        """
+    )
+    _exec("DROP TRIGGER IF EXISTS trg_staking_pools_touch ON public.staking_pools")
+    _exec(
+        """
+        CREATE TRIGGER trg_staking_pools_touch
+        BEFORE INSERT OR UPDATE OR DELETE ON public.staking_pools
+        FOR EACH ROW EXECUTE FUNCTION public.staking_pools_touch()
+        """
+    )
+
+
+def downgrade() -> None:
+    _exec("DROP TRIGGER IF EXISTS trg_staking_pools_touch ON public.staking_pools")
+    _exec("DROP FUNCTION IF EXISTS public.staking_pools_touch()")
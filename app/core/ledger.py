@@ -241,4 +241,18 @@ def get_history(telegram_id: int, limit: int = 10, asset: str = "SLH") -> List[L
         finally:
             cur.close()
     finally:
-        conn.close()
\ No newline at end of file
+        conn.close()
+
+
+def get_bnb_address(telegram_id: int) -> Optional[str]:
+    conn = _connect()
+    try:
+        cur = conn.cursor()
+        try:
+            cur.execute("SELECT bnb_address FROM investors WHERE telegram_id=%s;", (telegram_id,))
+            row = cur.fetchone()
+            return str(row[0]) if row and row[0] else None
+        finally:
+            cur.close()
+    finally:
+        conn.close()
@@ -0,0 +1,627 @@
+from __future__ import annotations
+
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Callable, Optional
+
+import multiprocessing
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import Session
+
+from app.core.staking.fixed_point import accrue_units_batch, from_units, to_units
+from app.core.staking.service import accrue_index_positions
+from app.core.staking.state import assert_transition
+from app.core.staking.summary import SummaryDeltas
+from app.models_staking import StakingPositionState
+
+# Chunked, restartable accrual for all ACTIVE positions.
+#
+# A run pins `as_of` once and persists it in staking_accrual_runs. Each chunk is a short
+# transaction: lock the next `chunk_size` due positions after the checkpoint (keyset on id),
+# accrue them up to LEAST(as_of, matures_at, pool.ends_at), write rewards/events, and move
+# the checkpoint in the same commit. Positions matured by as_of also move to COMPLETED in that
+# chunk (POSITION_COMPLETED event, summary transition), including ones with nothing left to
+# accrue. A crash loses at most the uncommitted chunk; on resume already-accrued positions
+# have last_accrual_at = period end (and matured ones are COMPLETED), so they are no longer due.
+
+LOCK_ID = 912345678
+DEFAULT_CHUNK_SIZE = 1000
+
+_DUE_CHUNK = """
+    SELECT p.id, p.user_telegram_id, p.pool_id, p.principal_amount, p.state, p.matures_at, pool.apy_bps,
+           COALESCE(p.last_accrual_at, p.activated_at) AS period_start,
+           GREATEST(COALESCE(p.last_accrual_at, p.activated_at),
+                    LEAST(CAST(:as_of AS timestamptz), p.matures_at, pool.ends_at)) AS period_end,
+           COALESCE(p.matures_at <= CAST(:as_of AS timestamptz), false) AS completes
+    FROM staking_positions p
+    JOIN staking_pools pool ON pool.id = p.pool_id
+    WHERE p.state = 'ACTIVE'
+      AND p.reward_index_snapshot IS NULL
+      {keyset}
+      AND (COALESCE(p.last_accrual_at, p.activated_at) < LEAST(CAST(:as_of AS timestamptz), p.matures_at, pool.ends_at)
+           OR p.matures_at <= CAST(:as_of AS timestamptz))
+    ORDER BY p.id
+    LIMIT :limit
+    FOR UPDATE OF p {skip_locked}
+"""
+# serial: resume after the checkpoint
+_DUE_CHUNK_SQL = text(_DUE_CHUNK.format(keyset="AND p.id > :cursor", skip_locked=""))
+# parallel: each worker takes the first due rows nobody else holds; the due predicate is the checkpoint
+_DUE_CHUNK_SKIP_LOCKED_SQL = text(_DUE_CHUNK.format(keyset="", skip_locked="SKIP LOCKED"))
+
+# remaining work after the checkpoint, for progress/ETA (no locks)
+_DUE_COUNT_SQL = text("""
+    SELECT count(*)
+    FROM staking_positions p
+    JOIN staking_pools pool ON pool.id = p.pool_id
+    WHERE p.state = 'ACTIVE'
+      AND p.reward_index_snapshot IS NULL
+      AND p.id > :cursor
+      AND (COALESCE(p.last_accrual_at, p.activated_at) < LEAST(CAST(:as_of AS timestamptz), p.matures_at, pool.ends_at)
+           OR p.matures_at <= CAST(:as_of AS timestamptz))
+""")
+
+TRIGGERS = ("cli", "scheduler", "admin_job")
+
+_UPDATE_POSITIONS_SQL = text("""
+    UPDATE staking_positions p
+    SET last_accrual_at = u.period_end,
+        total_reward_accrued = p.total_reward_accrued + u.amount,
+        state = CASE WHEN u.completes THEN 'COMPLETED' ELSE p.state END,
+        version = p.version + CASE WHEN u.completes THEN 2 ELSE 1 END
+    FROM unnest(CAST(:ids AS varchar[]), CAST(:ends AS timestamptz[]), CAST(:amounts AS numeric[]),
+                CAST(:completes AS boolean[]))
+         AS u(id, period_end, amount, completes)
+    WHERE p.id = u.id
+""")
+
+_INSERT_REWARDS_SQL = text("""
+    INSERT INTO staking_rewards (id, position_id, reward_type, amount, period_start, period_end, meta, created_at)
+    SELECT u.id, u.position_id, 'ACCRUAL', u.amount, u.period_start, u.period_end,
+           jsonb_build_object('apy_bps', u.apy_bps, 'seconds', u.seconds,
+                              'method', 'continuous_seconds_365d', 'run_id', CAST(:run_id AS text)),
+           CAST(:now AS timestamptz)
+    FROM unnest(CAST(:ids AS varchar[]), CAST(:position_ids AS varchar[]), CAST(:amounts AS numeric[]),
+                CAST(:starts AS timestamptz[]), CAST(:ends AS timestamptz[]),
+                CAST(:apys AS integer[]), CAST(:seconds AS bigint[]))
+         AS u(id, position_id, amount, period_start, period_end, apy_bps, seconds)
+""")
+
+_INSERT_EVENTS_SQL = text("""
+    INSERT INTO staking_events (id, event_type, user_telegram_id, pool_id, position_id, occurred_at, amount, details)
+    SELECT u.id, 'REWARD_ACCRUED', u.user_telegram_id, u.pool_id, u.position_id, CAST(:now AS timestamptz), u.amount,
+           jsonb_build_object('reward_id', u.reward_id, 'amount', CAST(u.amount AS text),
+                              'from', u.period_start, 'to', u.period_end)
+    FROM unnest(CAST(:ids AS varchar[]), CAST(:reward_ids AS varchar[]), CAST(:users AS bigint[]),
+                CAST(:pools AS varchar[]), CAST(:position_ids AS varchar[]), CAST(:amounts AS numeric[]),
+                CAST(:starts AS timestamptz[]), CAST(:ends AS timestamptz[]))
+         AS u(id, reward_id, user_telegram_id, pool_id, position_id, amount, period_start, period_end)
+""")
+
+
+_INSERT_COMPLETED_SQL = text("""
+    INSERT INTO staking_events (id, event_type, user_telegram_id, pool_id, position_id, occurred_at, details)
+    SELECT gen_random_uuid(), 'POSITION_COMPLETED', u.user_telegram_id, u.pool_id, u.position_id,
+           CAST(:now AS timestamptz), jsonb_build_object('matures_at', u.matures_at, 'run_id', CAST(:run_id AS text))
+    FROM unnest(CAST(:users AS bigint[]), CAST(:pools AS varchar[]), CAST(:position_ids AS varchar[]),
+                CAST(:matures AS timestamptz[]))
+         AS u(user_telegram_id, pool_id, position_id, matures_at)
+""")
+
+
+def utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def accrue_rows(conn: Connection, rows: list[Any], run_id: Optional[str], now: datetime) -> dict:
+    """
+    Accrue already-locked due rows (id, user_telegram_id, pool_id, principal_amount, state,
+    matures_at, apy_bps, period_start, period_end, completes) and complete the matured ones.
+    At most five set statements (positions, rewards, events, completions, summary)
+    regardless of len(rows).
+    """
+    seconds = [max(int((r.period_end - r.period_start).total_seconds()), 0) for r in rows]
+    units = accrue_units_batch(
+        [to_units(r.principal_amount) for r in rows],
+        [int(r.apy_bps) for r in rows],
+        seconds,
+    )
+    amounts = [from_units(u) for u in units]
+
+    # every due position moves to its period end, even with a zero reward
+    if rows:
+        conn.execute(
+            _UPDATE_POSITIONS_SQL,
+            {
+                "ids": [r.id for r in rows],
+                "ends": [r.period_end for r in rows],
+                "amounts": amounts,
+                "completes": [bool(r.completes) for r in rows],
+            },
+        )
+
+    deltas = SummaryDeltas()
+    paid = [i for i, u in enumerate(units) if u > 0]
+    if paid:
+        reward_ids = [str(uuid.uuid4()) for _ in paid]
+        common = {
+            "now": now,
+            "position_ids": [rows[i].id for i in paid],
+            "amounts": [amounts[i] for i in paid],
+            "starts": [rows[i].period_start for i in paid],
+            "ends": [rows[i].period_end for i in paid],
+        }
+        conn.execute(
+            _INSERT_REWARDS_SQL,
+            {
+                **common,
+                "run_id": run_id,
+                "ids": reward_ids,
+                "apys": [int(rows[i].apy_bps) for i in paid],
+                "seconds": [seconds[i] for i in paid],
+            },
+        )
+        conn.execute(
+            _INSERT_EVENTS_SQL,
+            {
+                **common,
+                "ids": [str(uuid.uuid4()) for _ in paid],
+                "reward_ids": reward_ids,
+                "users": [int(rows[i].user_telegram_id) for i in paid],
+                "pools": [rows[i].pool_id for i in paid],
+            },
+        )
+        for i in paid:
+            deltas.accrued(rows[i].user_telegram_id, rows[i].pool_id, amounts[i])
+
+    done = [r for r in rows if r.completes]
+    if done:
+        conn.execute(
+            _INSERT_COMPLETED_SQL,
+            {
+                "now": now,
+                "run_id": run_id,
+                "users": [int(r.user_telegram_id) for r in done],
+                "pools": [r.pool_id for r in done],
+                "position_ids": [r.id for r in done],
+                "matures": [r.matures_at for r in done],
+            },
+        )
+        for r in done:
+            assert_transition(r.state, StakingPositionState.COMPLETED.value)
+            deltas.transition(
+                r.user_telegram_id, r.pool_id, r.state, StakingPositionState.COMPLETED.value, r.principal_amount
+            )
+    deltas.apply(conn)
+
+    return {
+        "positions": len(rows),
+        "rewarded": len(paid),
+        "completed": len(done),
+        "reward_total": from_units(sum(units[i] for i in paid)),
+        "last_id": rows[-1].id if rows else None,
+    }
+
+
+def _load_run(conn: Connection, run_id: str) -> Optional[dict]:
+    row = conn.execute(
+        text("SELECT * FROM staking_accrual_runs WHERE id = :id"), {"id": run_id}
+    ).mappings().first()
+    return dict(row) if row else None
+
+
+def _due_count(conn: Connection, as_of: datetime, cursor: Optional[str]) -> int:
+    return int(conn.execute(_DUE_COUNT_SQL, {"as_of": as_of, "cursor": cursor or ""}).scalar_one())
+
+
+def start_or_resume_run(
+    conn: Connection,
+    chunk_size: int,
+    now: Optional[datetime] = None,
+    run_id: Optional[str] = None,
+    resume: bool = True,
+    trigger: str = "cli",
+) -> dict:
+    """
+    run_id given: continue that run (must not be COMPLETED).
+    resume=True: continue the newest RUNNING/FAILED run, else start a new one at `now`.
+    Callers hold LOCK_ID, so a RUNNING row found here belongs to a dead process.
+    positions_total is re-estimated on every (re)start: done so far + due after the cursor.
+    """
+    if trigger not in TRIGGERS:
+        raise ValueError(f"Unknown accrual trigger: {trigger}")
+    if run_id:
+        run = _load_run(conn, run_id)
+        if not run:
+            raise ValueError("Accrual run not found")
+        if run["status"] == "COMPLETED":
+            raise ValueError("Accrual run already completed")
+    else:
+        run = None
+        if resume:
+            row = conn.execute(text("""
+                SELECT * FROM staking_accrual_runs
+                WHERE status IN ('RUNNING', 'FAILED')
+                ORDER BY started_at DESC
+                LIMIT 1
+            """)).mappings().first()
+            run = dict(row) if row else None
+
+    if run:
+        total = int(run["positions_done"]) + _due_count(conn, run["as_of"], run["cursor"])
+        conn.execute(
+            text("""
+                UPDATE staking_accrual_runs
+                SET status = 'RUNNING', error = NULL, chunk_size = :chunk_size, positions_total = :total,
+                    resumed_at = timezone('utc', now()), updated_at = timezone('utc', now())
+                WHERE id = :id
+            """),
+            {"id": run["id"], "chunk_size": chunk_size, "total": total},
+        )
+        run.update(status="RUNNING", error=None, chunk_size=chunk_size, positions_total=total, resumed=True)
+        return run
+
+    new_id = str(uuid.uuid4())
+    as_of = now or utcnow()
+    conn.execute(
+        text("""
+            INSERT INTO staking_accrual_runs (id, status, trigger, as_of, chunk_size, positions_total, resumed_at)
+            VALUES (:id, 'RUNNING', :trigger, :as_of, :chunk_size, :total, timezone('utc', now()))
+        """),
+        {
+            "id": new_id,
+            "trigger": trigger,
+            "as_of": as_of,
+            "chunk_size": chunk_size,
+            "total": _due_count(conn, as_of, None),
+        },
+    )
+    run = _load_run(conn, new_id)
+    run["resumed"] = False
+    return run
+
+
+def accrue_next_chunk(engine: Engine, run: dict, skip_locked: bool = False) -> Optional[dict]:
+    """
+    One chunk in its own transaction. None when nothing is left.
+    skip_locked=False: keyset after run["cursor"], which is advanced (serial runs).
+    skip_locked=True: first due rows not locked by another worker; the cursor is left alone.
+    """
+    t0 = time.perf_counter()
+    with engine.begin() as conn:
+        if skip_locked:
+            rows = conn.execute(
+                _DUE_CHUNK_SKIP_LOCKED_SQL,
+                {"as_of": run["as_of"], "limit": int(run["chunk_size"])},
+            ).all()
+        else:
+            rows = conn.execute(
+                _DUE_CHUNK_SQL,
+                {"as_of": run["as_of"], "cursor": run["cursor"] or "", "limit": int(run["chunk_size"])},
+            ).all()
+        if not rows:
+            return None
+
+        stats = accrue_rows(conn, rows, run["id"], utcnow())
+        # last statement of the chunk: parallel workers only queue on this row briefly before commit
+        conn.execute(
+            text("""
+                UPDATE staking_accrual_runs
+                SET cursor = COALESCE(:cursor, cursor),
+                    chunks_done = chunks_done + 1,
+                    positions_done = positions_done + :positions,
+                    rewards_inserted = rewards_inserted + :rewarded,
+                    reward_total = reward_total + :reward_total,
+                    updated_at = timezone('utc', now())
+                WHERE id = :id
+            """),
+            {
+                "id": run["id"],
+                "cursor": None if skip_locked else stats["last_id"],
+                "positions": stats["positions"],
+                "rewarded": stats["rewarded"],
+                "reward_total": stats["reward_total"],
+            },
+        )
+
+    if not skip_locked:
+        run["cursor"] = stats["last_id"]
+    stats["ms"] = round((time.perf_counter() - t0) * 1000, 2)
+    return stats
+
+
+def _accrue_index_positions(engine: Engine, run_id: str, as_of: datetime) -> int:
+    """Index-mode positions are not chunked: advance the pools and materialise matured ones."""
+    with Session(bind=engine) as db:
+        n = len(accrue_index_positions(db, as_of))
+        db.execute(
+            text("UPDATE staking_accrual_runs SET index_positions = index_positions + :n WHERE id = :id"),
+            {"id": run_id, "n": n},
+        )
+        db.commit()
+    return n
+
+
+def _finish_run(
+    engine: Engine, run_id: str, status: str, error: Optional[str] = None, segment_s: float = 0.0
+) -> None:
+    """status RUNNING = paused (max_chunks); the segment's wall time is added either way."""
+    with engine.begin() as conn:
+        conn.execute(
+            text("""
+                UPDATE staking_accrual_runs
+                SET status = :status, error = :error,
+                    finished_at = CASE WHEN :status = 'COMPLETED' THEN timezone('utc', now()) END,
+                    duration_ms = duration_ms + :ms,
+                    resumed_at = NULL,
+                    updated_at = timezone('utc', now())
+                WHERE id = :id
+            """),
+            {"id": run_id, "status": status, "error": error, "ms": int(segment_s * 1000)},
+        )
+
+
+def run_accrual(
+    engine: Engine,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    now: Optional[datetime] = None,
+    run_id: Optional[str] = None,
+    resume: bool = True,
+    max_chunks: Optional[int] = None,
+    on_chunk: Optional[Callable[[int, dict], None]] = None,
+    trigger: str = "cli",
+    on_start: Optional[Callable[[dict], None]] = None,
+    should_stop: Optional[Callable[[], bool]] = None,
+) -> dict:
+    """
+    Serial chunked accrual under the LOCK_ID advisory lock (held on its own connection for
+    the whole run; per-chunk transactions are separate). max_chunks stops early and leaves
+    the run RUNNING so a later call resumes it; so does should_stop returning True, checked
+    before each chunk (for shutdown). on_start gets the run row once it exists.
+    """
+    if chunk_size <= 0:
+        raise ValueError("chunk_size must be positive")
+
+    with engine.connect() as lock_conn:
+        locked = bool(lock_conn.execute(text("SELECT pg_try_advisory_lock(:id)"), {"id": LOCK_ID}).scalar())
+        lock_conn.commit()
+        if not locked:
+            return {"ok": False, "skipped": True, "reason": "advisory_lock_busy"}
+
+        try:
+            with engine.begin() as conn:
+                run = start_or_resume_run(conn, chunk_size, now=now, run_id=run_id, resume=resume, trigger=trigger)
+            t0 = time.perf_counter()
+            if on_start:
+                on_start(run)
+
+            chunks: list[dict] = []
+            finished = False
+            try:
+                while max_chunks is None or len(chunks) < max_chunks:
+                    if should_stop is not None and should_stop():
+                        break
+                    stats = accrue_next_chunk(engine, run)
+                    if stats is None:
+                        finished = True
+                        break
+                    chunks.append(stats)
+                    if on_chunk:
+                        on_chunk(len(chunks), stats)
+                if finished:
+                    _accrue_index_positions(engine, run["id"], run["as_of"])
+            except Exception as e:
+                _finish_run(engine, run["id"], "FAILED", f"{type(e).__name__}: {e}"[:2000], time.perf_counter() - t0)
+                raise
+
+            _finish_run(engine, run["id"], "COMPLETED" if finished else "RUNNING", segment_s=time.perf_counter() - t0)
+
+            with engine.connect() as conn:
+                final = _load_run(conn, run["id"]) or run
+        finally:
+            lock_conn.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": LOCK_ID})
+            lock_conn.commit()
+
+    return _summary(final, run["resumed"], chunks)
+
+
+def _summary(final: dict, resumed: bool, chunks: list[dict]) -> dict:
+    total_ms = sum(c["ms"] for c in chunks)
+    return {
+        "ok": True,
+        "skipped": False,
+        "run_id": final["id"],
+        "status": final["status"],
+        "resumed": resumed,
+        "as_of": final["as_of"].isoformat(),
+        "cursor": final["cursor"],
+        "updated_positions": sum(c["positions"] for c in chunks),
+        "inserted_rewards": sum(c["rewarded"] for c in chunks),
+        "inserted_events": sum(c["rewarded"] + c["completed"] for c in chunks),
+        "completed_positions": sum(c["completed"] for c in chunks),
+        "reward_total": str(from_units(sum(to_units(c["reward_total"]) for c in chunks))),
+        "run_positions_done": int(final["positions_done"]),
+        "run_duration_ms": int(final["duration_ms"]),
+        "chunks": [{k: v for k, v in c.items() if k != "reward_total"} for c in chunks],
+        "chunk_ms_max": max((c["ms"] for c in chunks), default=0),
+        "chunk_ms_avg": round(total_ms / len(chunks), 2) if chunks else 0,
+    }
+
+
+def _parallel_worker(db_url: str, engine_kwargs: dict, run: dict, worker: int) -> list[dict]:
+    engine = create_engine(db_url, **engine_kwargs)
+    chunks: list[dict] = []
+    try:
+        while True:
+            stats = accrue_next_chunk(engine, run, skip_locked=True)
+            if stats is None:
+                return chunks
+            stats["worker"] = worker
+            chunks.append(stats)
+    finally:
+        engine.dispose()
+
+
+def run_accrual_parallel(
+    db_url: str,
+    workers: int = 4,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    now: Optional[datetime] = None,
+    run_id: Optional[str] = None,
+    resume: bool = True,
+    engine_kwargs: Optional[dict] = None,
+    trigger: str = "cli",
+) -> dict:
+    """
+    Same run semantics as run_accrual, with `workers` processes claiming disjoint chunks via
+    FOR UPDATE ... SKIP LOCKED. All workers accrue to the run's as_of, so per-position results
+    equal a serial run. The coordinator holds LOCK_ID and sweeps anything a worker left behind.
+    """
+    if chunk_size <= 0:
+        raise ValueError("chunk_size must be positive")
+    if workers <= 0:
+        raise ValueError("workers must be positive")
+    engine_kwargs = engine_kwargs or {}
+    engine = create_engine(db_url, **engine_kwargs)
+
+    try:
+        with engine.connect() as lock_conn:
+            locked = bool(lock_conn.execute(text("SELECT pg_try_advisory_lock(:id)"), {"id": LOCK_ID}).scalar())
+            lock_conn.commit()
+            if not locked:
+                return {"ok": False, "skipped": True, "reason": "advisory_lock_busy"}
+
+            try:
+                with engine.begin() as conn:
+                    run = start_or_resume_run(conn, chunk_size, now=now, run_id=run_id, resume=resume, trigger=trigger)
+
+                job = {k: run[k] for k in ("id", "as_of", "chunk_size", "cursor")}
+                chunks: list[dict] = []
+                t0 = time.perf_counter()
+                try:
+                    # spawn, not fork: children must not inherit the lock connection's socket
+                    ctx = multiprocessing.get_context("spawn")
+                    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as ex:
+                        futures = [ex.submit(_parallel_worker, db_url, engine_kwargs, job, w) for w in range(workers)]
+                        for f in futures:
+                            chunks.extend(f.result())
+                    # a worker can exit while others still hold rows; those are done by now
+                    while (stats := accrue_next_chunk(engine, job, skip_locked=True)) is not None:
+                        stats["worker"] = -1
+                        chunks.append(stats)
+                    elapsed = time.perf_counter() - t0
+                    _accrue_index_positions(engine, run["id"], run["as_of"])
+                except Exception as e:
+                    _finish_run(engine, run["id"], "FAILED", f"{type(e).__name__}: {e}"[:2000], time.perf_counter() - t0)
+                    raise
+
+                _finish_run(engine, run["id"], "COMPLETED", segment_s=time.perf_counter() - t0)
+                with engine.connect() as conn:
+                    final = _load_run(conn, run["id"]) or run
+            finally:
+                lock_conn.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": LOCK_ID})
+                lock_conn.commit()
+    finally:
+        engine.dispose()
+
+    out = _summary(final, run["resumed"], chunks)
+    out["workers"] = workers
+    out["elapsed_s"] = round(elapsed, 3)
+    out["positions_per_s"] = round(out["updated_positions"] / elapsed, 1) if elapsed > 0 else None
+    ids = sorted({c["worker"] for c in chunks})
+    out["per_worker"] = {w: sum(c["positions"] for c in chunks if c["worker"] == w) for w in ids}
+    # elapsed_s includes process start-up; this is the longest time any worker spent in chunks
+    out["worker_busy_s_max"] = round(max((sum(c["ms"] for c in chunks if c["worker"] == w) for w in ids), default=0) / 1000, 3)
+    return out
+
+
+_LOCK_HELD_SQL = text("""
+    SELECT EXISTS (
+        SELECT 1 FROM pg_locks
+        WHERE locktype = 'advisory' AND granted
+          AND database = (SELECT oid FROM pg_database WHERE datname = current_database())
+          AND classid = 0 AND objid = :id AND objsubid = 1
+    )
+""")
+
+
+def lock_held(conn: Connection) -> bool:
+    """Whether some session holds LOCK_ID, i.e. a run is really being worked on right now."""
+    return bool(conn.execute(_LOCK_HELD_SQL, {"id": LOCK_ID}).scalar())
+
+
+def run_progress(run: dict, now: Optional[datetime] = None, locked: Optional[bool] = None) -> dict:
+    """
+    Progress view of a staking_accrual_runs row. elapsed = finished segments + the current one;
+    the ETA assumes the remaining positions go at the run's average rate so far.
+    `locked` is lock_held(): a RUNNING row with an open segment but nobody holding LOCK_ID was
+    left by a process that died mid-run; it is reported as stalled, not in progress (the next
+    run resumes it). None skips that check.
+    """
+    now = now or utcnow()
+    elapsed = int(run["duration_ms"]) / 1000
+    segment_open = run["status"] == "RUNNING" and run["resumed_at"] is not None
+    stalled = segment_open and locked is False
+    live = segment_open and not stalled
+    if live:
+        elapsed += max((now - run["resumed_at"]).total_seconds(), 0.0)
+
+    done = int(run["positions_done"])
+    total = run["positions_total"]
+    remaining = max(int(total) - done, 0) if total is not None else None
+    rate = done / elapsed if elapsed > 0 and done else None
+    if run["status"] == "COMPLETED":
+        eta = 0.0
+    elif live and remaining is not None and rate:
+        eta = round(remaining / rate, 1)
+    else:
+        eta = None
+
+    def _iso(x: Optional[datetime]) -> Optional[str]:
+        return x.isoformat() if x else None
+
+    return {
+        "job_id": run["id"],
+        "status": run["status"],
+        "trigger": run["trigger"],
+        "in_progress": live,
+        "stalled": stalled,
+        "as_of": _iso(run["as_of"]),
+        "chunk_size": int(run["chunk_size"]),
+        "positions_total": total,
+        "positions_done": done,
+        "percent": round(100.0 * done / total, 1) if total else (100.0 if run["status"] == "COMPLETED" else None),
+        "rewards_written": int(run["rewards_inserted"]),
+        "reward_total": str(run["reward_total"]),
+        "index_positions": int(run["index_positions"]),
+        "chunks_done": int(run["chunks_done"]),
+        "elapsed_s": round(elapsed, 3),
+        "positions_per_s": round(rate, 1) if rate else None,
+        "eta_s": eta,
+        "error": run["error"],
+        "started_at": _iso(run["started_at"]),
+        "updated_at": _iso(run["updated_at"]),
+        "finished_at": _iso(run["finished_at"]),
+    }
+
+
+def get_run(conn: Connection, run_id: str) -> Optional[dict]:
+    return _load_run(conn, run_id)
+
+
+def list_runs(conn: Connection, limit: int = 20, before: Optional[datetime] = None) -> list[dict]:
+    """Run history, newest first."""
+    rows = conn.execute(
+        text("""
+            SELECT * FROM staking_accrual_runs
+            WHERE (CAST(:before AS timestamptz) IS NULL OR started_at < CAST(:before AS timestamptz))
+            ORDER BY started_at DESC
+            LIMIT :limit
+        """),
+        {"before": before, "limit": int(limit)},
+    ).mappings().all()
+    return [dict(r) for r in rows]
@@ -2,12 +2,11 @@ from __future__ import annotations
 
 from dataclasses import dataclass
 from datetime import datetime
-from decimal import Decimal, ROUND_DOWN, getcontext
+from decimal import Decimal
 
-getcontext().prec = 60
+from app.core.staking.fixed_point import Q18, SECONDS_PER_YEAR, accrue_units, from_units, to_units
 
-SECONDS_IN_YEAR = Decimal(365 * 24 * 60 * 60)
-Q18 = Decimal("0.000000000000000001")
+SECONDS_IN_YEAR = Decimal(SECONDS_PER_YEAR)
 
 
 @dataclass(frozen=True)
@@ -16,26 +15,16 @@ class RewardCalcResult:
     seconds: int
 
 
-def _quantize_18(x: Decimal) -> Decimal:
-    if x <= 0:
-        return Decimal("0").quantize(Q18)
-    return x.quantize(Q18, rounding=ROUND_DOWN)
-
-
 def calc_reward(principal: Decimal, apy_bps: int, start: datetime, end: datetime) -> RewardCalcResult:
     """
     Deterministic accrual:
     reward = principal * (apy_bps/10000) * (delta_seconds / seconds_in_year)
     - Uses constant 365d year for determinism.
-    - Rounds DOWN to 18 decimals to avoid drift.
+    - Whole seconds only; rounds DOWN to 18 decimals, computed exactly in integer 1e-18 units.
     """
     if end <= start:
         return RewardCalcResult(amount=Decimal("0").quantize(Q18), seconds=0)
 
     delta_seconds = int((end - start).total_seconds())
-    if delta_seconds <= 0 or principal <= 0 or apy_bps <= 0:
-        return RewardCalcResult(amount=Decimal("0").quantize(Q18), seconds=max(delta_seconds, 0))
-
-    rate = (Decimal(apy_bps) / Decimal(10000))
-    amount = Decimal(principal) * rate * (Decimal(delta_seconds) / SECONDS_IN_YEAR)
-    return RewardCalcResult(amount=_quantize_18(amount), seconds=delta_seconds)
\ No newline at end of file
+    units = accrue_units(to_units(principal), int(apy_bps), delta_seconds)
+    return RewardCalcResult(amount=from_units(units), seconds=max(delta_seconds, 0))
@@ -0,0 +1,221 @@
+from __future__ import annotations
+
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+# Rollup compaction of staking_rewards ACCRUAL rows.
+#
+# Closed ACCRUAL rows of one position that fall in the same UTC day (or month) bucket are
+# replaced by a single ACCRUAL row with the summed amount, min(period_start)/max(period_end),
+# and meta {"rollup": "day"|"month", "rows", "source_rows", "seconds", "gaps", "audit_sha256"}.
+# The audit hash is sha256 over the source rows (id|amount|start epoch|end epoch|child hash)
+# in period order, so a backup of the raw rows can be checked against the rollup.
+# Month rollups consume day rollups (and any raw rows left), chaining their hashes.
+# meta.source_ids lists the ids of the raw rows a rollup replaced (a month rollup carries
+# over its day rollups' lists), so the reward_id that REWARD_ACCRUED events keep in their
+# details (app.core.staking.accrual_runner) stays resolvable: resolve_reward_id.
+#
+# Retention: raw rows stay for STAKING_REWARDS_RAW_DAYS, day rollups become month rollups
+# after STAKING_REWARDS_MONTHLY_AFTER_DAYS. Only buckets that end before the cutoff are touched.
+# staking_rewards is partitioned by month on created_at: a rollup takes the newest created_at
+# of its sources, so it lands in the partition they came from (and is detached with it), and
+# source rows are deleted by their full key (id, created_at), which prunes to one partition.
+
+BUCKETS = {"day": "1 day", "month": "1 month"}
+# which rows a bucket consumes
+_SOURCES = {"day": "r.meta->>'rollup' IS NULL", "month": "COALESCE(r.meta->>'rollup', '') IN ('', 'day')"}
+
+DEFAULT_BATCH_POSITIONS = 500
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name) or default)
+    except Exception:
+        return default
+
+
+RAW_DAYS = _env_int("STAKING_REWARDS_RAW_DAYS", 30)
+MONTHLY_AFTER_DAYS = _env_int("STAKING_REWARDS_MONTHLY_AFTER_DAYS", 180)
+
+
+_COMPACT_SQL = """
+    WITH pos AS (
+        SELECT id FROM staking_positions
+        WHERE id > :after
+        ORDER BY id
+        LIMIT :batch
+    ),
+    locked AS (
+        SELECT r.id, r.created_at, r.position_id, r.amount, r.period_start, r.period_end, r.meta
+        FROM staking_rewards r
+        JOIN pos ON pos.id = r.position_id
+        WHERE r.reward_type = 'ACCRUAL'
+          AND r.period_start IS NOT NULL
+          AND r.period_end IS NOT NULL
+          AND r.period_end <= CAST(:cutoff AS timestamptz)
+          AND {source}
+          AND date_trunc('{bucket}', r.period_start AT TIME ZONE 'UTC') + interval '{step}'
+              <= CAST(:cutoff AS timestamptz) AT TIME ZONE 'UTC'
+        FOR UPDATE OF r
+    ),
+    src AS (
+        SELECT l.*,
+               date_trunc('{bucket}', l.period_start AT TIME ZONE 'UTC') AS bucket,
+               lag(l.period_end) OVER (
+                   PARTITION BY l.position_id, date_trunc('{bucket}', l.period_start AT TIME ZONE 'UTC')
+                   ORDER BY l.period_start, l.id
+               ) AS prev_end,
+               count(*) OVER (
+                   PARTITION BY l.position_id, date_trunc('{bucket}', l.period_start AT TIME ZONE 'UTC')
+               ) AS bucket_rows
+        FROM locked l
+    ),
+    grp AS (
+        SELECT position_id, bucket,
+               count(*) AS source_rows,
+               sum(COALESCE(CAST(meta->>'rows' AS bigint), 1)) AS n_rows,
+               sum(COALESCE(CAST(meta->>'seconds' AS bigint), 0)) AS seconds,
+               count(*) FILTER (WHERE prev_end IS NOT NULL AND prev_end <> period_start)
+                   + sum(COALESCE(CAST(meta->>'gaps' AS bigint), 0)) AS gaps,
+               sum(amount) AS amount,
+               min(period_start) AS period_start,
+               max(period_end) AS period_end,
+               max(created_at) AS created_at,
+               encode(sha256(convert_to(string_agg(
+                   id || '|' || amount::text
+                   || '|' || extract(epoch FROM period_start)::text
+                   || '|' || extract(epoch FROM period_end)::text
+                   || '|' || COALESCE(meta->>'audit_sha256', ''),
+                   E'\\n' ORDER BY period_start, id), 'UTF8')), 'hex') AS audit
+        FROM src
+        WHERE bucket_rows > 1
+        GROUP BY position_id, bucket
+    ),
+    -- raw ids behind each source row: its own, or the list a consumed rollup carries
+    ids AS (
+        SELECT s.position_id, s.bucket, x.id, s.period_start, x.n
+        FROM src s
+        CROSS JOIN LATERAL (
+            SELECT e.id, e.n FROM jsonb_array_elements_text(s.meta->'source_ids') WITH ORDINALITY AS e(id, n)
+            WHERE s.meta->'source_ids' IS NOT NULL
+            UNION ALL
+            SELECT s.id, 1 WHERE s.meta->'source_ids' IS NULL
+        ) x
+        WHERE s.bucket_rows > 1
+    ),
+    ins AS (
+        INSERT INTO staking_rewards (id, position_id, reward_type, amount, period_start, period_end, meta, created_at)
+        SELECT gen_random_uuid(), g.position_id, 'ACCRUAL', g.amount, g.period_start, g.period_end,
+               jsonb_build_object(
+                   'method', 'rollup',
+                   'rollup', '{bucket}',
+                   'bucket_start', to_char(g.bucket, 'YYYY-MM-DD'),
+                   'rows', g.n_rows,
+                   'source_rows', g.source_rows,
+                   'seconds', g.seconds,
+                   'gaps', g.gaps,
+                   'audit_sha256', g.audit,
+                   'source_ids', (
+                       SELECT jsonb_agg(i.id ORDER BY i.period_start, i.n, i.id)
+                       FROM ids i
+                       WHERE i.position_id = g.position_id AND i.bucket = g.bucket
+                   )
+               ),
+               g.created_at
+        FROM grp g
+        RETURNING 1
+    ),
+    del AS (
+        DELETE FROM staking_rewards r
+        USING src s
+        WHERE r.id = s.id
+          AND r.created_at = s.created_at
+          AND s.bucket_rows > 1
+        RETURNING 1
+    )
+    SELECT (SELECT max(id) FROM pos) AS last_position_id,
+           (SELECT count(*) FROM ins) AS rollups,
+           (SELECT count(*) FROM del) AS deleted
+"""
+
+_COMPACT = {b: text(_COMPACT_SQL.format(bucket=b, step=step, source=_SOURCES[b])) for b, step in BUCKETS.items()}
+
+
+def compact_batch(db: Session, bucket: str, cutoff: datetime, after: str = "", batch: int = DEFAULT_BATCH_POSITIONS) -> dict:
+    """
+    Roll up one keyset batch of positions (id > after). One statement; commit is the caller's.
+    last_position_id is None when there are no more positions.
+    """
+    if bucket not in BUCKETS:
+        raise ValueError(f"Unknown rollup bucket: {bucket}")
+    row = db.execute(_COMPACT[bucket], {"after": after, "batch": int(batch), "cutoff": cutoff}).mappings().one()
+    return {
+        "last_position_id": row["last_position_id"],
+        "rollups": int(row["rollups"]),
+        "deleted": int(row["deleted"]),
+    }
+
+
+# the row itself while it exists, else the rollup whose source_ids name it
+_RESOLVE_SQL = text("""
+    SELECT id, created_at, reward_type, amount, period_start, period_end, meta->>'rollup' AS rollup
+    FROM staking_rewards
+    WHERE position_id = :position_id
+      AND (id = :reward_id
+           OR (reward_type = 'ACCRUAL' AND meta->'source_ids' @> jsonb_build_array(CAST(:reward_id AS text))))
+    ORDER BY id = :reward_id DESC
+    LIMIT 1
+""")
+
+
+def resolve_reward_id(db: Session, reward_id: str, position_id: str) -> Optional[dict]:
+    """
+    The staking_rewards row that holds reward `reward_id` of `position_id` now: the raw row,
+    or the day / month rollup that replaced it (rollup is None for a raw row). None when
+    neither exists, e.g. a rollup made before source_ids were recorded.
+    """
+    row = db.execute(_RESOLVE_SQL, {"reward_id": reward_id, "position_id": position_id}).mappings().first()
+    return dict(row) if row else None
+
+
+def compact_rewards(
+    session_factory,
+    now: Optional[datetime] = None,
+    raw_days: int = RAW_DAYS,
+    monthly_after_days: int = MONTHLY_AFTER_DAYS,
+    batch: int = DEFAULT_BATCH_POSITIONS,
+) -> dict:
+    """
+    Apply the retention policy: day rollups for rows older than raw_days, then month rollups
+    for anything older than monthly_after_days. One short transaction per position batch.
+    monthly_after_days <= 0 disables month rollups.
+    """
+    now = now or datetime.now(timezone.utc)
+    passes = [("day", now - timedelta(days=raw_days))]
+    if monthly_after_days > 0:
+        passes.append(("month", now - timedelta(days=monthly_after_days)))
+
+    out: dict = {}
+    for bucket, cutoff in passes:
+        stats = {"cutoff": cutoff.isoformat(), "batches": 0, "rollups": 0, "deleted": 0}
+        after = ""
+        while True:
+            db = session_factory()
+            try:
+                res = compact_batch(db, bucket, cutoff, after=after, batch=batch)
+                db.commit()
+            finally:
+                db.close()
+            if res["last_position_id"] is None:
+                break
+            after = res["last_position_id"]
+            stats["batches"] += 1
+            stats["rollups"] += res["rollups"]
+            stats["deleted"] += res["deleted"]
+        out[bucket] = stats
+    return out
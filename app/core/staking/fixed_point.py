@@ -0,0 +1,79 @@
+from __future__ import annotations
+
+from decimal import ROUND_DOWN, Context, Decimal
+from typing import Iterable, Sequence
+
+# Fixed-point accrual core.
+# Amounts are integers in 1e-18 units (NUMERIC(38,18) maps 1:1), so
+#   reward_units = floor(principal_units * apy_bps * seconds / (10000 * 365d))
+# is exact: one integer multiply and one floor division, no rounding steps.
+
+SCALE = 18
+UNIT = 10**SCALE
+BPS = 10_000
+SECONDS_PER_YEAR = 365 * 24 * 60 * 60
+DENOMINATOR = BPS * SECONDS_PER_YEAR
+
+# local context for Decimal arithmetic on NUMERIC(38,18) values (never touch the global one)
+DECIMAL_CTX = Context(prec=60)
+_TRUNC_CTX = Context(prec=60, rounding=ROUND_DOWN)
+Q18 = Decimal(1).scaleb(-SCALE)
+
+
+def to_units(x: Decimal | int | str) -> int:
+    """Decimal amount -> integer 1e-18 units. Digits past 18 dp are truncated (ROUND_DOWN)."""
+    d = x if isinstance(x, Decimal) else Decimal(str(x))
+    if not d.is_finite():
+        raise ValueError(f"Not a finite amount: {x!r}")
+    # both steps truncate toward zero, so the composition is exact truncation
+    return int(d.scaleb(SCALE, _TRUNC_CTX))
+
+
+def from_units(u: int) -> Decimal:
+    """Integer 1e-18 units -> Decimal with exponent -18 (exact up to 60 digits)."""
+    return Decimal(u).scaleb(-SCALE, DECIMAL_CTX)
+
+
+def accrue_units(principal_units: int, apy_bps: int, seconds: int) -> int:
+    """Reward in 1e-18 units, floored. Zero for non-positive inputs."""
+    if principal_units <= 0 or apy_bps <= 0 or seconds <= 0:
+        return 0
+    return principal_units * apy_bps * seconds // DENOMINATOR
+
+
+def accrue_index_units(principal_units: int, index_delta: int) -> int:
+    """
+    Reward for a reward-index delta (sum of apy_bps * seconds over the period), floored.
+    accrue_index_units(p, apy_bps * seconds) == accrue_units(p, apy_bps, seconds).
+    """
+    if principal_units <= 0 or index_delta <= 0:
+        return 0
+    return principal_units * index_delta // DENOMINATOR
+
+
+def accrue_units_batch(
+    principal_units: Sequence[int],
+    apy_bps: Sequence[int],
+    seconds: Sequence[int],
+) -> list[int]:
+    """
+    accrue_units over parallel arrays (same length), returned in the same order.
+    Python ints are used on purpose: principal_units * apy_bps * seconds overflows int64.
+    """
+    if not (len(principal_units) == len(apy_bps) == len(seconds)):
+        raise ValueError("principal_units, apy_bps and seconds must have the same length")
+    d = DENOMINATOR
+    return [
+        p * a * s // d if p > 0 and a > 0 and s > 0 else 0
+        for p, a, s in zip(principal_units, apy_bps, seconds)
+    ]
+
+
+def accrue_batch(
+    principals: Iterable[Decimal | int | str],
+    apy_bps: Sequence[int],
+    seconds: Sequence[int],
+) -> list[Decimal]:
+    """Decimal in / Decimal out wrapper around accrue_units_batch."""
+    units = accrue_units_batch([to_units(p) for p in principals], apy_bps, seconds)
+    return [from_units(u) for u in units]
@@ -0,0 +1,351 @@
+from __future__ import annotations
+
+import logging
+import os
+import select
+import threading
+import time
+from collections import defaultdict
+from decimal import Decimal
+from typing import Any, Callable, Iterable, Optional
+
+import httpx
+from sqlalchemy.engine import Engine
+
+# Transactional outbox over staking_events.
+#
+# Events are written in the same transaction as the state change. Each row carries
+# seq (insertion order) and tx_id (txid_current() of the writer). A consumer reads in
+# (tx_id, seq) order and only rows with tx_id < xmin of its snapshot: every transaction
+# below xmin has finished and any later writer gets a larger txid, so nothing can
+# appear behind the cursor. A long-running transaction delays delivery, never loses it.
+#
+# Delivery is at-least-once: the handler runs first, then the offset row
+# (staking_event_consumers) moves. A crash in between redelivers the batch.
+# One process per consumer name is active (session advisory lock); the others wait.
+# An AFTER INSERT statement trigger NOTIFYs CHANNEL; consumers also poll on a timeout.
+
+log = logging.getLogger("staking.outbox")
+
+CHANNEL = "staking_events"
+LOCK_NAMESPACE = 912345680
+
+Handler = Callable[[list[dict]], None]
+
+_FETCH_SQL = """
+    SELECT seq, tx_id, id, event_type, user_telegram_id, pool_id, position_id,
+           occurred_at, amount, details
+    FROM staking_events
+    WHERE (tx_id, seq) > (%(tx_id)s, %(seq)s)
+      AND tx_id < txid_snapshot_xmin(txid_current_snapshot())
+    ORDER BY tx_id, seq
+    LIMIT %(limit)s
+"""
+
+# a new consumer starts at the current safe head, not at the beginning of history
+_HEAD_SQL = """
+    SELECT tx_id, seq FROM staking_events
+    WHERE tx_id < txid_snapshot_xmin(txid_current_snapshot())
+    ORDER BY tx_id DESC, seq DESC
+    LIMIT 1
+"""
+
+_COLUMNS = ("seq", "tx_id", "id", "event_type", "user_telegram_id", "pool_id", "position_id",
+            "occurred_at", "amount", "details")
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name) or default)
+    except Exception:
+        return default
+
+
+def enabled() -> bool:
+    return (os.getenv("STAKING_OUTBOX_CONSUMER") or "").strip().lower() in ("1", "true", "yes", "on")
+
+
+class OutboxConsumer:
+    """
+    Tails staking_events for one named consumer and hands batches to `handler`.
+    Blocking; run it in its own thread (run(stop)) or process.
+    """
+
+    def __init__(
+        self,
+        engine: Engine,
+        name: str,
+        handler: Handler,
+        batch_size: int = 500,
+        poll_interval: float = 5.0,
+        linger: float = 0.5,
+        from_start: bool = False,
+    ) -> None:
+        if batch_size <= 0:
+            raise ValueError("batch_size must be positive")
+        self.engine = engine
+        self.name = name
+        self.handler = handler
+        self.batch_size = int(batch_size)
+        self.poll_interval = float(poll_interval)
+        self.linger = max(float(linger), 0.0)
+        self.from_start = from_start
+
+        self._raw = None  # pooled DB-API connection, kept for the session lock + LISTEN
+        self.is_leader = False
+        self.delivered = 0
+        self.last_error: Optional[str] = None
+
+    # -- connection --
+
+    def _open(self):
+        if self._raw is None:
+            self._raw = self.engine.raw_connection()
+            self._raw.driver_connection.autocommit = True
+            with self._raw.driver_connection.cursor() as cur:
+                cur.execute(f"LISTEN {CHANNEL}")
+        return self._raw.driver_connection
+
+    def close(self) -> None:
+        if self._raw is not None:
+            try:
+                # invalidate: the session holds LISTEN and the advisory lock, don't return it to the pool
+                self._raw.invalidate()
+            except Exception:
+                pass
+        self._raw = None
+        self.is_leader = False
+
+    def _try_lead(self, conn) -> bool:
+        if not self.is_leader:
+            with conn.cursor() as cur:
+                cur.execute("SELECT pg_try_advisory_lock(%s, hashtext(%s))", (LOCK_NAMESPACE, self.name))
+                self.is_leader = bool(cur.fetchone()[0])
+            if self.is_leader:
+                log.info("outbox %s: consuming", self.name)
+        return self.is_leader
+
+    def _wait(self, conn, timeout: float) -> bool:
+        """Block until a NOTIFY or timeout. True when woken by a notification."""
+        if not conn.notifies:
+            ready, _, _ = select.select([conn], [], [], timeout)
+            if ready:
+                conn.poll()
+        woke = bool(conn.notifies)
+        conn.notifies.clear()
+        return woke
+
+    # -- offsets --
+
+    def _load_offset(self, cur) -> tuple[int, int]:
+        cur.execute("SELECT last_tx_id, last_seq FROM staking_event_consumers WHERE name = %s", (self.name,))
+        row = cur.fetchone()
+        if row:
+            return int(row[0]), int(row[1])
+
+        tx_id, seq = 0, 0
+        if not self.from_start:
+            cur.execute(_HEAD_SQL)
+            head = cur.fetchone()
+            if head:
+                tx_id, seq = int(head[0]), int(head[1])
+        cur.execute(
+            """
+            INSERT INTO staking_event_consumers (name, last_tx_id, last_seq)
+            VALUES (%s, %s, %s)
+            ON CONFLICT (name) DO NOTHING
+            """,
+            (self.name, tx_id, seq),
+        )
+        return self._load_offset(cur) if cur.rowcount == 0 else (tx_id, seq)
+
+    # -- consuming --
+
+    def poll_once(self) -> int:
+        """Fetch and handle one batch; returns how many events were handled."""
+        conn = self._open()
+        if not self._try_lead(conn):
+            return 0
+        with conn.cursor() as cur:
+            tx_id, seq = self._load_offset(cur)
+            cur.execute(_FETCH_SQL, {"tx_id": tx_id, "seq": seq, "limit": self.batch_size})
+            events = [dict(zip(_COLUMNS, r)) for r in cur.fetchall()]
+            if not events:
+                return 0
+
+            try:
+                self.handler(events)
+            except Exception as e:
+                self.last_error = f"{type(e).__name__}: {e}"[:2000]
+                cur.execute(
+                    "UPDATE staking_event_consumers SET last_error = %s, updated_at = timezone('utc', now()) "
+                    "WHERE name = %s",
+                    (self.last_error, self.name),
+                )
+                raise
+
+            last = events[-1]
+            cur.execute(
+                """
+                UPDATE staking_event_consumers
+                SET last_tx_id = %s, last_seq = %s, delivered = delivered + %s,
+                    last_error = NULL, updated_at = timezone('utc', now())
+                WHERE name = %s
+                """,
+                (last["tx_id"], last["seq"], len(events), self.name),
+            )
+        self.delivered += len(events)
+        self.last_error = None
+        return len(events)
+
+    def run(self, stop: threading.Event) -> None:
+        backoff = 1.0
+        while not stop.is_set():
+            try:
+                conn = self._open()
+                if not self._try_lead(conn):
+                    stop.wait(self.poll_interval)
+                    continue
+                n = self.poll_once()
+                backoff = 1.0
+                if n >= self.batch_size:
+                    continue  # backlog: next batch right away
+                if self._wait(conn, self.poll_interval) and self.linger:
+                    # let a burst of commits land so the handler sees them in one batch
+                    stop.wait(self.linger)
+            except Exception as e:
+                log.warning("outbox %s: %s (retry in %.0fs)", self.name, str(e)[:200], backoff)
+                # handler errors keep the session (and the lead); a broken connection is reopened
+                if self._raw is None or self._raw.driver_connection.closed:
+                    self.close()
+                stop.wait(backoff)
+                backoff = min(backoff * 2, 60.0)
+        self.close()
+
+
+# -- Telegram notifications --
+
+DEFAULT_NOTIFY_EVENT_TYPES = (
+    "POSITION_ACTIVATED",
+    "REWARD_CLAIMED",
+    "POSITION_COMPLETED",
+    "UNSTAKE_REQUESTED",
+    "POSITION_WITHDRAWN",
+)
+
+_LABELS = {
+    "POSITION_CREATED": "Position created",
+    "POSITION_ACTIVATED": "Staking position activated",
+    "ACCRUAL_RECORDED": "Rewards accrued",
+    "REWARD_ACCRUED": "Rewards accrued",
+    "POSITION_COMPLETED": "Staking position matured",
+    "REWARD_CLAIMED": "Rewards claimed",
+    "UNSTAKE_REQUESTED": "Unstake requested",
+    "POSITION_WITHDRAWN": "Principal withdrawn",
+}
+
+
+def notify_event_types() -> tuple[str, ...]:
+    raw = (os.getenv("STAKING_NOTIFY_EVENT_TYPES") or "").strip()
+    if not raw:
+        return DEFAULT_NOTIFY_EVENT_TYPES
+    return tuple(t.strip().upper() for t in raw.split(",") if t.strip())
+
+
+def format_user_message(events: Iterable[dict]) -> str:
+    """One message for all of a user's events in a batch: a line per event type, amounts summed."""
+    counts: dict[str, int] = defaultdict(int)
+    totals: dict[str, Decimal] = defaultdict(Decimal)
+    order: list[str] = []
+    for ev in events:
+        t = ev["event_type"]
+        if t not in counts:
+            order.append(t)
+        counts[t] += 1
+        if ev.get("amount") is not None:
+            totals[t] += Decimal(ev["amount"])
+
+    lines = ["Staking update"]
+    for t in order:
+        line = _LABELS.get(t, t.replace("_", " ").capitalize())
+        if counts[t] > 1:
+            line += f" x{counts[t]}"
+        if totals[t]:
+            line += f": {totals[t].normalize():f}"
+        lines.append(line)
+    return "\n".join(lines)
+
+
+class TelegramNotifier:
+    """
+    Outbox handler: per-user coalesced Telegram messages through the Bot API.
+    429s are waited out; 400/403 (blocked bot, unknown chat) are dropped; anything else
+    raises so the batch is redelivered (users earlier in the batch may get a repeat).
+    """
+
+    def __init__(
+        self,
+        token: Optional[str] = None,
+        event_types: Optional[Iterable[str]] = None,
+        dry_run: bool = False,
+        max_retries: int = 3,
+    ) -> None:
+        self.token = token or (os.getenv("TELEGRAM_TOKEN") or os.getenv("BOT_TOKEN") or "").strip() or None
+        self.event_types = frozenset(event_types or notify_event_types())
+        self.dry_run = dry_run or not self.token
+        self.max_retries = max_retries
+        self.sent = 0
+        self.dropped = 0
+        self._client: Optional[httpx.Client] = None
+
+    def _send(self, chat_id: int, message: str) -> None:
+        if self.dry_run:
+            log.info("outbox telegram (dry run) chat_id=%s: %s", chat_id, message.replace("\n", " | "))
+            self.sent += 1
+            return
+        if self._client is None:
+            self._client = httpx.Client(timeout=12)
+        url = f"https://api.telegram.org/bot{self.token}/sendMessage"
+        for _ in range(self.max_retries + 1):
+            r = self._client.post(url, json={"chat_id": chat_id, "text": message})
+            if r.status_code == 429:
+                retry_after = 1
+                try:
+                    retry_after = int((r.json().get("parameters") or {}).get("retry_after") or 1)
+                except Exception:
+                    pass
+                time.sleep(min(retry_after, 30))
+                continue
+            if r.status_code in (400, 403):
+                log.info("outbox telegram: dropped chat_id=%s status=%s", chat_id, r.status_code)
+                self.dropped += 1
+                return
+            r.raise_for_status()
+            self.sent += 1
+            return
+        raise RuntimeError(f"telegram rate limited for chat_id={chat_id}")
+
+    def __call__(self, events: list[dict]) -> None:
+        by_user: dict[int, list[dict]] = defaultdict(list)
+        for ev in events:
+            if ev["event_type"] in self.event_types and ev.get("user_telegram_id"):
+                by_user[int(ev["user_telegram_id"])].append(ev)
+        for chat_id, evs in by_user.items():
+            self._send(chat_id, format_user_message(evs))
+
+
+def start_consumer_thread(consumer: OutboxConsumer) -> tuple[threading.Thread, threading.Event]:
+    stop = threading.Event()
+    t = threading.Thread(target=consumer.run, args=(stop,), name=f"outbox-{consumer.name}", daemon=True)
+    t.start()
+    return t, stop
+
+
+def telegram_consumer(engine: Engine, **kwargs: Any) -> OutboxConsumer:
+    return OutboxConsumer(
+        engine,
+        "telegram_notifications",
+        TelegramNotifier(),
+        batch_size=_env_int("STAKING_OUTBOX_BATCH", 500),
+        **kwargs,
+    )
@@ -0,0 +1,300 @@
+from __future__ import annotations
+
+import logging
+import os
+import threading
+from datetime import datetime, timezone
+from typing import Iterable, Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+
+# Monthly range partitions of staking_events (occurred_at) and staking_rewards (created_at).
+#
+# Children are named <table>_pYYYYMM and cover [first of the month, first of the next) UTC.
+# ensure_partitions keeps the current month and the next AHEAD_MONTHS in place. A new child is
+# created as a plain table LIKE the parent and then ATTACHed: that takes SHARE UPDATE EXCLUSIVE
+# on the parent (CREATE TABLE ... PARTITION OF takes ACCESS EXCLUSIVE), so inserts don't queue
+# behind it; the parent's indexes, FK and row triggers are cloned onto the child by the attach
+# (the rewards FK briefly takes SHARE ROW EXCLUSIVE on staking_positions; lock_timeout bounds
+# any wait, and a timed-out attempt is simply retried on the next call).
+# There is no default partition (it would rule out DETACH CONCURRENTLY and make every attach
+# scan it), so a row outside every range fails its insert. Three things keep the months rolling:
+#   - every API process runs start_maintainer (app/main.py), independent of the accrual
+#     scheduler: ensure_partitions at startup and then every MAINTAIN_SECONDS;
+#   - the scheduler leader runs maintain() after each accrual run (this also detaches);
+#   - cron fallback for deployments running no API process, e.g. daily:
+#       0 3 * * *  cd /app && python tools/manage_staking_partitions.py
+#     which exits 1 when the runway is short, so cron mails the failure.
+# runway() is how far contiguous coverage reaches past now; under MIN_RUNWAY_DAYS (less than
+# the AHEAD_MONTHS months that should exist) check_runway logs an error on every pass.
+# detach_old (KEEP_MONTHS > 0) detaches children whose whole range ends before the retention
+# window, with DETACH ... CONCURRENTLY, and moves them to ARCHIVE_SCHEMA for an operator to dump
+# and drop. An events child still holding events some outbox consumer hasn't read is skipped.
+# Idempotency keys stay in staking_event_requests either way.
+
+log = logging.getLogger("staking.partitions")
+
+# parent table -> partition key
+TABLES = {"staking_events": "occurred_at", "staking_rewards": "created_at"}
+
+LOCK_ID = 912345680
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name) or default)
+    except Exception:
+        return default
+
+
+AHEAD_MONTHS = max(_env_int("STAKING_PARTITIONS_AHEAD_MONTHS", 3), 1)
+# full months kept before the current one; 0 keeps everything
+KEEP_MONTHS = max(_env_int("STAKING_PARTITIONS_KEEP_MONTHS", 0), 0)
+ARCHIVE_SCHEMA = os.getenv("STAKING_PARTITIONS_ARCHIVE_SCHEMA") or "staking_archive"
+# alert when contiguous coverage ends sooner than this
+MIN_RUNWAY_DAYS = max(_env_int("STAKING_PARTITIONS_MIN_RUNWAY_DAYS", 45), 1)
+MAINTAIN_SECONDS = max(_env_int("STAKING_PARTITIONS_MAINTAIN_SECONDS", 6 * 3600), 60)
+
+
+def utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def month_start(at: datetime) -> datetime:
+    at = at.astimezone(timezone.utc) if at.tzinfo else at.replace(tzinfo=timezone.utc)
+    return datetime(at.year, at.month, 1, tzinfo=timezone.utc)
+
+
+def add_months(month: datetime, n: int) -> datetime:
+    i = month.year * 12 + month.month - 1 + n
+    return datetime(i // 12, i % 12 + 1, 1, tzinfo=timezone.utc)
+
+
+def partition_name(table: str, month: datetime) -> str:
+    return f"{table}_p{month:%Y%m}"
+
+
+def _ident(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+_PARENT_SQL = text("""
+    SELECT n.nspname AS schema, c.relkind = 'p' AS partitioned
+    FROM pg_class c
+    JOIN pg_namespace n ON n.oid = c.relnamespace
+    WHERE c.oid = to_regclass(:table)
+""")
+
+# bounds come back as text in the session time zone, with offset, so the casts are exact
+_LIST_SQL = text(r"""
+    SELECT n.nspname AS schema, c.relname AS name, i.inhdetachpending AS detach_pending,
+           CAST(b.m[1] AS timestamptz) AS lower, CAST(b.m[2] AS timestamptz) AS upper,
+           CAST(GREATEST(c.reltuples, 0) AS bigint) AS rows_estimate,
+           pg_total_relation_size(c.oid) AS bytes
+    FROM pg_inherits i
+    JOIN pg_class c ON c.oid = i.inhrelid
+    JOIN pg_namespace n ON n.oid = c.relnamespace
+    CROSS JOIN LATERAL (
+        SELECT regexp_match(pg_get_expr(c.relpartbound, c.oid),
+                            'FROM \(''([^'']+)''\) TO \(''([^'']+)''\)') AS m
+    ) b
+    WHERE i.inhparent = to_regclass(:table)
+    ORDER BY 4 NULLS FIRST
+""")
+
+
+def _parent_schema(conn: Connection, table: str) -> str:
+    row = conn.execute(_PARENT_SQL, {"table": table}).mappings().first()
+    if row is None:
+        raise RuntimeError(f"{table} does not exist")
+    if not row["partitioned"]:
+        raise RuntimeError(f"{table} is not partitioned (run the migrations)")
+    return row["schema"]
+
+
+def list_partitions(conn: Connection, table: str) -> list[dict]:
+    """Children of `table` (resolved on the search_path), oldest first."""
+    if table not in TABLES:
+        raise ValueError(f"Unknown partitioned table: {table}")
+    return [dict(r) for r in conn.execute(_LIST_SQL, {"table": table}).mappings()]
+
+
+def ensure_partitions(
+    conn: Connection,
+    now: Optional[datetime] = None,
+    ahead: int = AHEAD_MONTHS,
+    start: Optional[datetime] = None,
+    tables: Iterable[str] = tuple(TABLES),
+) -> list[str]:
+    """
+    Create the missing monthly children of `tables` from `start` (default: the current month)
+    through the `ahead`-th month after the current one. Months already covered by any child
+    are left alone. Runs in the caller's transaction; returns the names created.
+    """
+    now = now or utcnow()
+    first = month_start(start or now)
+    last = add_months(month_start(now), max(int(ahead), 0) + 1)
+
+    conn.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": LOCK_ID})
+    conn.execute(text("SET LOCAL lock_timeout = '5s'"))
+    created: list[str] = []
+    for table in tables:
+        schema = _parent_schema(conn, table)
+        existing = [(p["lower"], p["upper"]) for p in list_partitions(conn, table) if p["lower"] is not None]
+        month = first
+        while month < last:
+            upper = add_months(month, 1)
+            if any(lo < upper and hi > month for lo, hi in existing):
+                month = upper
+                continue
+            name = partition_name(table, month)
+            parent, child = f"{_ident(schema)}.{_ident(table)}", f"{_ident(schema)}.{_ident(name)}"
+            conn.execute(text(f"CREATE TABLE {child} (LIKE {parent} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"))
+            conn.execute(
+                text(
+                    f"ALTER TABLE {parent} ATTACH PARTITION {child} "
+                    f"FOR VALUES FROM ('{month.isoformat()}') TO ('{upper.isoformat()}')"
+                )
+            )
+            created.append(name)
+            month = upper
+    if created:
+        log.info("staking partitions created: %s", ", ".join(created))
+    return created
+
+
+def runway(conn: Connection, now: Optional[datetime] = None) -> dict[str, dict]:
+    """
+    Per table: `covered_until`, the end of the run of adjacent children starting at the one
+    that holds `now` (None when no child does), and `days` left until then.
+    """
+    now = now or utcnow()
+    out: dict[str, dict] = {}
+    for table in TABLES:
+        until = None
+        for p in list_partitions(conn, table):
+            if p["lower"] is None or p["detach_pending"]:
+                continue
+            if until is None and p["lower"] <= now < p["upper"]:
+                until = p["upper"]
+            elif until is not None and p["lower"] == until:
+                until = p["upper"]
+        days = (until - now).total_seconds() / 86400 if until is not None else 0.0
+        out[table] = {"covered_until": until, "days": round(days, 1)}
+    return out
+
+
+def check_runway(conn: Connection, now: Optional[datetime] = None, min_days: int = MIN_RUNWAY_DAYS) -> dict[str, dict]:
+    """runway() with `short` set per table; logs an error for each table under `min_days`."""
+    out = runway(conn, now)
+    for table, r in out.items():
+        r["short"] = r["days"] < min_days
+        if r["short"]:
+            log.error(
+                "staking partitions: %s is covered only until %s (%.1f days); inserts past it will fail",
+                table,
+                r["covered_until"],
+                r["days"],
+            )
+    return out
+
+
+def maintain_partitions(engine: Engine, now: Optional[datetime] = None) -> dict[str, dict]:
+    """ensure_partitions in its own transaction, then check_runway."""
+    with engine.begin() as conn:
+        ensure_partitions(conn, now=now)
+    with engine.connect() as conn:
+        return check_runway(conn, now)
+
+
+def run_maintainer(engine: Engine, stop: threading.Event, interval: float = MAINTAIN_SECONDS) -> None:
+    """Loop of maintain_partitions every `interval` seconds, starting immediately, until `stop`."""
+    while not stop.is_set():
+        try:
+            maintain_partitions(engine)
+        except Exception as e:
+            # the runway check didn't run either; the next pass is a full retry
+            log.error("staking partition maintenance failed: %s", str(e)[:200])
+            stop.wait(min(interval, 300))
+            continue
+        stop.wait(interval)
+
+
+def start_maintainer(engine: Engine, interval: float = MAINTAIN_SECONDS) -> tuple[threading.Thread, threading.Event]:
+    stop = threading.Event()
+    t = threading.Thread(
+        target=run_maintainer, args=(engine, stop, interval), name="staking-partitions", daemon=True
+    )
+    t.start()
+    return t, stop
+
+
+# oldest consumer offset; events after it are still to be delivered to someone
+_UNDELIVERED_SQL = """
+    SELECT EXISTS (
+        SELECT 1 FROM {child} e
+        WHERE (e.tx_id, e.seq) > (
+            SELECT last_tx_id, last_seq FROM {schema}.staking_event_consumers
+            ORDER BY last_tx_id, last_seq
+            LIMIT 1
+        )
+    )
+"""
+
+
+def detach_old(
+    engine: Engine,
+    keep_months: int = KEEP_MONTHS,
+    archive_schema: Optional[str] = ARCHIVE_SCHEMA,
+    now: Optional[datetime] = None,
+    dry_run: bool = False,
+) -> list[dict]:
+    """
+    Detach children that end before the retention window (`keep_months` full months before
+    the current one) and move them to `archive_schema` (None leaves them where they are).
+    Also finalizes a detach left pending by an interrupted run. Each DETACH CONCURRENTLY
+    runs in its own autocommit statement, as it must.
+    """
+    if keep_months <= 0:
+        return []
+    cutoff = add_months(month_start(now or utcnow()), -int(keep_months))
+
+    out: list[dict] = []
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        for table in TABLES:
+            schema = _parent_schema(conn, table)
+            parent = f"{_ident(schema)}.{_ident(table)}"
+            for p in list_partitions(conn, table):
+                if not p["detach_pending"] and (p["upper"] is None or p["upper"] > cutoff):
+                    continue
+                child = f"{_ident(p['schema'])}.{_ident(p['name'])}"
+                info = {"table": table, "name": p["name"], "lower": p["lower"], "upper": p["upper"], "action": None}
+                if table == "staking_events" and not p["detach_pending"]:
+                    if conn.execute(text(_UNDELIVERED_SQL.format(child=child, schema=_ident(schema)))).scalar():
+                        info["action"] = "kept_undelivered"
+                        out.append(info)
+                        continue
+                info["action"] = "finalize" if p["detach_pending"] else "detach"
+                if not dry_run:
+                    how = "FINALIZE" if p["detach_pending"] else "CONCURRENTLY"
+                    conn.execute(text(f"ALTER TABLE {parent} DETACH PARTITION {child} {how}"))
+                    if archive_schema:
+                        conn.execute(text(f"CREATE SCHEMA IF NOT EXISTS {_ident(archive_schema)}"))
+                        conn.execute(text(f"ALTER TABLE {child} SET SCHEMA {_ident(archive_schema)}"))
+                        info["archived_to"] = archive_schema
+                    log.info("staking partition detached: %s", p["name"])
+                out.append(info)
+    return out
+
+
+def maintain(engine: Engine, now: Optional[datetime] = None) -> dict:
+    """Create upcoming months, then detach expired ones (when KEEP_MONTHS is set)."""
+    with engine.begin() as conn:
+        created = ensure_partitions(conn, now=now)
+    detached = detach_old(engine, now=now)
+    return {
+        "created": created,
+        "detached": [d["name"] for d in detached if d["action"] in ("detach", "finalize")],
+        "kept_undelivered": [d["name"] for d in detached if d["action"] == "kept_undelivered"],
+    }
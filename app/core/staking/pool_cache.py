@@ -0,0 +1,216 @@
+from __future__ import annotations
+
+import logging
+import os
+import select
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from decimal import Decimal
+from typing import Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import Session
+
+# Process-local cache of staking_pools.
+#
+# Pools are config that changes rarely, so service paths read them from here instead of
+# querying per position. Entries are immutable snapshots keyed by id and code. Within the
+# TTL a lookup does no I/O; after it, one probe of (count, digest of every (id, updated_at),
+# unstarted indexes) decides whether to reload the whole (small) table. A trigger bumps
+# updated_at only when config columns change and NOTIFYs CHANNEL (also when a reward index
+# starts); the listener marks the cache stale so the next lookup probes.
+# updated_at is the transaction start time, so a change committed by a transaction that began
+# before the newest one can leave max(updated_at) where it was: the digest still moves.
+# The probe and the reload run on their own short-lived connection from the caller's engine,
+# never in the caller's transaction, so the shared cache only ever holds committed rows (a
+# request that has just started a pool index reads its own uncommitted row under lock, see
+# reward_index.ensure_pool_index / pool_index_at).
+#
+# reward_index / reward_index_at are advanced by accrual without touching updated_at. A
+# cached (older) index point is still exact for index math while apy_bps is unchanged,
+# and an apy change bumps the version.
+
+log = logging.getLogger("staking.pool_cache")
+
+CHANNEL = "staking_pools"
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name) or default)
+    except Exception:
+        return default
+
+
+@dataclass(frozen=True)
+class CachedPool:
+    id: str
+    code: str
+    name: str
+    description: Optional[str]
+    asset_symbol: str
+    reward_asset_symbol: str
+    apy_bps: int
+    lock_seconds: int
+    early_withdraw_penalty_bps: int
+    min_stake: Optional[Decimal]
+    max_stake: Optional[Decimal]
+    is_active: bool
+    starts_at: Optional[datetime]
+    ends_at: Optional[datetime]
+    reward_index: Decimal
+    reward_index_at: Optional[datetime]
+    created_at: datetime
+    updated_at: datetime
+
+
+_FIELDS = tuple(CachedPool.__dataclass_fields__)
+
+_VERSION_SQL = text("""
+    SELECT count(*) AS n, max(updated_at) AS updated_at,
+           md5(COALESCE(string_agg(id || '@' || extract(epoch FROM updated_at)::text, ',' ORDER BY id), ''))
+               AS digest,
+           count(*) FILTER (WHERE reward_index_at IS NULL) AS unstarted
+    FROM staking_pools
+""")
+_LOAD_SQL = text(f"SELECT {', '.join(_FIELDS)} FROM staking_pools")
+
+
+def _engine_of(db: Session | Connection) -> Engine:
+    bind = db if isinstance(db, Connection) else db.get_bind()
+    return bind.engine if isinstance(bind, Connection) else bind
+
+
+class PoolCache:
+    def __init__(self, ttl: float = 30.0, miss_refresh_interval: float = 1.0) -> None:
+        self.ttl = float(ttl)
+        self.miss_refresh_interval = float(miss_refresh_interval)
+        self._lock = threading.Lock()
+        self._by_id: dict[str, CachedPool] = {}
+        self._by_code: dict[str, CachedPool] = {}
+        self._version: Optional[tuple] = None
+        self._updated_at: Optional[datetime] = None
+        self._checked_at = 0.0
+        self._stale = True
+
+        self.hits = 0
+        self.probes = 0
+        self.reloads = 0
+
+    @property
+    def version(self) -> Optional[tuple]:
+        return self._version
+
+    def invalidate(self) -> None:
+        """Next lookup probes the version (and reloads if it moved)."""
+        self._stale = True
+
+    def clear(self) -> None:
+        """Drop everything: next lookup reloads unconditionally."""
+        with self._lock:
+            self._by_id, self._by_code, self._version, self._updated_at = {}, {}, None, None
+            self._stale = True
+
+    def _refresh(self, db: Session) -> None:
+        with self._lock, _engine_of(db).connect() as conn:
+            self.probes += 1
+            row = conn.execute(_VERSION_SQL).one()
+            version = (int(row.n), row.digest, int(row.unstarted))
+            if version != self._version:
+                pools = [CachedPool(**r) for r in conn.execute(_LOAD_SQL).mappings().all()]
+                self._by_id = {p.id: p for p in pools}
+                self._by_code = {p.code: p for p in pools}
+                self._version = version
+                self._updated_at = row.updated_at
+                self.reloads += 1
+            self._checked_at = time.monotonic()
+            self._stale = False
+
+    def _ensure(self, db: Session) -> None:
+        if self._stale or time.monotonic() - self._checked_at > self.ttl:
+            self._refresh(db)
+        else:
+            self.hits += 1
+
+    def _on_miss(self, db: Session) -> None:
+        # a pool created since the last probe; bounded so unknown keys can't hammer the DB
+        if time.monotonic() - self._checked_at > self.miss_refresh_interval:
+            self._refresh(db)
+
+    def get(self, db: Session, pool_id: str) -> Optional[CachedPool]:
+        self._ensure(db)
+        pool = self._by_id.get(pool_id)
+        if pool is None:
+            self._on_miss(db)
+            pool = self._by_id.get(pool_id)
+        return pool
+
+    def by_code(self, db: Session, code: str) -> Optional[CachedPool]:
+        self._ensure(db)
+        pool = self._by_code.get(code)
+        if pool is None:
+            self._on_miss(db)
+            pool = self._by_code.get(code)
+        return pool
+
+    def active(self, db: Session) -> list[CachedPool]:
+        self._ensure(db)
+        return sorted((p for p in self._by_id.values() if p.is_active), key=lambda p: p.code)
+
+    def stats(self) -> dict:
+        return {
+            "pools": len(self._by_id),
+            "version": {
+                "pools": self._version[0],
+                "digest": self._version[1],
+                "updated_at": self._updated_at.isoformat() if self._updated_at else None,
+                "unstarted_indexes": self._version[2],
+            } if self._version else None,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "probes": self.probes,
+            "reloads": self.reloads,
+        }
+
+
+POOLS = PoolCache(ttl=_env_float("STAKING_POOL_CACHE_TTL_SECONDS", 30.0))
+
+
+def listen_for_changes(engine: Engine, cache: PoolCache, stop: threading.Event) -> None:
+    """Blocking LISTEN loop: every staking_pools NOTIFY invalidates `cache`. Reconnects on errors."""
+    while not stop.is_set():
+        raw = None
+        try:
+            raw = engine.raw_connection()
+            conn = raw.driver_connection
+            conn.autocommit = True
+            with conn.cursor() as cur:
+                cur.execute(f"LISTEN {CHANNEL}")
+            # anything committed before LISTEN took effect
+            cache.invalidate()
+            while not stop.is_set():
+                ready, _, _ = select.select([conn], [], [], 1.0)
+                if ready:
+                    conn.poll()
+                if conn.notifies:
+                    conn.notifies.clear()
+                    cache.invalidate()
+        except Exception as e:
+            log.warning("pool cache listener: %s", str(e)[:200])
+            stop.wait(5.0)
+        finally:
+            if raw is not None:
+                try:
+                    raw.invalidate()
+                except Exception:
+                    pass
+
+
+def start_listener(engine: Engine, cache: PoolCache = POOLS) -> tuple[threading.Thread, threading.Event]:
+    stop = threading.Event()
+    t = threading.Thread(target=listen_for_changes, args=(engine, cache, stop), name="pool-cache-listener", daemon=True)
+    t.start()
+    return t, stop
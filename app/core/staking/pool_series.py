@@ -0,0 +1,365 @@
+from __future__ import annotations
+
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.engine import Connection, Engine
+
+from app.core.staking.fixed_point import from_units, to_units
+from app.models_staking import StakingPoolSeries
+
+# Per-pool metrics time series (staking_pool_series), for investor charts.
+#
+# One row per (pool, hour). Levels are as of the end of the bucket:
+#   tvl               principal of open (CREATED/ACTIVE/COMPLETED) positions, as in /stats
+#   open_positions    positions not yet withdrawn/cancelled
+#   active_positions  positions in state ACTIVE
+#   apy_bps           the pool's APY when the bucket was last sampled
+# and flows are what happened during it: staked / withdrawn principal, rewards accrued /
+# claimed, positions opened / closed, claims.
+#
+# sample() is incremental: it tails staking_events like an outbox consumer (offset row
+# CONSUMER in staking_event_consumers, (tx_id, seq) order, only tx_id < snapshot xmin, see
+# app.core.staking.outbox), aggregates a batch per (pool, hour) in SQL and adds it to the
+# series in the same transaction that moves the offset. Events land in the hour they
+# occurred, or in the pool's latest bucket if that hour was already closed, so levels never
+# change behind a sampled point. The first sample seeds the levels from user_staking_summary
+# and starts the offset at that statement's snapshot xmin; events at or above it that the
+# snapshot already saw are taken back out of the seed, since the consumer replays them.
+
+CONSUMER = "pool_series"
+BUCKET = "hour"
+RESOLUTIONS = ("hour", "day", "week", "month")
+
+_STEP = {
+    "hour": timedelta(hours=1),
+    "day": timedelta(days=1),
+    "week": timedelta(weeks=1),
+    "month": timedelta(days=31),
+}
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name) or default)
+    except Exception:
+        return default
+
+
+DEFAULT_BATCH = _env_int("STAKING_POOL_SERIES_BATCH", 50000)
+MAX_POINTS = _env_int("STAKING_POOL_SERIES_MAX_POINTS", 2000)
+
+_ACCRUAL_TYPES = "'ACCRUAL_RECORDED', 'REWARD_ACCRUED', 'ACCRUAL'"
+
+# level deltas of a set of events; WITHDRAWN events before from_state was recorded count as ACTIVE
+_LEVEL_DELTAS = """
+    COALESCE(sum(amount) FILTER (WHERE event_type = 'POSITION_CREATED'), 0)
+      - COALESCE(sum(amount) FILTER (WHERE event_type = 'POSITION_WITHDRAWN'), 0) AS tvl_delta,
+    count(*) FILTER (WHERE event_type = 'POSITION_CREATED')
+      - count(*) FILTER (WHERE event_type = 'POSITION_WITHDRAWN') AS open_delta,
+    count(*) FILTER (WHERE event_type = 'POSITION_ACTIVATED')
+      - count(*) FILTER (WHERE event_type = 'POSITION_COMPLETED')
+      - count(*) FILTER (WHERE event_type = 'POSITION_WITHDRAWN'
+                           AND COALESCE(details->>'from_state', 'ACTIVE') = 'ACTIVE') AS active_delta
+"""
+
+_SEED_SQL = text(f"""
+    WITH snap AS (
+        SELECT txid_snapshot_xmin(txid_current_snapshot()) AS xmin
+    ),
+    levels AS (
+        SELECT pool_id,
+               sum(principal_staked) AS tvl,
+               sum(created_count + active_count + completed_count) AS open_positions,
+               sum(active_count) AS active_positions
+        FROM user_staking_summary
+        GROUP BY pool_id
+    ),
+    replayed AS (
+        SELECT pool_id, {_LEVEL_DELTAS}
+        FROM staking_events
+        WHERE tx_id >= (SELECT xmin FROM snap) AND pool_id IS NOT NULL
+        GROUP BY pool_id
+    )
+    SELECT p.id AS pool_id, p.apy_bps, (SELECT xmin FROM snap) AS xmin,
+           COALESCE(l.tvl, 0) - COALESCE(r.tvl_delta, 0) AS tvl,
+           COALESCE(l.open_positions, 0) - COALESCE(r.open_delta, 0) AS open_positions,
+           COALESCE(l.active_positions, 0) - COALESCE(r.active_delta, 0) AS active_positions
+    FROM staking_pools p
+    LEFT JOIN levels l ON l.pool_id = p.id
+    LEFT JOIN replayed r ON r.pool_id = p.id
+""")
+
+_BATCH_SQL = text(f"""
+    WITH ev AS (
+        SELECT tx_id, seq, event_type, pool_id, occurred_at, amount, details
+        FROM staking_events
+        WHERE (tx_id, seq) > (:tx_id, :seq)
+          AND tx_id < txid_snapshot_xmin(txid_current_snapshot())
+        ORDER BY tx_id, seq
+        LIMIT :batch
+    ),
+    tail AS (
+        SELECT tx_id, seq, (SELECT count(*) FROM ev) AS n
+        FROM ev
+        ORDER BY tx_id DESC, seq DESC
+        LIMIT 1
+    ),
+    agg AS (
+        SELECT pool_id, date_trunc('{BUCKET}', occurred_at, 'UTC') AS bucket_start,
+               {_LEVEL_DELTAS},
+               COALESCE(sum(amount) FILTER (WHERE event_type = 'POSITION_CREATED'), 0) AS staked,
+               COALESCE(sum(amount) FILTER (WHERE event_type = 'POSITION_WITHDRAWN'), 0) AS withdrawn,
+               -- the legacy per-position accrual wrote its amount into details only
+               COALESCE(sum(COALESCE(amount, (details->>'reward')::numeric))
+                        FILTER (WHERE event_type IN ({_ACCRUAL_TYPES})), 0) AS rewards_accrued,
+               COALESCE(sum(amount) FILTER (WHERE event_type = 'REWARD_CLAIMED'), 0) AS rewards_claimed,
+               count(*) FILTER (WHERE event_type = 'POSITION_CREATED') AS positions_opened,
+               count(*) FILTER (WHERE event_type = 'POSITION_WITHDRAWN') AS positions_closed,
+               count(*) FILTER (WHERE event_type = 'REWARD_CLAIMED') AS claims,
+               count(*) AS events
+        FROM ev
+        WHERE pool_id IS NOT NULL
+        GROUP BY 1, 2
+    )
+    SELECT t.tx_id AS last_tx_id, t.seq AS last_seq, t.n, a.*
+    FROM tail t
+    LEFT JOIN agg a ON true
+    ORDER BY a.pool_id, a.bucket_start
+""")
+
+_LATEST_SQL = text("""
+    SELECT DISTINCT ON (pool_id) pool_id, bucket_start, tvl, open_positions, active_positions
+    FROM staking_pool_series
+    ORDER BY pool_id, bucket_start DESC
+""")
+
+FLOW_COLUMNS = (
+    "staked", "withdrawn", "rewards_accrued", "rewards_claimed",
+    "positions_opened", "positions_closed", "claims", "events",
+)
+LEVEL_COLUMNS = ("tvl", "open_positions", "active_positions")
+_AMOUNTS = frozenset(("tvl", "staked", "withdrawn", "rewards_accrued", "rewards_claimed"))
+
+
+def utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def bucket_of(at: datetime) -> datetime:
+    return at.astimezone(timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+
+def _upsert(conn: Connection, rows: list[dict]) -> None:
+    if not rows:
+        return
+    t = StakingPoolSeries.__table__
+    stmt = pg_insert(t).values(rows)
+    set_ = {c: t.c[c] + stmt.excluded[c] for c in FLOW_COLUMNS}
+    set_.update({c: stmt.excluded[c] for c in LEVEL_COLUMNS + ("apy_bps", "updated_at")})
+    conn.execute(stmt.on_conflict_do_update(index_elements=[t.c.pool_id, t.c.bucket_start], set_=set_))
+
+
+def _pool_apys(conn: Connection) -> dict[str, int]:
+    return {r.id: int(r.apy_bps) for r in conn.execute(text("SELECT id, apy_bps FROM staking_pools"))}
+
+
+def _seed(conn: Connection, now: datetime) -> bool:
+    """Levels of every pool at the current bucket, and the offset. False if another sampler seeded first."""
+    rows = conn.execute(_SEED_SQL).mappings().all()
+    xmin = int(rows[0]["xmin"]) if rows else int(conn.execute(
+        text("SELECT txid_snapshot_xmin(txid_current_snapshot())")
+    ).scalar())
+    created = conn.execute(
+        text("""
+            INSERT INTO staking_event_consumers (name, last_tx_id, last_seq)
+            VALUES (:name, :tx_id, -1)
+            ON CONFLICT (name) DO NOTHING
+        """),
+        {"name": CONSUMER, "tx_id": xmin},
+    ).rowcount
+    if not created:
+        return False
+    bucket = bucket_of(now)
+    _upsert(conn, [
+        {
+            "pool_id": r["pool_id"],
+            "bucket_start": bucket,
+            "apy_bps": int(r["apy_bps"]),
+            "updated_at": now,
+            "tvl": r["tvl"],
+            "open_positions": int(r["open_positions"]),
+            "active_positions": int(r["active_positions"]),
+            **dict.fromkeys(FLOW_COLUMNS, 0),
+        }
+        for r in rows
+    ])
+    return True
+
+
+def sample_batch(conn: Connection, batch: int = DEFAULT_BATCH, now: Optional[datetime] = None) -> dict:
+    """
+    Fold the next `batch` committed events into the series and move the offset; with
+    nothing left, just (re)write the current bucket of every pool so each sampled hour has
+    its levels and APY. Run in one transaction; concurrent samplers serialize on the
+    offset row.
+    """
+    now = now or utcnow()
+    offset = conn.execute(
+        text("SELECT last_tx_id, last_seq FROM staking_event_consumers WHERE name = :name FOR UPDATE"),
+        {"name": CONSUMER},
+    ).first()
+    seeded = False
+    if offset is None:
+        seeded = _seed(conn, now)
+        offset = conn.execute(
+            text("SELECT last_tx_id, last_seq FROM staking_event_consumers WHERE name = :name FOR UPDATE"),
+            {"name": CONSUMER},
+        ).one()
+
+    rows = conn.execute(
+        _BATCH_SQL, {"tx_id": int(offset.last_tx_id), "seq": int(offset.last_seq), "batch": int(batch)}
+    ).mappings().all()
+
+    # carried levels (integer 1e-18 units for amounts) and the latest bucket per pool
+    latest: dict[str, dict] = {}
+    for r in conn.execute(_LATEST_SQL).mappings():
+        latest[r["pool_id"]] = {
+            "bucket_start": r["bucket_start"],
+            "tvl": to_units(r["tvl"]),
+            "open_positions": int(r["open_positions"]),
+            "active_positions": int(r["active_positions"]),
+        }
+    apys = _pool_apys(conn)
+
+    out: dict[tuple[str, datetime], dict] = {}
+    for r in rows:
+        if r["pool_id"] is None:
+            continue
+        pool_id = r["pool_id"]
+        cur = latest.setdefault(
+            pool_id, {"bucket_start": r["bucket_start"], "tvl": 0, "open_positions": 0, "active_positions": 0}
+        )
+        bucket = max(r["bucket_start"], cur["bucket_start"])
+        cur["bucket_start"] = bucket
+        cur["tvl"] += to_units(r["tvl_delta"])
+        cur["open_positions"] += int(r["open_delta"])
+        cur["active_positions"] += int(r["active_delta"])
+
+        row = out.setdefault((pool_id, bucket), dict.fromkeys(FLOW_COLUMNS, 0))
+        for c in FLOW_COLUMNS:
+            row[c] += to_units(r[c]) if c in _AMOUNTS else int(r[c])
+        row.update({c: cur[c] for c in LEVEL_COLUMNS})
+
+    events = int(rows[0]["n"]) if rows else 0
+    if events < batch:
+        # caught up: every pool gets a point in the current bucket
+        current = bucket_of(now)
+        for pool_id in apys:
+            cur = latest.setdefault(
+                pool_id, {"bucket_start": current, "tvl": 0, "open_positions": 0, "active_positions": 0}
+            )
+            bucket = max(current, cur["bucket_start"])
+            row = out.setdefault((pool_id, bucket), dict.fromkeys(FLOW_COLUMNS, 0))
+            row.update({c: cur[c] for c in LEVEL_COLUMNS})
+
+    _upsert(conn, [
+        {
+            "pool_id": pool_id,
+            "bucket_start": bucket,
+            "apy_bps": apys.get(pool_id),
+            "updated_at": now,
+            **{c: from_units(v) if c in _AMOUNTS else v for c, v in row.items()},
+        }
+        for (pool_id, bucket), row in sorted(out.items())
+    ])
+
+    if rows:
+        conn.execute(
+            text("""
+                UPDATE staking_event_consumers
+                SET last_tx_id = :tx_id, last_seq = :seq, delivered = delivered + :n,
+                    last_error = NULL, updated_at = timezone('utc', now())
+                WHERE name = :name
+            """),
+            {"tx_id": int(rows[0]["last_tx_id"]), "seq": int(rows[0]["last_seq"]), "n": events, "name": CONSUMER},
+        )
+    return {"seeded": seeded, "events": events, "buckets": len(out), "caught_up": events < batch}
+
+
+def sample(engine: Engine, batch: int = DEFAULT_BATCH, max_batches: Optional[int] = None) -> dict:
+    """sample_batch until caught up, one transaction per batch."""
+    stats = {"seeded": False, "batches": 0, "events": 0, "buckets": 0}
+    while max_batches is None or stats["batches"] < max_batches:
+        with engine.begin() as conn:
+            res = sample_batch(conn, batch=batch)
+        stats["batches"] += 1
+        stats["seeded"] = stats["seeded"] or res["seeded"]
+        stats["events"] += res["events"]
+        stats["buckets"] += res["buckets"]
+        if res["caught_up"]:
+            break
+    return stats
+
+
+# -- reading --
+
+_SERIES_SQL = text("""
+    SELECT date_trunc(:unit, bucket_start, 'UTC') AS bucket_start,
+           (array_agg(tvl ORDER BY bucket_start DESC))[1] AS tvl,
+           (array_agg(open_positions ORDER BY bucket_start DESC))[1] AS open_positions,
+           (array_agg(active_positions ORDER BY bucket_start DESC))[1] AS active_positions,
+           (array_agg(apy_bps ORDER BY bucket_start DESC))[1] AS apy_bps,
+           sum(staked) AS staked,
+           sum(withdrawn) AS withdrawn,
+           sum(rewards_accrued) AS rewards_accrued,
+           sum(rewards_claimed) AS rewards_claimed,
+           sum(positions_opened)::int AS positions_opened,
+           sum(positions_closed)::int AS positions_closed,
+           sum(claims)::int AS claims
+    FROM staking_pool_series
+    WHERE pool_id = :pool_id
+      AND bucket_start >= date_trunc(:unit, CAST(:start AS timestamptz), 'UTC')
+      AND bucket_start < :end
+    GROUP BY 1
+    ORDER BY 1
+""")
+
+
+def pick_resolution(start: datetime, end: datetime, max_points: int) -> str:
+    """The finest resolution that fits the range into max_points buckets."""
+    span = end - start
+    for res in RESOLUTIONS:
+        if span / _STEP[res] <= max_points:
+            return res
+    return RESOLUTIONS[-1]
+
+
+def read_series(
+    conn,
+    pool_id: str,
+    start: datetime,
+    end: datetime,
+    resolution: str = "auto",
+    max_points: int = 500,
+) -> tuple[str, list[dict]]:
+    """
+    (resolution, points) over [start, end), downsampled with date_trunc: levels are the last
+    sampled value in each bucket, flows are summed. Buckets nothing was sampled in are absent.
+    """
+    if end <= start:
+        raise ValueError("end must be after start")
+    if resolution == "auto":
+        resolution = pick_resolution(start, end, max_points)
+    if resolution not in RESOLUTIONS:
+        raise ValueError(f"Unknown resolution: {resolution}")
+    if (end - start) / _STEP[resolution] > MAX_POINTS:
+        raise ValueError(f"Range too large for resolution {resolution} (max {MAX_POINTS} points)")
+
+    rows = conn.execute(
+        _SERIES_SQL, {"unit": resolution, "pool_id": pool_id, "start": start, "end": end}
+    ).mappings().all()
+    return resolution, [dict(r) for r in rows]
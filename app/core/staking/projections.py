@@ -0,0 +1,202 @@
+from __future__ import annotations
+
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from typing import Iterable, Optional
+
+from sqlalchemy.orm import Session
+
+from app.core.staking.fixed_point import accrue_units_batch, from_units, to_units
+from app.core.staking.pool_cache import POOLS, CachedPool
+from app.core.staking.service import early_withdraw_penalty
+
+# What-if reward projections.
+#
+# A scenario is (pool_code, amount, horizon_seconds): a position opened at `as_of` and held
+# for the horizon. Accrual follows the job's bounds, LEAST(as_of + horizon, matures_at,
+# pool.ends_at), and the amounts use the same integer math as calc_reward (accrue_units,
+# floored to 1e-18), computed for every cell in one accrue_units_batch call. Withdrawing
+# before maturity costs early_withdraw_penalty, as in confirm_unstake.
+#
+# Results are cached per (pool cache version, as_of, cells). as_of defaults to now floored
+# to the minute, so a table rendered repeatedly hits the cache until the minute rolls over
+# or a pool's config changes. The API also keeps the rendered JSON on the entry (`body`):
+# validating and encoding 1000 rows of Decimals costs more than computing them.
+
+DEFAULT_HORIZON_SECONDS = 365 * 24 * 60 * 60
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name) or default)
+    except Exception:
+        return default
+
+
+MAX_CELLS = _env_int("STAKING_PROJECTION_MAX_CELLS", 5000)
+CACHE_SIZE = _env_int("STAKING_PROJECTION_CACHE_SIZE", 256)
+
+
+@dataclass(frozen=True)
+class Scenario:
+    pool_code: str
+    amount: Decimal
+    horizon_seconds: Optional[int] = None
+
+
+@dataclass
+class Projection:
+    as_of: datetime
+    results: list[dict]
+    body: Optional[bytes] = None
+
+    @property
+    def count(self) -> int:
+        return len(self.results)
+
+
+def grid(pool_codes: Iterable[str], amounts: Iterable[Decimal], horizons: Iterable[Optional[int]]) -> list[Scenario]:
+    """Cartesian product, pool-major then amount then horizon."""
+    amounts, horizons = list(amounts), list(horizons)
+    return [Scenario(code, a, h) for code in pool_codes for a in amounts for h in horizons]
+
+
+def default_as_of(now: Optional[datetime] = None) -> datetime:
+    now = now or datetime.now(timezone.utc)
+    return now.replace(second=0, microsecond=0)
+
+
+class _LRU:
+    def __init__(self, size: int) -> None:
+        self.size = max(int(size), 0)
+        self._lock = threading.Lock()
+        self._data: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key):
+        with self._lock:
+            val = self._data.get(key)
+            if val is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return val
+
+    def put(self, key, val) -> None:
+        if not self.size:
+            return
+        with self._lock:
+            self._data[key] = val
+            self._data.move_to_end(key)
+            while len(self._data) > self.size:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+_CACHE = _LRU(CACHE_SIZE)
+
+
+def _invalid(pool: Optional[CachedPool], amount: Decimal) -> Optional[str]:
+    # the checks create_and_activate_position makes
+    if pool is None:
+        return "Pool not found"
+    if not pool.is_active:
+        return "Pool is not active"
+    if amount <= 0:
+        return "Amount must be > 0"
+    if pool.min_stake is not None and amount < pool.min_stake:
+        return "Amount below pool minimum"
+    if pool.max_stake is not None and amount > pool.max_stake:
+        return "Amount above pool maximum"
+    return None
+
+
+def _compute(pools: dict[str, Optional[CachedPool]], cells: list[tuple[str, int, Optional[int]]], as_of: datetime) -> list[dict]:
+    out: list[dict] = []
+    batch_idx: list[int] = []
+    principals: list[int] = []
+    apys: list[int] = []
+    seconds: list[int] = []
+
+    for code, units, horizon in cells:
+        pool = pools[code]
+        amount = from_units(units)
+        horizon = int(horizon or (pool.lock_seconds if pool and pool.lock_seconds > 0 else DEFAULT_HORIZON_SECONDS))
+        row = {"pool_code": code, "amount": amount, "horizon_seconds": horizon}
+        error = _invalid(pool, amount)
+        if error:
+            row["error"] = error
+            out.append(row)
+            continue
+
+        horizon_end = as_of + timedelta(seconds=horizon)
+        matures_at = as_of + timedelta(seconds=int(pool.lock_seconds)) if pool.lock_seconds > 0 else None
+        end = horizon_end
+        if matures_at is not None:
+            end = min(end, matures_at)
+        if pool.ends_at is not None:
+            end = min(end, pool.ends_at)
+        matured = matures_at is None or horizon_end >= matures_at
+        penalty = Decimal("0") if matured else early_withdraw_penalty(amount, pool)
+
+        row.update(
+            apy_bps=int(pool.apy_bps),
+            accrual_seconds=max(int((end - as_of).total_seconds()), 0),
+            matures_at=matures_at,
+            matured=matured,
+            penalty=penalty,
+            net_principal=from_units(units - to_units(penalty)),
+        )
+        batch_idx.append(len(out))
+        principals.append(units)
+        apys.append(row["apy_bps"])
+        seconds.append(row["accrual_seconds"])
+        out.append(row)
+
+    for i, reward in zip(batch_idx, accrue_units_batch(principals, apys, seconds)):
+        row = out[i]
+        row["reward"] = from_units(reward)
+        row["total_at_horizon"] = from_units(to_units(row["net_principal"]) + reward)
+    return out
+
+
+def project(db: Session, scenarios: list[Scenario], as_of: Optional[datetime] = None) -> tuple[Projection, bool]:
+    """
+    Projected reward, maturity and early-withdraw penalty per scenario, in input order, and
+    whether it came from the cache. Invalid cells (unknown/inactive pool, amount out of
+    bounds) carry `error` instead of numbers, so one bad cell doesn't fail a table.
+    Reads pools from the cache only.
+    """
+    if len(scenarios) > MAX_CELLS:
+        raise ValueError(f"Too many scenarios: {len(scenarios)} > {MAX_CELLS}")
+    as_of = as_of or default_as_of()
+    if as_of.tzinfo is None:
+        as_of = as_of.replace(tzinfo=timezone.utc)
+
+    pools = {code: POOLS.by_code(db, code) for code in {s.pool_code for s in scenarios}}
+    # amounts are keyed in 1e-18 units so 100 and 100.0 share a cell
+    cells = [(s.pool_code, to_units(s.amount), s.horizon_seconds) for s in scenarios]
+    key = (POOLS.version, as_of, tuple(cells))
+
+    entry = _CACHE.get(key)
+    if entry is not None:
+        return entry, True
+    entry = Projection(as_of=as_of, results=_compute(pools, cells, as_of))
+    _CACHE.put(key, entry)
+    return entry, False
+
+
+def cache_stats() -> dict:
+    return {"entries": len(_CACHE), "size": _CACHE.size, "hits": _CACHE.hits, "misses": _CACHE.misses}
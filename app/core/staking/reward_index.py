@@ -0,0 +1,147 @@
+from __future__ import annotations
+
+import os
+from datetime import datetime, timezone
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.core.staking.calculator import RewardCalcResult
+from app.core.staking.fixed_point import accrue_index_units, from_units, to_units
+from app.core.staking.pool_cache import POOLS, CachedPool
+from app.models_staking import StakingPool, StakingPoolIndexPoint, StakingPosition
+
+# Reward-index accrual.
+#
+# Each pool carries I(t) = sum of apy_bps * seconds since the index started, kept in whole
+# seconds (reward_index at reward_index_at). A position in index mode stores the index at its
+# last_accrual_at (also a whole second), so at any later whole second T
+#     reward_units = floor(principal_units * (I(T) - snapshot) / (10000 * 365d))
+# which for a constant apy is exactly calc_reward(principal, apy_bps, last_accrual_at, T).
+# Periodic work only advances pool rows; positions are materialised on claim, unstake,
+# maturity (or principal change) through service.accrue_position.
+#
+# apy_bps changes must be preceded by advance_pool_indexes() so the old rate is folded in.
+
+
+def enabled() -> bool:
+    """New positions start in index mode when STAKING_REWARD_INDEX is on."""
+    return (os.getenv("STAKING_REWARD_INDEX") or "").strip().lower() in ("1", "true", "yes", "on")
+
+
+def whole_second(dt: datetime) -> datetime:
+    return dt.astimezone(timezone.utc).replace(microsecond=0)
+
+
+def _seconds(a: datetime, b: datetime) -> int:
+    return int((b - a).total_seconds())
+
+
+def ensure_pool_index(db: Session, pool: StakingPool | CachedPool, now: datetime) -> StakingPool | CachedPool:
+    """
+    Start the pool's index at `now` (whole second) if it hasn't started yet.
+    A cached pool that predates the start is re-read under lock.
+    """
+    if pool.reward_index_at is not None:
+        return pool
+    pool = (
+        db.query(StakingPool)
+        .filter(StakingPool.id == pool.id)
+        .with_for_update()
+        .populate_existing()
+        .one()
+    )
+    if pool.reward_index_at is None:
+        at = whole_second(now)
+        pool.reward_index = 0
+        pool.reward_index_at = at
+        db.add(StakingPoolIndexPoint(pool_id=pool.id, at=at, reward_index=0, apy_bps=int(pool.apy_bps)))
+        db.flush()
+    POOLS.invalidate()
+    return pool
+
+
+def pool_index_at(db: Session, pool: StakingPool | CachedPool, at: datetime) -> int:
+    """I(at) for the pool; `at` is floored to a whole second and capped at the pool's ends_at."""
+    if pool.reward_index_at is None:
+        # a cached snapshot can predate the start
+        pool = db.query(StakingPool).filter(StakingPool.id == pool.id).one()
+    if pool.reward_index_at is None:
+        raise ValueError("Pool reward index not started")
+
+    t = whole_second(at)
+    if pool.ends_at is not None:
+        t = min(t, whole_second(pool.ends_at))
+
+    if t >= pool.reward_index_at:
+        return int(pool.reward_index) + int(pool.apy_bps) * _seconds(pool.reward_index_at, t)
+
+    point = (
+        db.query(StakingPoolIndexPoint)
+        .filter(StakingPoolIndexPoint.pool_id == pool.id, StakingPoolIndexPoint.at <= t)
+        .order_by(StakingPoolIndexPoint.at.desc())
+        .first()
+    )
+    if point is None:
+        raise ValueError("Pool reward index has no history before the requested time")
+    return int(point.reward_index) + int(point.apy_bps) * _seconds(point.at, t)
+
+
+def position_reward(
+    db: Session, pos: StakingPosition, pool: StakingPool | CachedPool, end: datetime
+) -> tuple[RewardCalcResult, int, datetime]:
+    """
+    Reward owed to an index-mode position from last_accrual_at up to `end` (floored to a whole
+    second). Returns (result, index at end, end). Nothing is written.
+    """
+    start = pos.last_accrual_at
+    end = whole_second(end)
+    snapshot = int(pos.reward_index_snapshot)
+    if end <= start:
+        return RewardCalcResult(amount=from_units(0), seconds=0), snapshot, start
+
+    index_end = pool_index_at(db, pool, end)
+    units = accrue_index_units(to_units(pos.principal_amount), index_end - snapshot)
+    return RewardCalcResult(amount=from_units(units), seconds=_seconds(start, end)), index_end, end
+
+
+# One statement over the pools table; each advanced pool also records a checkpoint.
+_ADVANCE_SQL = text("""
+    WITH target AS (
+        SELECT id,
+               LEAST(date_trunc('second', CAST(:now AS timestamptz)), date_trunc('second', ends_at)) AS at
+        FROM staking_pools
+        WHERE reward_index_at IS NOT NULL
+    ),
+    adv AS (
+        UPDATE staking_pools s
+        SET reward_index = s.reward_index
+                           + s.apy_bps * CAST(extract(epoch FROM (t.at - s.reward_index_at)) AS numeric),
+            reward_index_at = t.at
+        FROM target t
+        WHERE t.id = s.id
+          AND t.at > s.reward_index_at
+        RETURNING s.id, s.code, s.reward_index, s.reward_index_at, s.apy_bps
+    ),
+    pts AS (
+        INSERT INTO staking_pool_index_points (pool_id, at, reward_index, apy_bps)
+        SELECT id, reward_index_at, reward_index, apy_bps FROM adv
+        ON CONFLICT (pool_id, at) DO NOTHING
+    )
+    SELECT id, code, reward_index::text AS reward_index, reward_index_at FROM adv
+""")
+
+
+def advance_pool_indexes(db: Session, now: datetime | None = None) -> list[dict]:
+    """Advance every started pool index to `now` (whole second, capped at ends_at). O(pools)."""
+    now = now or datetime.now(timezone.utc)
+    rows = db.execute(_ADVANCE_SQL, {"now": now}).mappings().all()
+    return [
+        {
+            "pool_id": r["id"],
+            "pool_code": r["code"],
+            "reward_index": r["reward_index"],
+            "reward_index_at": r["reward_index_at"].isoformat(),
+        }
+        for r in rows
+    ]
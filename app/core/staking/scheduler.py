@@ -0,0 +1,327 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+
+from app.core.staking import partitions, pool_series
+from app.core.staking.accrual_runner import DEFAULT_CHUNK_SIZE, run_accrual
+
+# In-app accrual scheduler.
+#
+# Every app process runs the loop; one of them is the leader. Leadership is a session-level
+# advisory lock (LEADER_LOCK_ID) held on a dedicated connection. On each tick the leader renews
+# its lease by checking pg_locks on that connection; if the connection died, Postgres has
+# already released the lock and the process falls back to follower until it wins it again.
+# The run itself still takes accrual_runner.LOCK_ID, so a manual run (tool/admin endpoint)
+# makes the scheduled one skip rather than overlap. After each run the leader also folds new
+# staking_events into the pool time series (pool_series.sample, incremental) and keeps the
+# monthly partitions of staking_events / staking_rewards rolling (partitions.maintain).
+# stop() asks a run in progress to pause before its next chunk (it stays RUNNING and the next
+# leader resumes it) and waits at most STOP_TIMEOUT seconds for that.
+
+log = logging.getLogger("staking.scheduler")
+
+LEADER_LOCK_ID = 912345679
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name) or default)
+    except Exception:
+        return default
+
+
+STOP_TIMEOUT = _env_int("STAKING_ACCRUAL_STOP_TIMEOUT_SECONDS", 30)
+
+
+def enabled() -> bool:
+    return (os.getenv("STAKING_ACCRUAL_SCHEDULER") or "").strip().lower() in ("1", "true", "yes", "on")
+
+
+def utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+_LAG_SQL = text("""
+    SELECT
+        (SELECT min(COALESCE(p.last_accrual_at, p.activated_at))
+         FROM staking_positions p
+         JOIN staking_pools pool ON pool.id = p.pool_id
+         WHERE p.state = 'ACTIVE'
+           AND p.reward_index_snapshot IS NULL
+           AND COALESCE(p.last_accrual_at, p.activated_at) < LEAST(CAST(:now AS timestamptz), p.matures_at, pool.ends_at)
+        ) AS oldest_accrual_at,
+        (SELECT count(*)
+         FROM staking_positions p
+         JOIN staking_pools pool ON pool.id = p.pool_id
+         WHERE p.state = 'ACTIVE'
+           AND p.reward_index_snapshot IS NULL
+           AND COALESCE(p.last_accrual_at, p.activated_at) < LEAST(CAST(:now AS timestamptz), p.matures_at, pool.ends_at)
+        ) AS due_positions,
+        (SELECT min(reward_index_at)
+         FROM staking_pools
+         WHERE reward_index_at IS NOT NULL
+           AND reward_index_at < LEAST(date_trunc('second', CAST(:now AS timestamptz)), date_trunc('second', ends_at))
+        ) AS oldest_index_at
+""")
+
+
+def accrual_lag(conn: Connection, now: Optional[datetime] = None) -> dict:
+    """
+    now - min(last_accrual_at) over positions that are still owed accrual (capped at maturity
+    and pool end, so finished positions don't count), and the same for reward-index pools.
+    """
+    now = now or utcnow()
+    row = conn.execute(_LAG_SQL, {"now": now}).mappings().one()
+
+    def _age(at: Optional[datetime]) -> float:
+        return round((now - at).total_seconds(), 3) if at is not None else 0.0
+
+    positions_lag = _age(row["oldest_accrual_at"])
+    index_lag = _age(row["oldest_index_at"])
+    return {
+        "measured_at": now.isoformat(),
+        "lag_seconds": max(positions_lag, index_lag),
+        "positions_lag_seconds": positions_lag,
+        "index_lag_seconds": index_lag,
+        "due_positions": int(row["due_positions"]),
+        "oldest_accrual_at": row["oldest_accrual_at"].isoformat() if row["oldest_accrual_at"] else None,
+    }
+
+
+class AccrualScheduler:
+    """
+    Runs run_accrual every `interval` seconds (+ uniform jitter in [0, jitter]) on the elected
+    leader. A tick that finds the previous run still going is skipped, not queued.
+    """
+
+    def __init__(
+        self,
+        engine: Engine,
+        interval: float = 300,
+        jitter: float = 30,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+    ) -> None:
+        if interval <= 0:
+            raise ValueError("interval must be positive")
+        self.engine = engine
+        self.interval = float(interval)
+        self.jitter = max(float(jitter), 0.0)
+        self.chunk_size = int(chunk_size)
+
+        self._lease_conn: Optional[Connection] = None
+        self._loop_task: Optional[asyncio.Task] = None
+        self._run_task: Optional[asyncio.Task] = None
+        self._stop = asyncio.Event()
+        # read from the run's worker thread
+        self._halt = threading.Event()
+
+        self.is_leader = False
+        self.leader_since: Optional[datetime] = None
+        self.ticks = 0
+        self.runs = 0
+        self.runs_failed = 0
+        self.skipped_overlap = 0
+        self.skipped_lock_busy = 0
+        self.last_run_started_at: Optional[datetime] = None
+        self.last_run_finished_at: Optional[datetime] = None
+        self.last_run_seconds: Optional[float] = None
+        self.last_result: Optional[dict] = None
+        self.last_error: Optional[str] = None
+        self.last_lag: Optional[dict] = None
+        self.last_series: Optional[dict] = None
+        self.last_partitions: Optional[dict] = None
+
+    @classmethod
+    def from_env(cls, engine: Engine) -> "AccrualScheduler":
+        return cls(
+            engine,
+            interval=_env_int("STAKING_ACCRUAL_INTERVAL_SECONDS", 300),
+            jitter=_env_int("STAKING_ACCRUAL_JITTER_SECONDS", 30),
+            chunk_size=_env_int("ACCRUAL_CHUNK_SIZE", DEFAULT_CHUNK_SIZE),
+        )
+
+    # -- leader lease (blocking; called through asyncio.to_thread, never concurrently) --
+
+    def _drop_lease(self) -> None:
+        if self._lease_conn is not None:
+            try:
+                self._lease_conn.close()
+            except Exception:
+                pass
+        self._lease_conn = None
+        if self.is_leader:
+            log.warning("accrual scheduler: leadership lost")
+        self.is_leader = False
+        self.leader_since = None
+
+    def _renew_or_acquire(self) -> bool:
+        try:
+            if self._lease_conn is None:
+                self._lease_conn = self.engine.connect()
+            conn = self._lease_conn
+            if self.is_leader:
+                held = bool(conn.execute(
+                    text("""
+                        SELECT EXISTS (
+                            SELECT 1 FROM pg_locks
+                            WHERE locktype = 'advisory' AND pid = pg_backend_pid() AND granted
+                              AND classid = 0 AND objid = :id AND objsubid = 1
+                        )
+                    """),
+                    {"id": LEADER_LOCK_ID},
+                ).scalar())
+                conn.commit()
+                if not held:
+                    self._drop_lease()
+                return held
+
+            got = bool(conn.execute(text("SELECT pg_try_advisory_lock(:id)"), {"id": LEADER_LOCK_ID}).scalar())
+            conn.commit()
+            if got:
+                self.is_leader = True
+                self.leader_since = utcnow()
+                log.info("accrual scheduler: became leader")
+            return got
+        except Exception as e:
+            log.warning("accrual scheduler: lease check failed: %s", str(e)[:200])
+            self._drop_lease()
+            return False
+
+    def _release(self) -> None:
+        if self._lease_conn is not None and self.is_leader:
+            try:
+                self._lease_conn.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": LEADER_LOCK_ID})
+                self._lease_conn.commit()
+            except Exception:
+                pass
+        self.is_leader = False
+        self._drop_lease()
+
+    def _measure_lag(self) -> dict:
+        with self.engine.connect() as conn:
+            return accrual_lag(conn)
+
+    # -- loop --
+
+    async def _run_once(self) -> None:
+        self.last_run_started_at = utcnow()
+        t0 = time.perf_counter()
+        try:
+            res = await asyncio.to_thread(
+                run_accrual, self.engine, self.chunk_size, trigger="scheduler", should_stop=self._halt.is_set
+            )
+            if res.get("skipped"):
+                self.skipped_lock_busy += 1
+            else:
+                self.runs += 1
+                self.last_error = None
+            self.last_result = {k: v for k, v in res.items() if k != "chunks"}
+        except Exception as e:
+            self.runs_failed += 1
+            self.last_error = f"{type(e).__name__}: {e}"[:500]
+            log.exception("accrual scheduler: run failed")
+        finally:
+            self.last_run_seconds = round(time.perf_counter() - t0, 3)
+            self.last_run_finished_at = utcnow()
+        if self._halt.is_set():
+            return
+
+        try:
+            self.last_lag = await asyncio.to_thread(self._measure_lag)
+            log.info(
+                "accrual scheduler: run %.3fs lag=%ss due=%s",
+                self.last_run_seconds, self.last_lag["lag_seconds"], self.last_lag["due_positions"],
+            )
+        except Exception as e:
+            log.warning("accrual scheduler: lag query failed: %s", str(e)[:200])
+
+        try:
+            self.last_series = await asyncio.to_thread(pool_series.sample, self.engine)
+        except Exception as e:
+            log.warning("accrual scheduler: pool series sample failed: %s", str(e)[:200])
+
+        try:
+            self.last_partitions = await asyncio.to_thread(partitions.maintain, self.engine)
+        except Exception as e:
+            log.warning("accrual scheduler: partition maintenance failed: %s", str(e)[:200])
+
+    def _next_delay(self) -> float:
+        return self.interval + random.uniform(0, self.jitter)
+
+    async def _loop(self) -> None:
+        # spread replicas that start together
+        delay = random.uniform(0, self.jitter)
+        while not self._stop.is_set():
+            try:
+                await asyncio.wait_for(self._stop.wait(), timeout=delay)
+                break
+            except asyncio.TimeoutError:
+                pass
+            delay = self._next_delay()
+            self.ticks += 1
+
+            if not await asyncio.to_thread(self._renew_or_acquire):
+                continue
+            if self._run_task is not None and not self._run_task.done():
+                self.skipped_overlap += 1
+                log.info("accrual scheduler: previous run still going, tick skipped")
+                continue
+            self._run_task = asyncio.create_task(self._run_once())
+
+    def start(self) -> None:
+        if self._loop_task is None:
+            self._stop.clear()
+            self._halt.clear()
+            self._loop_task = asyncio.create_task(self._loop())
+            log.info("accrual scheduler started: interval=%ss jitter=%ss", self.interval, self.jitter)
+
+    async def stop(self, timeout: float = STOP_TIMEOUT) -> None:
+        self._stop.set()
+        self._halt.set()
+        if self._loop_task is not None:
+            await self._loop_task
+            self._loop_task = None
+        if self._run_task is not None and not self._run_task.done():
+            # the run is in a worker thread: it pauses after the current chunk (and stays resumable)
+            try:
+                await asyncio.wait_for(asyncio.shield(self._run_task), timeout=max(float(timeout), 0.0))
+            except asyncio.TimeoutError:
+                log.warning("accrual scheduler: run still in its chunk after %ss, not waiting for it", timeout)
+        await asyncio.to_thread(self._release)
+
+    def status(self) -> dict:
+        def _iso(x: Optional[datetime]) -> Optional[str]:
+            return x.isoformat() if x else None
+
+        return {
+            "running": self._loop_task is not None,
+            "is_leader": self.is_leader,
+            "leader_since": _iso(self.leader_since),
+            "interval_seconds": self.interval,
+            "jitter_seconds": self.jitter,
+            "chunk_size": self.chunk_size,
+            "ticks": self.ticks,
+            "runs": self.runs,
+            "runs_failed": self.runs_failed,
+            "skipped_overlap": self.skipped_overlap,
+            "skipped_lock_busy": self.skipped_lock_busy,
+            "run_in_progress": self._run_task is not None and not self._run_task.done(),
+            "last_run_started_at": _iso(self.last_run_started_at),
+            "last_run_finished_at": _iso(self.last_run_finished_at),
+            "last_run_seconds": self.last_run_seconds,
+            "last_result": self.last_result,
+            "last_error": self.last_error,
+            "last_lag": self.last_lag,
+            "last_series": self.last_series,
+            "last_partitions": self.last_partitions,
+        }
@@ -1,17 +1,24 @@
 from __future__ import annotations
 
+import base64
 import uuid
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
 from decimal import Decimal
 
 from sqlalchemy.orm import Session
-from sqlalchemy import text
+from sqlalchemy import bindparam, insert, select, text, tuple_, union_all
+from sqlalchemy.dialects.postgresql import JSONB
 
+from app.core.staking import reward_index
+from app.core.staking.pool_cache import POOLS, CachedPool
 from app.core.staking.calculator import calc_reward
+from app.core.staking.fixed_point import DECIMAL_CTX, Q18, from_units, to_units
 from app.core.staking.state import assert_transition
+from app.core.staking.summary import SummaryDeltas
 from app.models_staking import (
     StakingActorType,
     StakingEvent,
+    StakingEventRequest,
     StakingEventType,
     StakingPool,
     StakingPosition,
@@ -30,15 +37,15 @@ def _d(x: Decimal | int | str) -> Decimal:
 
 
 def _q18(x: Decimal) -> Decimal:
-    return x.quantize(Decimal("0.000000000000000001"))
+    return x.quantize(Q18, context=DECIMAL_CTX)
 
 
-def list_active_pools(db: Session) -> list[StakingPool]:
-    return db.query(StakingPool).filter(StakingPool.is_active.is_(True)).order_by(StakingPool.code.asc()).all()
+def list_active_pools(db: Session) -> list[CachedPool]:
+    return POOLS.active(db)
 
 
-def get_pool_by_code(db: Session, code: str) -> StakingPool | None:
-    return db.query(StakingPool).filter(StakingPool.code == code).first()
+def get_pool_by_code(db: Session, code: str) -> CachedPool | None:
+    return POOLS.by_code(db, code)
 
 
 def get_position_for_update(db: Session, position_id: str) -> StakingPosition:
@@ -53,10 +60,88 @@ def get_position_for_update(db: Session, position_id: str) -> StakingPosition:
     return pos
 
 
+def get_position(db: Session, position_id: str) -> StakingPosition:
+    """Plain read, no row lock: for quotes and views that write nothing."""
+    pos = db.query(StakingPosition).filter(StakingPosition.id == position_id).first()
+    if not pos:
+        raise ValueError("Position not found")
+    return pos
+
+
+# column projection for listings: plain rows, no ORM hydration / identity map
+_LISTING_COLUMNS = tuple(
+    StakingPosition.__table__.c[name]
+    for name in (
+        "id", "user_telegram_id", "pool_id", "principal_amount", "state", "created_at", "activated_at",
+        "matures_at", "closed_at", "last_accrual_at", "total_reward_accrued", "total_reward_claimed",
+    )
+)
+MAX_PAGE_SIZE = 500
+
+
+def encode_position_cursor(created_at: datetime, position_id: str) -> str:
+    raw = f"{created_at.isoformat()}|{position_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_position_cursor(cursor: str) -> tuple[datetime, str]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, position_id = raw.split("|", 1)
+        return datetime.fromisoformat(created_at), position_id
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def list_user_positions(
+    db: Session,
+    telegram_id: int,
+    states: list[str] | None = None,
+    limit: int = 100,
+    cursor: str | None = None,
+) -> tuple[list[dict], str | None]:
+    """
+    One page of a user's positions, newest first, as column dicts (not ORM objects).
+    Keyset on (created_at, id) DESC, served by ix_staking_positions_user_created or, with a
+    state filter, ix_staking_positions_user_state (several states: one range per state, merged).
+    Returns (rows, next cursor or None).
+    """
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        raise ValueError(f"limit must be between 1 and {MAX_PAGE_SIZE}")
+    valid = {s.value for s in StakingPositionState}
+    for st in states or ():
+        if st not in valid:
+            raise ValueError(f"Unknown state: {st}")
+
+    t = StakingPosition.__table__
+    after = decode_position_cursor(cursor) if cursor else None
+
+    def page(*conds):
+        q = select(*_LISTING_COLUMNS).where(t.c.user_telegram_id == int(telegram_id), *conds)
+        if after is not None:
+            q = q.where(tuple_(t.c.created_at, t.c.id) < tuple_(*after))
+        return q.order_by(t.c.created_at.desc(), t.c.id.desc()).limit(limit + 1)
+
+    states = list(dict.fromkeys(states or ()))
+    if len(states) > 1:
+        # state IN (...) can't be read in order from the index: one ordered range per state, merged
+        merged = union_all(*(page(t.c.state == st) for st in states)).subquery()
+        q = select(merged).order_by(merged.c.created_at.desc(), merged.c.id.desc()).limit(limit + 1)
+    else:
+        q = page(*(t.c.state == st for st in states))
+
+    rows = [dict(r) for r in db.execute(q).mappings()]
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_position_cursor(rows[-1]["created_at"], rows[-1]["id"])
+    return rows, next_cursor
+
+
 def create_and_activate_position(
     db: Session,
     telegram_id: int,
-    pool: StakingPool,
+    pool: StakingPool | CachedPool,
     amount: Decimal,
     actor_type: str = StakingActorType.USER.value,
     actor_id: str | None = None,
@@ -105,6 +190,10 @@ def create_and_activate_position(
     pos.last_accrual_at = now
     if pool.lock_seconds and pool.lock_seconds > 0:
         pos.matures_at = datetime.fromtimestamp(now.timestamp() + int(pool.lock_seconds), tz=timezone.utc)
+    if reward_index.enabled():
+        pool = reward_index.ensure_pool_index(db, pool, now)
+        pos.last_accrual_at = reward_index.whole_second(now)
+        pos.reward_index_snapshot = reward_index.pool_index_at(db, pool, pos.last_accrual_at)
 
     db.add(
         StakingEvent(
@@ -118,96 +207,231 @@ def create_and_activate_position(
         )
     )
 
+    deltas = SummaryDeltas()
+    deltas.opened(telegram_id, pool.id, pos.state, pos.principal_amount)
     db.flush()
+    deltas.apply(db)
     return pos
 
 
-def accrue_position(db: Session, pos: StakingPosition, now: datetime | None = None) -> Decimal:
-    now = now or utcnow()
-
+def plan_accrual(
+    db: Session,
+    pos: StakingPosition,
+    now: datetime,
+    pool: StakingPool | CachedPool | None = None,
+) -> dict | None:
+    """
+    What accrue_position would do at `now`, computed from the position and pool snapshot
+    without writing or locking. None when there is nothing to move.
+    """
     if pos.state not in (StakingPositionState.ACTIVE.value, StakingPositionState.COMPLETED.value):
-        return _q18(Decimal("0"))
+        return None
 
-    pool = db.query(StakingPool).filter(StakingPool.id == pos.pool_id).first()
+    pool = pool or POOLS.get(db, pos.pool_id)
     if not pool:
         raise ValueError("Pool not found for position")
 
     start = pos.last_accrual_at or pos.activated_at or pos.created_at
     end = now
 
+    # If matured, mark completed (non-destructive), even when the last segment pays nothing
+    # (apy 0, a pool that ended first, already accrued up to maturity): otherwise the
+    # position stays ACTIVE and every accrual run selects it again
+    completes = (
+        pos.matures_at is not None
+        and now >= pos.matures_at
+        and pos.state == StakingPositionState.ACTIVE.value
+    )
+
     # do not accrue beyond maturity if matured and not yet marked completed
     if pos.matures_at is not None and end > pos.matures_at:
         end = pos.matures_at
 
     if end <= start:
-        return _q18(Decimal("0"))
-
-    res = calc_reward(_d(pos.principal_amount), int(pool.apy_bps), start, end)
-    if res.amount <= 0:
-        pos.last_accrual_at = end
-        pos.version += 1
-        db.flush()
-        return _q18(Decimal("0"))
+        return _completion_plan(pool, start) if completes else None
+
+    index_from = index_to = None
+    if pos.reward_index_snapshot is not None:
+        index_from = int(pos.reward_index_snapshot)
+        res, index_to, end = reward_index.position_reward(db, pos, pool, end)
+        if res.seconds <= 0:
+            return _completion_plan(pool, start) if completes else None
+    else:
+        res = calc_reward(_d(pos.principal_amount), int(pool.apy_bps), start, end)
 
-    reward = _q18(res.amount)
+    reward = _q18(res.amount) if res.amount > 0 else _q18(Decimal("0"))
+    return {
+        "pool": pool,
+        "start": start,
+        "end": end,
+        "seconds": res.seconds,
+        "reward": reward,
+        "index_from": index_from,
+        "index_to": index_to,
+        "completes": completes,
+    }
 
-    db.add(
-        StakingReward(
-            position_id=pos.id,
-            reward_type=StakingRewardType.ACCRUAL.value,
-            amount=reward,
-            period_start=start,
-            period_end=end,
-            meta={
-                "apy_bps": int(pool.apy_bps),
-                "seconds": res.seconds,
-                "method": "continuous_seconds_365d",
-                "pool_code": pool.code,
-            },
-        )
-    )
 
-    pos.total_reward_accrued = _q18(_d(pos.total_reward_accrued) + reward)
-    pos.last_accrual_at = end
-    pos.version += 1
+def _completion_plan(pool: StakingPool | CachedPool, at: datetime) -> dict:
+    """Nothing left to accrue, only the ACTIVE -> COMPLETED transition."""
+    return {
+        "pool": pool,
+        "start": at,
+        "end": at,
+        "seconds": 0,
+        "reward": _q18(Decimal("0")),
+        "index_from": None,
+        "index_to": None,
+        "completes": True,
+    }
 
-    db.add(
-        StakingEvent(
-            event_type=StakingEventType.ACCRUAL_RECORDED.value,
-            user_telegram_id=int(pos.user_telegram_id),
-            pool_id=pool.id,
-            position_id=pos.id,
-            actor_type=StakingActorType.SYSTEM.value,
-            amount=reward,
-            details={"period_start": start.isoformat(), "period_end": end.isoformat(), "pool_code": pool.code},
-        )
-    )
 
-    # If matured, mark completed (non-destructive)
-    if pos.matures_at is not None and now >= pos.matures_at and pos.state == StakingPositionState.ACTIVE.value:
+def _apply_accrual(pos: StakingPosition, plan: dict, deltas: SummaryDeltas) -> None:
+    if plan["index_to"] is not None:
+        pos.reward_index_snapshot = plan["index_to"]
+    if plan["reward"] > 0:
+        pos.total_reward_accrued = from_units(to_units(pos.total_reward_accrued) + to_units(plan["reward"]))
+        deltas.accrued(pos.user_telegram_id, pos.pool_id, plan["reward"])
+    pos.last_accrual_at = plan["end"]
+    pos.version += 1
+    if plan["completes"]:
         assert_transition(pos.state, StakingPositionState.COMPLETED.value)
+        deltas.transition(pos.user_telegram_id, pos.pool_id, pos.state, StakingPositionState.COMPLETED.value, pos.principal_amount)
         pos.state = StakingPositionState.COMPLETED.value
         pos.version += 1
-        db.add(
-            StakingEvent(
-                event_type=StakingEventType.POSITION_COMPLETED.value,
-                user_telegram_id=int(pos.user_telegram_id),
-                pool_id=pool.id,
-                position_id=pos.id,
-                actor_type=StakingActorType.SYSTEM.value,
-                details={"matures_at": pos.matures_at.isoformat()},
-            )
+
+
+def _accrual_rows(pos: StakingPosition, plan: dict) -> tuple[dict | None, list[dict]]:
+    """(ACCRUAL reward row, event rows) for an applied plan, as column dicts."""
+    pool = plan["pool"]
+    start, end, reward = plan["start"], plan["end"], plan["reward"]
+    reward_row = None
+    events: list[dict] = []
+    if reward > 0:
+        meta = {
+            "apy_bps": int(pool.apy_bps),
+            "seconds": plan["seconds"],
+            "method": "continuous_seconds_365d",
+            "pool_code": pool.code,
+        }
+        if plan["index_to"] is not None:
+            meta.update(method="reward_index", index_from=str(plan["index_from"]), index_to=str(plan["index_to"]))
+
+        reward_row = {
+            "position_id": pos.id,
+            "reward_type": StakingRewardType.ACCRUAL.value,
+            "amount": reward,
+            "period_start": start,
+            "period_end": end,
+            "meta": meta,
+        }
+        events.append(
+            {
+                "event_type": StakingEventType.ACCRUAL_RECORDED.value,
+                "user_telegram_id": int(pos.user_telegram_id),
+                "pool_id": pool.id,
+                "position_id": pos.id,
+                "actor_type": StakingActorType.SYSTEM.value,
+                "amount": reward,
+                "details": {"period_start": start.isoformat(), "period_end": end.isoformat(), "pool_code": pool.code},
+            }
         )
+    if plan["completes"]:
+        events.append(
+            {
+                "event_type": StakingEventType.POSITION_COMPLETED.value,
+                "user_telegram_id": int(pos.user_telegram_id),
+                "pool_id": pool.id,
+                "position_id": pos.id,
+                "actor_type": StakingActorType.SYSTEM.value,
+                "amount": None,
+                "details": {"matures_at": pos.matures_at.isoformat()},
+            }
+        )
+    return reward_row, events
+
+
+def accrue_position(
+    db: Session,
+    pos: StakingPosition,
+    now: datetime | None = None,
+    deltas: SummaryDeltas | None = None,
+) -> Decimal:
+    """
+    Materialise accrual up to `now` on a locked position. Summary deltas go to `deltas`
+    when the caller collects them for its own upsert, else they are applied here.
+    """
+    now = now or utcnow()
+
+    plan = plan_accrual(db, pos, now)
+    if plan is None:
+        return _q18(Decimal("0"))
+
+    pending = deltas if deltas is not None else SummaryDeltas()
+    _apply_accrual(pos, plan, pending)
+    reward_row, events = _accrual_rows(pos, plan)
+    if reward_row is not None:
+        db.add(StakingReward(**reward_row))
+    for ev in events:
+        db.add(StakingEvent(**ev))
+
+    db.flush()
+    if deltas is None:
+        pending.apply(db)
+    return plan["reward"]
+
+
+def accrue_positions(
+    db: Session,
+    positions: list[StakingPosition],
+    now: datetime | None = None,
+    deltas: SummaryDeltas | None = None,
+) -> list[Decimal]:
+    """
+    accrue_position for several already-locked positions: same rows, written with one
+    multi-row INSERT per table. Returns the accrued amount per position, in order.
+    """
+    now = now or utcnow()
+    pending = deltas if deltas is not None else SummaryDeltas()
+    rewards: list[dict] = []
+    events: list[dict] = []
+    out: list[Decimal] = []
+    for pos in positions:
+        plan = plan_accrual(db, pos, now)
+        if plan is None:
+            out.append(_q18(Decimal("0")))
+            continue
+        _apply_accrual(pos, plan, pending)
+        reward_row, evs = _accrual_rows(pos, plan)
+        if reward_row is not None:
+            rewards.append(reward_row)
+        events.extend(evs)
+        out.append(plan["reward"])
 
     db.flush()
-    return reward
+    if rewards:
+        db.execute(insert(StakingReward), rewards)
+    if events:
+        # render_nulls: keep POSITION_COMPLETED (amount None) in the same multi-row statement
+        db.execute(insert(StakingEvent).execution_options(render_nulls=True), events)
+    if deltas is None:
+        pending.apply(db)
+    return out
 
 
 def compute_claimable(pos: StakingPosition) -> Decimal:
-    claimable = _d(pos.total_reward_accrued) - _d(pos.total_reward_claimed)
+    claimable = to_units(pos.total_reward_accrued) - to_units(pos.total_reward_claimed)
     if claimable <= 0:
         return _q18(Decimal("0"))
-    return _q18(claimable)
+    return from_units(claimable)
+
+
+def _request_seen(db: Session, request_id: str) -> bool:
+    """Whether an event was ever written with this request_id (primary-key probe of the registry)."""
+    return (
+        db.query(StakingEventRequest.request_id).filter(StakingEventRequest.request_id == request_id).first()
+        is not None
+    )
 
 
 def claim_rewards(
@@ -220,16 +444,18 @@ def claim_rewards(
     if int(pos.user_telegram_id) != int(telegram_id):
         raise PermissionError("Not your position")
 
-    accrue_position(db, pos, utcnow())
+    deltas = SummaryDeltas()
+    accrue_position(db, pos, utcnow(), deltas)
     claimable = compute_claimable(pos)
     if claimable <= 0:
+        deltas.apply(db)
         return _q18(Decimal("0"))
 
     rid = request_id or str(uuid.uuid4())
 
     # idempotency: if request_id already exists, no double-claim
-    exists = db.query(StakingEvent).filter(StakingEvent.request_id == rid).first()
-    if exists:
+    if _request_seen(db, rid):
+        deltas.apply(db)
         return _q18(Decimal("0"))
 
     db.add(
@@ -243,8 +469,9 @@ def claim_rewards(
         )
     )
 
-    pos.total_reward_claimed = _q18(_d(pos.total_reward_claimed) + claimable)
+    pos.total_reward_claimed = from_units(to_units(pos.total_reward_claimed) + to_units(claimable))
     pos.version += 1
+    deltas.claimed(pos.user_telegram_id, pos.pool_id, claimable)
 
     db.add(
         StakingEvent(
@@ -261,33 +488,153 @@ def claim_rewards(
     )
 
     db.flush()
+    deltas.apply(db)
     return claimable
 
 
+# claim_all: one REWARD_CLAIMED event per position, keyed by (request_id, position), so a
+# replay of the same request_id finds the keys in staking_event_requests and loads the
+# events by (id, occurred_at); a month detached since then leaves them out of the replay
+_CLAIM_ALL_NS = uuid.UUID("6d1f2c1e-6a55-4a0b-9d8e-1f0c8a7b3c21")
+
+
+def _claim_all_key(request_id: str, position_id: str) -> str:
+    return str(uuid.uuid5(_CLAIM_ALL_NS, f"{request_id}:{position_id}"))
+
+
+def claim_all_rewards(
+    db: Session,
+    telegram_id: int,
+    request_id: str | None = None,
+    now: datetime | None = None,
+) -> dict:
+    """
+    Claim everything claimable on all of a user's positions in one transaction.
+    Positions are locked in id order (same order for every caller, so no deadlocks
+    between concurrent claim_all calls), accrued in a batch, and all CLAIM rewards and
+    events go in with multi-row inserts. Idempotent per request_id.
+    """
+    rid = request_id or str(uuid.uuid4())
+    positions = (
+        db.query(StakingPosition)
+        .filter(StakingPosition.user_telegram_id == int(telegram_id))
+        .order_by(StakingPosition.id.asc())
+        .with_for_update()
+        .all()
+    )
+    if not positions:
+        return {"request_id": rid, "idempotent": False, "total": _q18(Decimal("0")), "claims": []}
+
+    keys = {pos.id: _claim_all_key(rid, pos.id) for pos in positions}
+    seen = (
+        db.query(StakingEventRequest.event_id, StakingEventRequest.occurred_at)
+        .filter(StakingEventRequest.request_id.in_(list(keys.values())))
+        .all()
+    )
+    if seen:
+        prior = (
+            db.query(StakingEvent.position_id, StakingEvent.amount)
+            .filter(
+                StakingEvent.occurred_at.in_(sorted({at for _, at in seen})),
+                StakingEvent.id.in_([event_id for event_id, _ in seen]),
+            )
+            .order_by(StakingEvent.position_id.asc())
+            .all()
+        )
+        claims = [{"position_id": pid, "claimed": _q18(_d(amount))} for pid, amount in prior]
+        total = from_units(sum(to_units(c["claimed"]) for c in claims))
+        return {"request_id": rid, "idempotent": True, "total": total, "claims": claims}
+
+    deltas = SummaryDeltas()
+    accrue_positions(db, positions, now or utcnow(), deltas)
+
+    rewards: list[dict] = []
+    events: list[dict] = []
+    claims: list[dict] = []
+    for pos in positions:
+        claimable = compute_claimable(pos)
+        if claimable <= 0:
+            continue
+        rewards.append(
+            {
+                "position_id": pos.id,
+                "reward_type": StakingRewardType.CLAIM.value,
+                "amount": claimable,
+                "period_start": None,
+                "period_end": None,
+                "meta": {"request_id": rid, "claim_all": True},
+            }
+        )
+        events.append(
+            {
+                "event_type": StakingEventType.REWARD_CLAIMED.value,
+                "user_telegram_id": int(pos.user_telegram_id),
+                "pool_id": pos.pool_id,
+                "position_id": pos.id,
+                "request_id": keys[pos.id],
+                "actor_type": StakingActorType.USER.value,
+                "actor_id": str(telegram_id),
+                "amount": claimable,
+                "details": {"claim_all": rid},
+            }
+        )
+        pos.total_reward_claimed = from_units(to_units(pos.total_reward_claimed) + to_units(claimable))
+        pos.version += 1
+        deltas.claimed(pos.user_telegram_id, pos.pool_id, claimable)
+        claims.append({"position_id": pos.id, "claimed": claimable})
+
+    db.flush()
+    if rewards:
+        db.execute(insert(StakingReward), rewards)
+        db.execute(insert(StakingEvent), events)
+    deltas.apply(db)
+
+    total = from_units(sum(to_units(c["claimed"]) for c in claims))
+    return {"request_id": rid, "idempotent": False, "total": total, "claims": claims}
+
+
+def early_withdraw_penalty(principal: Decimal, pool: StakingPool | CachedPool) -> Decimal:
+    """Penalty on principal for withdrawing before maturity (no maturity check here)."""
+    if not pool.early_withdraw_penalty_bps or pool.early_withdraw_penalty_bps <= 0:
+        return Decimal("0")
+    return _q18(DECIMAL_CTX.multiply(_d(principal), Decimal(int(pool.early_withdraw_penalty_bps)).scaleb(-4)))
+
+
+def _early_withdraw_penalty(pos: StakingPosition, pool: StakingPool | CachedPool, now: datetime) -> tuple[Decimal, bool]:
+    matured = (pos.matures_at is None) or (now >= pos.matures_at)
+    penalty = Decimal("0") if matured else early_withdraw_penalty(pos.principal_amount, pool)
+    return penalty, matured
+
+
 def prepare_unstake_quote(db: Session, position_id: str, telegram_id: int) -> dict:
-    pos = get_position_for_update(db, position_id)
+    """
+    Read-only quote: the accrual up to now is planned in memory (plan_accrual) and added to
+    what is already claimable. No row lock, nothing written; confirm_unstake does the writes.
+    """
+    pos = get_position(db, position_id)
     if int(pos.user_telegram_id) != int(telegram_id):
         raise PermissionError("Not your position")
 
-    pool = db.query(StakingPool).filter(StakingPool.id == pos.pool_id).first()
+    pool = POOLS.get(db, pos.pool_id)
     if not pool:
         raise ValueError("Pool not found")
 
     now = utcnow()
-    accrue_position(db, pos, now)
+    plan = plan_accrual(db, pos, now, pool=pool)
     claimable = compute_claimable(pos)
+    state = pos.state
+    if plan is not None:
+        claimable = from_units(to_units(claimable) + to_units(plan["reward"]))
+        if plan["completes"]:
+            state = StakingPositionState.COMPLETED.value
 
-    penalty = Decimal("0")
-    matured = (pos.matures_at is None) or (now >= pos.matures_at)
-    if (not matured) and pool.early_withdraw_penalty_bps and pool.early_withdraw_penalty_bps > 0:
-        penalty = _q18(_d(pos.principal_amount) * (Decimal(int(pool.early_withdraw_penalty_bps)) / Decimal(10000)))
-
-    net_principal = _q18(_d(pos.principal_amount) - penalty)
+    penalty, matured = _early_withdraw_penalty(pos, pool, now)
+    net_principal = _q18(DECIMAL_CTX.subtract(_d(pos.principal_amount), penalty))
 
     return {
         "position_id": pos.id,
         "pool_code": pool.code,
-        "state": pos.state,
+        "state": state,
         "principal": str(_q18(_d(pos.principal_amount))),
         "claimable_reward": str(claimable),
         "penalty": str(penalty),
@@ -311,16 +658,16 @@ def confirm_unstake(
         raise PermissionError("Not your position")
 
     # idempotency
-    exists = db.query(StakingEvent).filter(StakingEvent.request_id == request_id).first()
-    if exists:
+    if _request_seen(db, request_id):
         return {"ok": True, "idempotent": True}
 
-    pool = db.query(StakingPool).filter(StakingPool.id == pos.pool_id).first()
+    pool = POOLS.get(db, pos.pool_id)
     if not pool:
         raise ValueError("Pool not found")
 
     now = utcnow()
-    accrue_position(db, pos, now)
+    deltas = SummaryDeltas()
+    accrue_position(db, pos, now, deltas)
 
     db.add(
         StakingEvent(
@@ -335,13 +682,10 @@ def confirm_unstake(
         )
     )
 
-    matured = (pos.matures_at is None) or (now >= pos.matures_at)
-
-    penalty = Decimal("0")
-    if (not matured) and pool.early_withdraw_penalty_bps and pool.early_withdraw_penalty_bps > 0:
-        penalty = _q18(_d(pos.principal_amount) * (Decimal(int(pool.early_withdraw_penalty_bps)) / Decimal(10000)))
+    penalty, matured = _early_withdraw_penalty(pos, pool, now)
 
     # Transition to WITHDRAWN
+    old_state = pos.state
     if pos.state in (StakingPositionState.CREATED.value,):
         assert_transition(pos.state, StakingPositionState.CANCELLED.value)
         pos.state = StakingPositionState.CANCELLED.value
@@ -352,6 +696,7 @@ def confirm_unstake(
         pos.closed_at = now
 
     pos.version += 1
+    deltas.transition(pos.user_telegram_id, pos.pool_id, old_state, pos.state, pos.principal_amount)
 
     db.add(
         StakingEvent(
@@ -362,29 +707,50 @@ def confirm_unstake(
             request_id=str(uuid.uuid4()),
             actor_type=StakingActorType.SYSTEM.value,
             amount=_q18(_d(pos.principal_amount)),
-            details={"penalty": str(penalty), "matured": matured},
+            details={"penalty": str(penalty), "matured": matured, "from_state": old_state},
         )
     )
 
     db.flush()
+    deltas.apply(db)
     return {"ok": True, "penalty": str(penalty), "matured": matured}
-def accrue_all_active_positions(db: Session, now: datetime | None = None) -> list[dict]:
+
+
+ACCRUAL_MODES = ("rows", "set")
+
+
+def accrue_all_active_positions(db: Session, now: datetime | None = None, mode: str = "rows") -> list[dict]:
     """
     Deterministic accrual for all ACTIVE positions.
     Returns list of {position_id, reward} for rewards > 0.
+
+    Both modes accrue up to LEAST(now, matures_at, pool.ends_at) and move matured positions
+    to COMPLETED (POSITION_COMPLETED event, summary transition), like accrue_position.
+
+    mode="rows": one UPDATE + up to three INSERTs per position, math in Python (calc_reward).
+    mode="set":  a single statement; reward computed in SQL with exact NUMERIC floor
+                 arithmetic, same rounding as calc_reward. Use for large runs.
     """
     now = now or datetime.now(timezone.utc)
+    if mode == "set":
+        return _accrue_all_set_based(db, now) + accrue_index_positions(db, now)
+    if mode != "rows":
+        raise ValueError(f"Unknown accrual mode: {mode}")
 
     rows = db.execute(text("""
         select p.id, p.user_telegram_id, p.pool_id, p.principal_amount,
-               p.state, p.activated_at, p.last_accrual_at, p.total_reward_accrued,
-               s.apy_bps
+               p.state, p.activated_at, p.last_accrual_at, p.matures_at,
+               p.total_reward_accrued, s.apy_bps, s.code as pool_code, s.ends_at
         from staking_positions p
         join staking_pools s on s.id = p.pool_id
         where p.state = 'ACTIVE'
-    """)).mappings().all()
+          and p.reward_index_snapshot is null
+          and (coalesce(p.last_accrual_at, p.activated_at) < least(cast(:now as timestamptz), p.matures_at, s.ends_at)
+               or p.matures_at <= cast(:now as timestamptz))
+    """), {"now": now}).mappings().all()
 
     results: list[dict] = []
+    deltas = SummaryDeltas()
 
     for r in rows:
         # last accrual point
@@ -392,43 +758,227 @@ def accrue_all_active_positions(db: Session, now: datetime | None = None) -> lis
         if not last:
             continue
 
-        elapsed = int((now - last).total_seconds())
-        if elapsed <= 0:
-            continue
+        # never accrue past maturity or the pool's end
+        end = min(t for t in (now, r["matures_at"], r["ends_at"]) if t is not None)
+        end = max(end, last)
+        completes = r["matures_at"] is not None and now >= r["matures_at"]
 
-        # linear reward
-        rate = float(r["apy_bps"]) / 10_000.0
-        reward = (float(r["principal_amount"]) * rate) * (elapsed / (365.0 * 24.0 * 60.0 * 60.0))
-        if reward <= 0:
+        res = calc_reward(_d(r["principal_amount"]), int(r["apy_bps"]), last, end)
+        reward = res.amount if res.seconds > 0 and res.amount > 0 else Decimal("0")
+        if reward <= 0 and not completes:
             continue
 
         # persist
         db.execute(text("""
             update staking_positions
-            set last_accrual_at = :now,
-                total_reward_accrued = total_reward_accrued + :reward
+            set last_accrual_at = :end,
+                total_reward_accrued = total_reward_accrued + :reward,
+                state = case when :completes then 'COMPLETED' else state end,
+                version = version + case when :completes then 2 else 1 end
             where id = :id
-        """), {"now": now, "reward": reward, "id": r["id"]})
+        """), {"end": end, "reward": reward, "completes": completes, "id": r["id"]})
+
+        if reward > 0:
+            db.execute(text("""
+                insert into staking_rewards
+                (id, position_id, reward_type, amount, period_start, period_end, meta)
+                values
+                (gen_random_uuid(), :pid, :type, :amt, :start, :end, :meta)
+            """).bindparams(bindparam("meta", type_=JSONB)), {
+                "pid": r["id"],
+                "type": StakingRewardType.ACCRUAL.value,
+                "amt": reward,
+                "start": last,
+                "end": end,
+                "meta": {
+                    "apy_bps": int(r["apy_bps"]),
+                    "seconds": res.seconds,
+                    "method": "continuous_seconds_365d",
+                    "pool_code": r["pool_code"],
+                },
+            })
+
+            db.execute(text("""
+                insert into staking_events
+                (id, event_type, user_telegram_id, pool_id, position_id, actor_type, amount, details)
+                values
+                (gen_random_uuid(), :type, :uid, :pool, :pid, :actor, :amt, :details)
+            """).bindparams(bindparam("details", type_=JSONB)), {
+                "type": StakingEventType.ACCRUAL_RECORDED.value,
+                "uid": r["user_telegram_id"],
+                "pool": r["pool_id"],
+                "pid": r["id"],
+                "actor": StakingActorType.SYSTEM.value,
+                "amt": reward,
+                "details": {"period_start": last.isoformat(), "period_end": end.isoformat(), "pool_code": r["pool_code"]},
+            })
+            deltas.accrued(r["user_telegram_id"], r["pool_id"], reward)
+            results.append({"position_id": r["id"], "reward": str(reward)})
+
+        if completes:
+            assert_transition(r["state"], StakingPositionState.COMPLETED.value)
+            db.execute(text("""
+                insert into staking_events
+                (id, event_type, user_telegram_id, pool_id, position_id, actor_type, details)
+                values
+                (gen_random_uuid(), :type, :uid, :pool, :pid, :actor, :details)
+            """).bindparams(bindparam("details", type_=JSONB)), {
+                "type": StakingEventType.POSITION_COMPLETED.value,
+                "uid": r["user_telegram_id"],
+                "pool": r["pool_id"],
+                "pid": r["id"],
+                "actor": StakingActorType.SYSTEM.value,
+                "details": {"matures_at": r["matures_at"].isoformat()},
+            })
+            deltas.transition(
+                r["user_telegram_id"], r["pool_id"], r["state"], StakingPositionState.COMPLETED.value, r["principal_amount"]
+            )
 
-        db.execute(text("""
-            insert into staking_rewards
-            (id, position_id, reward_type, amount, period_start, period_end)
-            values
-            (gen_random_uuid(), :pid, 'ACCRUAL', :amt, :start, :end)
-        """), {"pid": r["id"], "amt": reward, "start": last, "end": now})
+    deltas.apply(db)
+    return results + accrue_index_positions(db, now)
 
-        db.execute(text("""
-            insert into staking_events
-            (id, event_type, user_telegram_id, pool_id, position_id, details)
-            values
-            (gen_random_uuid(), 'ACCRUAL', :uid, :pool, :pid, :details::jsonb)
-        """), {
-            "uid": r["user_telegram_id"],
-            "pool": r["pool_id"],
-            "pid": r["id"],
-            "details": '{"elapsed_seconds": ' + str(elapsed) + ', "apy_bps": ' + str(r["apy_bps"]) + ', "reward": "' + str(reward) + '"}'
-        })
-
-        results.append({"position_id": r["id"], "reward": str(reward)})
-
-    return results
\ No newline at end of file
+
+def accrue_index_positions(db: Session, now: datetime | None = None) -> list[dict]:
+    """
+    Periodic step for index-mode positions: advance the pool indexes (O(pools)) and
+    materialise only positions that have matured since their last accrual.
+    """
+    now = now or datetime.now(timezone.utc)
+    reward_index.advance_pool_indexes(db, now)
+
+    matured = (
+        db.query(StakingPosition)
+        .filter(
+            StakingPosition.state == StakingPositionState.ACTIVE.value,
+            StakingPosition.reward_index_snapshot.isnot(None),
+            StakingPosition.matures_at.isnot(None),
+            StakingPosition.matures_at <= now,
+        )
+        .order_by(StakingPosition.id)
+        .with_for_update(skip_locked=True)
+        .all()
+    )
+    results: list[dict] = []
+    deltas = SummaryDeltas()
+    for pos in matured:
+        reward = accrue_position(db, pos, now, deltas)
+        if reward > 0:
+            results.append({"position_id": pos.id, "reward": str(reward)})
+    deltas.apply(db)
+    return results
+
+
+def enroll_position_in_reward_index(db: Session, pos: StakingPosition, now: datetime | None = None) -> bool:
+    """
+    Move an ACTIVE per-position accrual into index mode: accrue it the old way up to a whole
+    second, then snapshot the pool index there. Returns False if it was not enrolled.
+    """
+    if pos.reward_index_snapshot is not None or pos.state != StakingPositionState.ACTIVE.value:
+        return False
+    at = reward_index.whole_second(now or utcnow())
+    if pos.last_accrual_at is not None and pos.last_accrual_at > at:
+        at = reward_index.whole_second(pos.last_accrual_at) + timedelta(seconds=1)
+    if pos.matures_at is not None and pos.matures_at <= at:
+        return False
+
+    pool = POOLS.get(db, pos.pool_id)
+    if not pool:
+        raise ValueError("Pool not found for position")
+
+    accrue_position(db, pos, at)
+    pool = reward_index.ensure_pool_index(db, pool, at)
+    pos.last_accrual_at = at
+    pos.reward_index_snapshot = reward_index.pool_index_at(db, pool, at)
+    pos.version += 1
+    db.flush()
+    return True
+
+
+# reward = floor(principal * apy_bps * seconds / (10000 * 365d) to 1e-18), exact:
+# principal is NUMERIC(38,18) so principal * 1e18 is an integer and div() truncates.
+_SET_BASED_ACCRUAL_SQL = text("""
+    WITH due AS (
+        SELECT p.id, p.user_telegram_id, p.pool_id, p.principal_amount, p.matures_at, s.apy_bps, s.code AS pool_code,
+               COALESCE(p.last_accrual_at, p.activated_at) AS period_start,
+               GREATEST(COALESCE(p.last_accrual_at, p.activated_at),
+                        LEAST(CAST(:now AS timestamptz), p.matures_at, s.ends_at)) AS period_end,
+               COALESCE(p.matures_at <= CAST(:now AS timestamptz), false) AS completes
+        FROM staking_positions p
+        JOIN staking_pools s ON s.id = p.pool_id
+        WHERE p.state = 'ACTIVE'
+          AND p.reward_index_snapshot IS NULL
+          AND COALESCE(p.last_accrual_at, p.activated_at) IS NOT NULL
+          AND (COALESCE(p.last_accrual_at, p.activated_at) < LEAST(CAST(:now AS timestamptz), p.matures_at, s.ends_at)
+               OR p.matures_at <= CAST(:now AS timestamptz))
+        FOR UPDATE OF p
+    ),
+    calc AS (
+        SELECT d.*,
+               floor(extract(epoch FROM (d.period_end - d.period_start)))::bigint AS seconds
+        FROM due d
+    ),
+    amt AS (
+        SELECT c.*,
+               CASE WHEN c.seconds > 0 AND c.apy_bps > 0 AND c.principal_amount > 0
+                    THEN div(c.principal_amount * 1000000000000000000 * c.apy_bps * c.seconds,
+                             10000::numeric * 31536000) * 0.000000000000000001
+                    ELSE 0
+               END::numeric(38, 18) AS reward
+        FROM calc c
+    ),
+    upd AS (
+        UPDATE staking_positions p
+        SET last_accrual_at = a.period_end,
+            total_reward_accrued = p.total_reward_accrued + a.reward,
+            state = CASE WHEN a.completes THEN 'COMPLETED' ELSE p.state END,
+            version = p.version + CASE WHEN a.completes THEN 2 ELSE 1 END
+        FROM amt a
+        WHERE p.id = a.id AND (a.reward > 0 OR a.completes)
+        RETURNING p.id
+    ),
+    rew AS (
+        INSERT INTO staking_rewards (id, position_id, reward_type, amount, period_start, period_end, meta)
+        SELECT gen_random_uuid(), a.id, 'ACCRUAL', a.reward, a.period_start, a.period_end,
+               jsonb_build_object('apy_bps', a.apy_bps, 'seconds', a.seconds, 'method', 'continuous_seconds_365d',
+                                  'pool_code', a.pool_code)
+        FROM amt a JOIN upd u ON u.id = a.id
+        WHERE a.reward > 0
+    ),
+    ev AS (
+        INSERT INTO staking_events (id, event_type, user_telegram_id, pool_id, position_id, actor_type, amount, details)
+        SELECT gen_random_uuid(), 'ACCRUAL_RECORDED', a.user_telegram_id, a.pool_id, a.id, 'SYSTEM', a.reward,
+               jsonb_build_object('period_start', a.period_start, 'period_end', a.period_end, 'pool_code', a.pool_code)
+        FROM amt a JOIN upd u ON u.id = a.id
+        WHERE a.reward > 0
+        UNION ALL
+        SELECT gen_random_uuid(), 'POSITION_COMPLETED', a.user_telegram_id, a.pool_id, a.id, 'SYSTEM', NULL,
+               jsonb_build_object('matures_at', a.matures_at)
+        FROM amt a JOIN upd u ON u.id = a.id
+        WHERE a.completes
+    ),
+    summ AS (
+        -- user_staking_summary deltas (see app.core.staking.summary), keys in lock order;
+        -- ACTIVE -> COMPLETED keeps principal_staked (both are open states)
+        INSERT INTO user_staking_summary
+            (user_telegram_id, pool_id, active_count, completed_count, total_reward_accrued, updated_at)
+        SELECT a.user_telegram_id, a.pool_id,
+               -count(*) FILTER (WHERE a.completes), count(*) FILTER (WHERE a.completes),
+               sum(a.reward), timezone('utc', now())
+        FROM amt a JOIN upd u ON u.id = a.id
+        GROUP BY a.user_telegram_id, a.pool_id
+        ORDER BY a.user_telegram_id, a.pool_id
+        ON CONFLICT (user_telegram_id, pool_id) DO UPDATE
+        SET active_count = user_staking_summary.active_count + EXCLUDED.active_count,
+            completed_count = user_staking_summary.completed_count + EXCLUDED.completed_count,
+            total_reward_accrued = user_staking_summary.total_reward_accrued + EXCLUDED.total_reward_accrued,
+            updated_at = EXCLUDED.updated_at
+    )
+    SELECT a.id AS position_id, a.reward::text AS reward
+    FROM amt a JOIN upd u ON u.id = a.id
+    WHERE a.reward > 0
+""")
+
+
+def _accrue_all_set_based(db: Session, now: datetime) -> list[dict]:
+    rows = db.execute(_SET_BASED_ACCRUAL_SQL, {"now": now}).mappings().all()
+    return [{"position_id": r["position_id"], "reward": r["reward"]} for r in rows]
@@ -0,0 +1,231 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from decimal import Decimal
+from typing import Any, Optional
+
+from sqlalchemy import text
+
+# Public /stats snapshot.
+#
+# The landing page and the bot poll /stats constantly, so the numbers are computed by a
+# background refresher every REFRESH_SECONDS on the shared engine and served from memory.
+# One statement, no scans of the big tables:
+#   positions_total / positions_active / tvl_principal  sums over user_staking_summary
+#     (tvl_principal is principal_staked: CREATED/ACTIVE/COMPLETED, i.e. not yet unstaked)
+#   rewards_rows / events_rows  pg_class.reltuples (planner estimates) of the monthly partitions
+#     (a partitioned parent's own reltuples already covers them, so only plain tables count)
+#   last_event_at               max(occurred_at) on its index
+#   last_reward_at              created_at of the newest accrual row (period_end index)
+#   last_accrual_at             newest accrual period_end or pool reward_index_at
+# The body is rendered once per refresh. Its ETag is weak and covers everything but `ts`,
+# so a client revalidating with If-None-Match gets 304 until a number actually changes.
+# Without a running refresher (or when the snapshot is older than stale_after, 3 intervals
+# by default) the next request refreshes inline; concurrent requests wait for that one.
+
+log = logging.getLogger("staking.stats_snapshot")
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name) or default)
+    except Exception:
+        return default
+
+
+REFRESH_SECONDS = max(_env_int("PUBLIC_STATS_REFRESH_SECONDS", 30), 1)
+
+
+def utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+_STATS_SQL = text("""
+    WITH summary AS (
+        SELECT COALESCE(sum(positions_count), 0) AS positions_total,
+               COALESCE(sum(active_count), 0) AS positions_active,
+               COALESCE(sum(principal_staked), 0) AS tvl_principal
+        FROM user_staking_summary
+    ),
+    last_accrual AS (
+        SELECT created_at, period_end FROM staking_rewards
+        WHERE period_end IS NOT NULL
+        ORDER BY period_end DESC
+        LIMIT 1
+    )
+    SELECT
+        (SELECT count(*) FROM staking_pools) AS pools,
+        s.positions_total,
+        s.positions_active,
+        (SELECT sum(GREATEST(c.reltuples, 0))::bigint FROM pg_class c
+         WHERE c.relkind = 'r'
+           AND (c.oid = to_regclass('staking_rewards')
+                OR c.oid IN (SELECT inhrelid FROM pg_inherits WHERE inhparent = to_regclass('staking_rewards')))
+        ) AS rewards_rows,
+        (SELECT sum(GREATEST(c.reltuples, 0))::bigint FROM pg_class c
+         WHERE c.relkind = 'r'
+           AND (c.oid = to_regclass('staking_events')
+                OR c.oid IN (SELECT inhrelid FROM pg_inherits WHERE inhparent = to_regclass('staking_events')))
+        ) AS events_rows,
+        (SELECT created_at FROM last_accrual) AS last_reward_at,
+        (SELECT max(occurred_at) FROM staking_events) AS last_event_at,
+        GREATEST(
+            (SELECT period_end FROM last_accrual),
+            (SELECT max(reward_index_at) FROM staking_pools)
+        ) AS last_accrual_at,
+        s.tvl_principal::text AS tvl_principal
+    FROM summary s
+""")
+
+
+def _meta() -> dict[str, Any]:
+    return {
+        "service": os.getenv("RAILWAY_SERVICE_NAME") or "BOT_FACTORY",
+        "env": os.getenv("RAILWAY_ENVIRONMENT") or os.getenv("RAILWAY_ENVIRONMENT_NAME"),
+        "git_sha": os.getenv("RAILWAY_GIT_COMMIT_SHA") or os.getenv("GIT_SHA"),
+    }
+
+
+def _json_default(v: Any) -> Any:
+    if isinstance(v, datetime):
+        return v.isoformat()
+    if isinstance(v, Decimal):
+        return str(v)
+    raise TypeError(f"not JSON serializable: {type(v).__name__}")
+
+
+@dataclass(frozen=True)
+class Snapshot:
+    refreshed_at: datetime
+    payload: dict
+    body: bytes
+    etag: str
+    monotonic: float
+
+    @property
+    def age_seconds(self) -> float:
+        return time.monotonic() - self.monotonic
+
+
+def _collect() -> tuple[dict, dict]:
+    """(db, staking) sections. Never raises: failures are reported in `db`, as /stats always did."""
+    if not (os.getenv("DATABASE_URL") or "").strip():
+        return {"connected": False, "reason": "DATABASE_URL_missing"}, {}
+    try:
+        from app.db import ENGINE
+
+        with ENGINE.connect() as conn:
+            row = conn.execute(_STATS_SQL).mappings().one()
+        staking = dict(row)
+        staking["rows_estimated"] = True
+        return {"connected": True}, staking
+    except Exception as e:
+        return {"connected": False, "error": str(e)[:500]}, {}
+
+
+def build_snapshot() -> Snapshot:
+    db, staking = _collect()
+    content = {"ok": True, **_meta(), "db": db, "staking": staking}
+    digest = hashlib.sha1(json.dumps(content, sort_keys=True, default=_json_default).encode()).hexdigest()[:20]
+
+    now = utcnow()
+    payload = {"ok": True, "ts": now, **{k: v for k, v in content.items() if k != "ok"}}
+    return Snapshot(
+        refreshed_at=now,
+        payload=payload,
+        body=json.dumps(payload, default=_json_default).encode(),
+        etag=f'W/"{digest}"',
+        monotonic=time.monotonic(),
+    )
+
+
+class StatsSnapshot:
+    def __init__(self, interval: float = REFRESH_SECONDS, stale_after: Optional[float] = None) -> None:
+        self.interval = float(interval)
+        self.stale_after = float(stale_after) if stale_after is not None else 3 * self.interval
+        self._current: Optional[Snapshot] = None
+        self._lock = threading.Lock()
+        self._loop_task: Optional[asyncio.Task] = None
+        self._stop = asyncio.Event()
+
+        self.refreshes = 0
+        self.inline_refreshes = 0
+        self.last_refresh_seconds: Optional[float] = None
+
+    def _refresh_locked(self) -> Snapshot:
+        t0 = time.perf_counter()
+        snap = build_snapshot()
+        self.last_refresh_seconds = round(time.perf_counter() - t0, 4)
+        if "error" in snap.payload["db"]:
+            log.warning("stats snapshot: refresh failed: %s", snap.payload["db"]["error"][:200])
+        self._current = snap
+        self.refreshes += 1
+        return snap
+
+    def refresh(self) -> Snapshot:
+        with self._lock:
+            return self._refresh_locked()
+
+    def current(self) -> Snapshot:
+        snap = self._current
+        if snap is not None and snap.age_seconds <= self.stale_after:
+            return snap
+        with self._lock:
+            # another request may have refreshed while this one waited
+            snap = self._current
+            if snap is not None and snap.age_seconds <= self.stale_after:
+                return snap
+            self.inline_refreshes += 1
+            return self._refresh_locked()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._current = None
+
+    # -- background refresh --
+
+    async def _loop(self) -> None:
+        while not self._stop.is_set():
+            try:
+                await asyncio.to_thread(self.refresh)
+            except Exception:
+                log.exception("stats snapshot: refresh failed")
+            try:
+                await asyncio.wait_for(self._stop.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self) -> None:
+        if self._loop_task is None:
+            self._stop.clear()
+            self._loop_task = asyncio.create_task(self._loop())
+            log.info("stats snapshot refresher started: interval=%ss", self.interval)
+
+    async def stop(self) -> None:
+        self._stop.set()
+        if self._loop_task is not None:
+            await self._loop_task
+            self._loop_task = None
+
+    def status(self) -> dict:
+        snap = self._current
+        return {
+            "running": self._loop_task is not None,
+            "interval_seconds": self.interval,
+            "refreshes": self.refreshes,
+            "inline_refreshes": self.inline_refreshes,
+            "last_refresh_seconds": self.last_refresh_seconds,
+            "refreshed_at": snap.refreshed_at.isoformat() if snap else None,
+            "etag": snap.etag if snap else None,
+        }
+
+
+STATS = StatsSnapshot()
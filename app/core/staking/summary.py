@@ -0,0 +1,260 @@
+from __future__ import annotations
+
+from datetime import datetime, timezone
+from decimal import Decimal
+from typing import Optional
+
+from sqlalchemy import bindparam, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from app.core.staking.fixed_point import from_units, to_units
+from app.models_staking import StakingPositionState, UserStakingSummary
+
+# Maintained per-(user, pool) aggregates of staking_positions.
+#
+# Every writer that changes a position's state, principal, accrued or claimed total adds
+# the matching delta to user_staking_summary in the same transaction: ORM paths collect
+# them in a SummaryDeltas and apply one multi-row upsert (keys sorted, so concurrent
+# writers lock summary rows in the same order); the set-based accrual statement carries
+# its own upsert CTE. A position contributes
+#   positions_count 1, <state>_count 1, principal_total principal,
+#   principal_staked principal while CREATED/ACTIVE/COMPLETED,
+#   total_reward_accrued / total_reward_claimed as on the row.
+# verify_batch recomputes a keyset batch of users from staking_positions and can repair
+# drift; see verify_summaries / tools/verify_staking_summary.py.
+
+STATE_COLUMNS = {s.value: f"{s.value.lower()}_count" for s in StakingPositionState}
+OPEN_STATES = (
+    StakingPositionState.CREATED.value,
+    StakingPositionState.ACTIVE.value,
+    StakingPositionState.COMPLETED.value,
+)
+COUNT_COLUMNS = ("positions_count",) + tuple(STATE_COLUMNS.values())
+AMOUNT_COLUMNS = ("principal_staked", "principal_total", "total_reward_accrued", "total_reward_claimed")
+COLUMNS = COUNT_COLUMNS + AMOUNT_COLUMNS
+
+DEFAULT_VERIFY_BATCH = 500
+
+
+def utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class SummaryDeltas:
+    """Pending summary changes of one transaction, keyed by (user_telegram_id, pool_id)."""
+
+    def __init__(self) -> None:
+        # amounts are kept in integer 1e-18 units: exact, and zero-sum entries drop out
+        self._deltas: dict[tuple[int, str], dict[str, int]] = {}
+
+    def __len__(self) -> int:
+        return len(self._deltas)
+
+    def add(self, user_telegram_id: int, pool_id: str, **cols: int | Decimal) -> None:
+        d = self._deltas.setdefault((int(user_telegram_id), pool_id), dict.fromkeys(COLUMNS, 0))
+        for col, val in cols.items():
+            d[col] += val if col in COUNT_COLUMNS else to_units(val)
+
+    def opened(self, user_telegram_id: int, pool_id: str, state: str, principal: Decimal) -> None:
+        cols = {"positions_count": 1, STATE_COLUMNS[state]: 1, "principal_total": principal}
+        if state in OPEN_STATES:
+            cols["principal_staked"] = principal
+        self.add(user_telegram_id, pool_id, **cols)
+
+    def transition(self, user_telegram_id: int, pool_id: str, old: str, new: str, principal: Decimal) -> None:
+        if old == new:
+            return
+        cols: dict = {STATE_COLUMNS[old]: -1, STATE_COLUMNS[new]: 1}
+        if (old in OPEN_STATES) != (new in OPEN_STATES):
+            cols["principal_staked"] = principal if new in OPEN_STATES else -principal
+        self.add(user_telegram_id, pool_id, **cols)
+
+    def accrued(self, user_telegram_id: int, pool_id: str, amount: Decimal) -> None:
+        self.add(user_telegram_id, pool_id, total_reward_accrued=amount)
+
+    def claimed(self, user_telegram_id: int, pool_id: str, amount: Decimal) -> None:
+        self.add(user_telegram_id, pool_id, total_reward_claimed=amount)
+
+    def apply(self, db) -> int:
+        """
+        One upsert for all non-zero deltas (db: Session or Connection; same transaction as the
+        position writes). Returns the number of summary rows touched. Clears the pending set.
+        """
+        rows = []
+        now = utcnow()
+        for (uid, pool_id), d in sorted(self._deltas.items()):
+            if not any(d.values()):
+                continue
+            row = {"user_telegram_id": uid, "pool_id": pool_id, "updated_at": now}
+            row.update({c: d[c] for c in COUNT_COLUMNS})
+            row.update({c: from_units(d[c]) for c in AMOUNT_COLUMNS})
+            rows.append(row)
+        self._deltas.clear()
+        if not rows:
+            return 0
+
+        stmt = pg_insert(UserStakingSummary).values(rows)
+        t = UserStakingSummary.__table__
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[t.c.user_telegram_id, t.c.pool_id],
+            set_={**{c: t.c[c] + stmt.excluded[c] for c in COLUMNS}, "updated_at": stmt.excluded.updated_at},
+        )
+        db.execute(stmt)
+        return len(rows)
+
+
+def get_user_summary(db, telegram_id: int) -> list[dict]:
+    """All of a user's summary rows (primary-key range on user_telegram_id)."""
+    rows = db.execute(
+        text(f"""
+            SELECT pool_id, {', '.join(COLUMNS)}, updated_at
+            FROM user_staking_summary
+            WHERE user_telegram_id = :uid
+            ORDER BY pool_id
+        """),
+        {"uid": int(telegram_id)},
+    ).mappings().all()
+    return [dict(r) for r in rows]
+
+
+# -- verification --
+
+_NEXT_USERS_SQL = text("""
+    SELECT u FROM (
+        (SELECT DISTINCT user_telegram_id AS u FROM staking_positions
+         WHERE user_telegram_id > :after ORDER BY 1 LIMIT :batch)
+        UNION
+        (SELECT DISTINCT user_telegram_id FROM user_staking_summary
+         WHERE user_telegram_id > :after ORDER BY 1 LIMIT :batch)
+    ) x
+    ORDER BY u
+    LIMIT :batch
+""")
+
+_LOCK_SQL = text("""
+    SELECT user_telegram_id, pool_id FROM user_staking_summary
+    WHERE user_telegram_id IN :users
+    ORDER BY user_telegram_id, pool_id
+    FOR UPDATE
+""").bindparams(bindparam("users", expanding=True))
+
+_state_aggs = ",\n".join(
+    f"count(*) FILTER (WHERE state = '{state}') AS {col}" for state, col in STATE_COLUMNS.items()
+)
+_open = ", ".join(f"'{s}'" for s in OPEN_STATES)
+_pairs = ",\n".join(f"e.{c} AS e_{c}, s.{c} AS s_{c}" for c in COLUMNS)
+_e_row = ", ".join(f"e.{c}" for c in COLUMNS)
+_s_row = ", ".join(f"s.{c}" for c in COLUMNS)
+
+# expected vs stored in one statement, so both sides come from the same snapshot
+_COMPARE_SQL = text(f"""
+    WITH expected AS (
+        SELECT user_telegram_id, pool_id,
+               count(*) AS positions_count,
+               {_state_aggs},
+               COALESCE(sum(principal_amount) FILTER (WHERE state IN ({_open})), 0) AS principal_staked,
+               sum(principal_amount) AS principal_total,
+               sum(total_reward_accrued) AS total_reward_accrued,
+               sum(total_reward_claimed) AS total_reward_claimed
+        FROM staking_positions
+        WHERE user_telegram_id IN :users
+        GROUP BY user_telegram_id, pool_id
+    ),
+    stored AS (
+        SELECT * FROM user_staking_summary WHERE user_telegram_id IN :users
+    )
+    SELECT COALESCE(e.user_telegram_id, s.user_telegram_id) AS user_telegram_id,
+           COALESCE(e.pool_id, s.pool_id) AS pool_id,
+           e.user_telegram_id IS NOT NULL AS has_expected,
+           s.user_telegram_id IS NOT NULL AS has_stored,
+           {_pairs}
+    FROM expected e
+    FULL JOIN stored s ON s.user_telegram_id = e.user_telegram_id AND s.pool_id = e.pool_id
+    WHERE ROW({_e_row}) IS DISTINCT FROM ROW({_s_row})
+    ORDER BY 1, 2
+""").bindparams(bindparam("users", expanding=True))
+
+
+def _side(r, prefix: str, present: bool) -> Optional[dict]:
+    if not present:
+        return None
+    return {c: int(r[prefix + c]) if c in COUNT_COLUMNS else Decimal(r[prefix + c]) for c in COLUMNS}
+
+
+def verify_batch(db, after: int = 0, batch: int = DEFAULT_VERIFY_BATCH, fix: bool = False) -> dict:
+    """
+    Recompute the summaries of the next `batch` users (user_telegram_id > after) and compare.
+    fix=True rewrites drifted rows: existing summary rows are locked first (writers lock
+    positions, then summary rows, so a writer that hasn't applied its delta yet is invisible
+    on both sides); missing rows are inserted ON CONFLICT DO NOTHING, since a writer may be
+    creating them right now. Commit is the caller's. last_user is None when there are no
+    more users.
+    """
+    users = [int(u) for u in db.execute(_NEXT_USERS_SQL, {"after": int(after), "batch": int(batch)}).scalars()]
+    if not users:
+        return {"last_user": None, "users": 0, "mismatched": 0, "fixed": 0, "sample": []}
+    if fix:
+        db.execute(_LOCK_SQL, {"users": users}).all()
+
+    mismatched = [
+        {
+            "user_telegram_id": int(r["user_telegram_id"]),
+            "pool_id": r["pool_id"],
+            "expected": _side(r, "e_", r["has_expected"]),
+            "stored": _side(r, "s_", r["has_stored"]),
+        }
+        for r in db.execute(_COMPARE_SQL, {"users": users}).mappings()
+    ]
+
+    fixed = 0
+    if fix and mismatched:
+        t = UserStakingSummary.__table__
+        now = utcnow()
+        for m in mismatched:
+            key = (t.c.user_telegram_id == m["user_telegram_id"]) & (t.c.pool_id == m["pool_id"])
+            if m["expected"] is None:
+                db.execute(t.delete().where(key))
+            elif m["stored"] is None:
+                db.execute(
+                    pg_insert(t)
+                    .values(user_telegram_id=m["user_telegram_id"], pool_id=m["pool_id"], updated_at=now, **m["expected"])
+                    .on_conflict_do_nothing()
+                )
+            else:
+                db.execute(t.update().where(key).values(updated_at=now, **m["expected"]))
+            fixed += 1
+
+    return {
+        "last_user": users[-1],
+        "users": len(users),
+        "mismatched": len(mismatched),
+        "fixed": fixed,
+        "sample": mismatched[:5],
+    }
+
+
+def verify_summaries(
+    session_factory,
+    fix: bool = False,
+    batch: int = DEFAULT_VERIFY_BATCH,
+    after: int = 0,
+) -> dict:
+    """Walk all users in keyset batches, one short transaction each. Resumable via `after`."""
+    stats = {"batches": 0, "users": 0, "mismatched": 0, "fixed": 0, "sample": []}
+    while True:
+        db = session_factory()
+        try:
+            res = verify_batch(db, after=after, batch=batch, fix=fix)
+            db.commit()
+        finally:
+            db.close()
+        if res["last_user"] is None:
+            break
+        after = res["last_user"]
+        stats["batches"] += 1
+        stats["users"] += res["users"]
+        stats["mismatched"] += res["mismatched"]
+        stats["fixed"] += res["fixed"]
+        stats["sample"] = (stats["sample"] + res["sample"])[:5]
+    stats["last_user"] = after
+    return stats
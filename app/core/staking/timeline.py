@@ -0,0 +1,139 @@
+from __future__ import annotations
+
+from datetime import datetime, timezone
+from typing import Iterator, Optional
+
+from sqlalchemy import select, tuple_, union_all
+from sqlalchemy.engine import Engine
+
+from app.core.staking.service import decode_position_cursor as decode_cursor
+from app.core.staking.service import encode_position_cursor as encode_cursor
+from app.models_staking import StakingEvent, StakingEventType
+
+# Staking event timeline (support / exports).
+#
+# Newest first, keyset on (occurred_at, id) DESC; every page is an ordered index range scan
+# of at most limit + 1 rows, however many events the user has:
+#   telegram_id              ix_staking_events_user_time       (user, occurred_at, id)
+#   telegram_id + types      ix_staking_events_user_type_time  (user, event_type, occurred_at, id),
+#                            one range per type, merged (Merge Append) - no sort, no filter scan
+#   position_id [+ anything] ix_staking_events_position_time   (position, occurred_at, id),
+#                            remaining conditions filter that position's events
+# iter_event_pages runs one short query per page (no long-lived transaction or server cursor),
+# so a full export holds one page in memory. Events are append-only; anything committed
+# after an export started is newer than its cursor and is not included.
+# staking_events is partitioned by month on occurred_at: months are read newest first (ordered
+# Append) and a page stops in the first months that fill it; the plain occurred_at bound next
+# to the row comparison lets the planner prune the months after the cursor.
+
+# the enum plus what the set-based / chunked accrual paths write
+EVENT_TYPES = tuple(t.value for t in StakingEventType) + ("ACCRUAL", "REWARD_ACCRUED")
+
+MAX_PAGE_SIZE = 1000
+EXPORT_PAGE_SIZE = 1000
+
+_COLUMNS = tuple(
+    StakingEvent.__table__.c[name]
+    for name in (
+        "id", "seq", "event_type", "user_telegram_id", "pool_id", "position_id", "request_id",
+        "occurred_at", "actor_type", "actor_id", "amount", "details",
+    )
+)
+
+
+def parse_before(before: Optional[str]) -> Optional[tuple[datetime, str]]:
+    """A cursor from a previous page, or an ISO timestamp (events strictly before it)."""
+    if not before:
+        return None
+    try:
+        at = datetime.fromisoformat(before.replace("Z", "+00:00"))
+    except ValueError:
+        return decode_cursor(before)
+    if at.tzinfo is None:
+        at = at.replace(tzinfo=timezone.utc)
+    return at, ""
+
+
+def _query(telegram_id, position_id, types, before, limit):
+    t = StakingEvent.__table__
+    key = (t.c.occurred_at.desc(), t.c.id.desc())
+
+    def page(*conds):
+        q = select(*_COLUMNS).where(*conds)
+        if before is not None:
+            q = q.where(t.c.occurred_at <= before[0], tuple_(t.c.occurred_at, t.c.id) < tuple_(*before))
+        return q.order_by(*key).limit(limit)
+
+    if position_id is not None:
+        conds = [t.c.position_id == position_id]
+        if telegram_id is not None:
+            conds.append(t.c.user_telegram_id == int(telegram_id))
+        if types:
+            conds.append(t.c.event_type.in_(types) if len(types) > 1 else t.c.event_type == types[0])
+        return page(*conds)
+
+    user = t.c.user_telegram_id == int(telegram_id)
+    if not types:
+        return page(user)
+    if len(types) == 1:
+        return page(user, t.c.event_type == types[0])
+    merged = union_all(*(page(user, t.c.event_type == ty) for ty in types)).subquery()
+    return select(merged).order_by(merged.c.occurred_at.desc(), merged.c.id.desc()).limit(limit)
+
+
+def _validate(telegram_id, position_id, types, limit) -> list[str]:
+    if telegram_id is None and position_id is None:
+        raise ValueError("telegram_id or position_id required")
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        raise ValueError(f"limit must be between 1 and {MAX_PAGE_SIZE}")
+    types = list(dict.fromkeys(types or ()))
+    for ty in types:
+        if ty not in EVENT_TYPES:
+            raise ValueError(f"Unknown event type: {ty}")
+    return types
+
+
+def list_events(
+    db,
+    telegram_id: Optional[int] = None,
+    position_id: Optional[str] = None,
+    types: Optional[list[str]] = None,
+    limit: int = 100,
+    before: Optional[str] = None,
+) -> tuple[list[dict], Optional[str]]:
+    """One page of events, newest first, as column dicts. Returns (rows, next cursor or None)."""
+    types = _validate(telegram_id, position_id, types, limit)
+    q = _query(telegram_id, position_id, types, parse_before(before), limit + 1)
+    rows = [dict(r) for r in db.execute(q).mappings()]
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]["occurred_at"], rows[-1]["id"])
+    return rows, next_cursor
+
+
+def _pages(engine: Engine, telegram_id, position_id, types, key, page_size) -> Iterator[list[dict]]:
+    while True:
+        with engine.connect() as conn:
+            rows = conn.execute(_query(telegram_id, position_id, types, key, page_size)).mappings().all()
+        if rows:
+            yield [dict(r) for r in rows]
+        if len(rows) < page_size:
+            return
+        key = (rows[-1]["occurred_at"], rows[-1]["id"])
+
+
+def iter_event_pages(
+    engine: Engine,
+    telegram_id: Optional[int] = None,
+    position_id: Optional[str] = None,
+    types: Optional[list[str]] = None,
+    before: Optional[str] = None,
+    page_size: int = EXPORT_PAGE_SIZE,
+) -> Iterator[list[dict]]:
+    """
+    Every matching event, newest first, in pages of `page_size` (one short query each).
+    Arguments are checked here (ValueError), before the first page is pulled.
+    """
+    types = _validate(telegram_id, position_id, types, page_size)
+    return _pages(engine, telegram_id, position_id, types, parse_before(before), page_size)
@@ -0,0 +1,385 @@
+from __future__ import annotations
+
+from datetime import datetime
+from decimal import Decimal
+from typing import Optional
+
+from sqlalchemy import Integer, desc, func, insert, literal, select, text, true, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.engine import Row
+from sqlalchemy.orm import Session
+
+from app.models_investments import Deposit, RedemptionRequest, SLHBalance, SLHLedger
+
+# pg_advisory_xact_lock(DECISION_KEY_LOCK_NS, hashtext(key)) serialises approvals reusing a decision key
+DECISION_KEY_LOCK_NS = 912345690
+
+
+def slh_balance(db: Session, user_id: int) -> Decimal:
+    # primary-key lookup on the maintained balance (no SUM over slh_ledger)
+    val = db.execute(select(SLHBalance.balance_slh).where(SLHBalance.user_id == user_id)).scalar_one_or_none()
+    return Decimal(str(val)) if val is not None else Decimal("0")
+
+
+def apply_slh_deltas(db: Session, deltas: dict[int, Decimal]) -> dict[int, Decimal]:
+    """
+    Add per-user deltas to slh_balances with one multi-row upsert.
+    Must run in the same transaction as the SLHLedger rows it mirrors.
+    Returns {user_id: new_balance}.
+    """
+    if not deltas:
+        return {}
+
+    now = datetime.utcnow()
+    # sorted -> rows are locked in a deterministic order across concurrent writers
+    rows = [{"user_id": int(uid), "balance_slh": deltas[uid], "updated_at": now} for uid in sorted(deltas)]
+    stmt = pg_insert(SLHBalance).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[SLHBalance.user_id],
+        set_={
+            "balance_slh": SLHBalance.balance_slh + stmt.excluded.balance_slh,
+            "updated_at": stmt.excluded.updated_at,
+        },
+    ).returning(SLHBalance.user_id, SLHBalance.balance_slh)
+
+    return {int(uid): Decimal(str(bal)) for uid, bal in db.execute(stmt).all()}
+
+
+def post_slh(
+    db: Session,
+    user_id: int,
+    amount: Decimal,
+    reason: str,
+    ref_type: Optional[str] = None,
+    ref_id: Optional[int] = None,
+) -> Decimal:
+    """Insert one SLHLedger row and return the user's new balance (caller commits)."""
+    db.add(
+        SLHLedger(
+            user_id=user_id,
+            amount_slh=amount,
+            reason=reason,
+            ref_type=ref_type,
+            ref_id=ref_id,
+        )
+    )
+    return apply_slh_deltas(db, {user_id: amount})[int(user_id)]
+
+
+def activity_page(
+    db: Session,
+    user_id: int,
+    limit: int,
+    before_id: Optional[int] = None,
+) -> tuple[Decimal, list[Row], Optional[int]]:
+    """
+    One round-trip: balance + one page of ledger rows (id desc) + next cursor.
+    Rows are column projections (id, created_at, amount_slh, reason, ref_type, ref_id).
+    """
+    page = select(
+        SLHLedger.id,
+        SLHLedger.created_at,
+        SLHLedger.amount_slh,
+        SLHLedger.reason,
+        SLHLedger.ref_type,
+        SLHLedger.ref_id,
+    ).where(SLHLedger.user_id == user_id)
+    if before_id is not None:
+        page = page.where(SLHLedger.id < before_id)
+    # fetch one extra row to know whether another page exists
+    page = page.order_by(desc(SLHLedger.id)).limit(limit + 1).subquery("page")
+
+    # one-row anchor so the balance comes back even when the page is empty
+    anchor = select(literal(user_id, Integer).label("user_id")).subquery("u")
+
+    q = (
+        select(SLHBalance.balance_slh, *page.c)
+        .select_from(anchor)
+        .outerjoin(SLHBalance, SLHBalance.user_id == anchor.c.user_id)
+        .outerjoin(page, true())
+        .order_by(desc(page.c.id))
+    )
+    rows = db.execute(q).all()
+
+    bal = rows[0].balance_slh if rows else None
+    balance = Decimal(str(bal)) if bal is not None else Decimal("0")
+
+    items = [r for r in rows if r.id is not None]
+    next_before_id = None
+    if len(items) > limit:
+        items = items[:limit]
+        next_before_id = items[-1].id
+
+    return balance, items, next_before_id
+
+
+def queue_query(model, columns, status: str, user_id: Optional[int] = None, after_id: Optional[int] = None, limit: Optional[int] = None):
+    """
+    Keyset page over an admin queue (deposits / redemption_requests), id desc.
+    Served by the (status, id) and (user_id, status, id) indexes.
+    """
+    q = select(*columns).where(model.status == status)
+    if user_id is not None:
+        q = q.where(model.user_id == user_id)
+    if after_id is not None:
+        q = q.where(model.id < after_id)
+    q = q.order_by(desc(model.id))
+    if limit is not None:
+        q = q.limit(limit)
+    return q
+
+
+def estimate_status_counts(db: Session, model) -> dict:
+    """
+    Approximate row counts per status from planner statistics (pg_stats MCV list),
+    so the back-office can show queue sizes without a count(*) per request.
+    Falls back to an exact GROUP BY (index-only on (status, id)) when the table has not been analyzed.
+    """
+    table = model.__tablename__
+    row = db.execute(
+        text(
+            """
+            SELECT s.most_common_vals::text::text[] AS vals,
+                   s.most_common_freqs AS freqs,
+                   -- scale last-ANALYZE density to the current size, as the planner does
+                   CASE WHEN c.relpages > 0
+                        THEN c.reltuples / c.relpages * (pg_relation_size(c.oid) / current_setting('block_size')::int)
+                        ELSE c.reltuples
+                   END AS reltuples
+            FROM pg_stats s
+            JOIN pg_class c ON c.oid = to_regclass(quote_ident(s.schemaname) || '.' || quote_ident(s.tablename))
+            WHERE s.schemaname = current_schema()
+              AND s.tablename = :t
+              AND s.attname = 'status'
+            """
+        ),
+        {"t": table},
+    ).mappings().first()
+
+    if row and row["vals"] and row["reltuples"] is not None and row["reltuples"] >= 0:
+        total = float(row["reltuples"])
+        counts = {v: int(round(f * total)) for v, f in zip(row["vals"], row["freqs"])}
+        return {"estimated": True, "total": int(total), "counts": counts}
+
+    exact = db.execute(select(model.status, func.count()).group_by(model.status)).all()
+    counts = {s: int(n) for s, n in exact}
+    return {"estimated": False, "total": sum(counts.values()), "counts": counts}
+
+
+def confirm_deposits(
+    db: Session,
+    slh_per_ils: Decimal,
+    deposit_ids: Optional[list[int]] = None,
+    user_id: Optional[int] = None,
+    created_before: Optional[datetime] = None,
+    limit: int = 1000,
+) -> list[dict]:
+    """
+    Confirm many pending deposits in the caller's transaction (caller commits).
+
+    Rows are claimed with FOR UPDATE SKIP LOCKED, so concurrent batches (or a single
+    confirm racing a batch) never block each other or double-mint. All mint rows go in
+    with one multi-row insert and balances with one upsert.
+    Returns one result per confirmed deposit, plus one per explicitly requested id that was skipped.
+    """
+    q = select(Deposit.id, Deposit.user_id, Deposit.amount_ils).where(Deposit.status == "pending")
+    if deposit_ids is not None:
+        q = q.where(Deposit.id.in_(deposit_ids))
+    if user_id is not None:
+        q = q.where(Deposit.user_id == user_id)
+    if created_before is not None:
+        q = q.where(Deposit.created_at < created_before)
+    q = q.order_by(Deposit.id).limit(limit).with_for_update(skip_locked=True)
+    locked = db.execute(q).all()
+
+    results: list[dict] = []
+    if locked:
+        now = datetime.utcnow()
+        ids = [d.id for d in locked]
+        db.execute(
+            update(Deposit)
+            .where(Deposit.id.in_(ids))
+            .values(status="confirmed", confirmed_at=now)
+            .execution_options(synchronize_session=False)
+        )
+
+        minted = {d.id: d.amount_ils * slh_per_ils for d in locked}
+        db.execute(
+            insert(SLHLedger),
+            [
+                {
+                    "user_id": d.user_id,
+                    "amount_slh": minted[d.id],
+                    "reason": "deposit_reward",
+                    "ref_type": "deposit",
+                    "ref_id": d.id,
+                    "created_at": now,
+                }
+                for d in locked
+            ],
+        )
+
+        deltas: dict[int, Decimal] = {}
+        for d in locked:
+            deltas[d.user_id] = deltas.get(d.user_id, Decimal("0")) + minted[d.id]
+        balances = apply_slh_deltas(db, deltas)
+
+        for d in locked:
+            results.append(
+                {
+                    "deposit_id": d.id,
+                    "user_id": d.user_id,
+                    "result": "confirmed",
+                    "minted_slh": str(minted[d.id]),
+                    "new_balance": str(balances[int(d.user_id)]),
+                }
+            )
+
+    if deposit_ids:
+        done = {d.id for d in locked}
+        missing = [i for i in dict.fromkeys(deposit_ids) if i not in done]
+        if missing:
+            states = dict(db.execute(select(Deposit.id, Deposit.status).where(Deposit.id.in_(missing))).all())
+            for i in missing:
+                st = states.get(i)
+                if st is None:
+                    results.append({"deposit_id": i, "result": "not_found"})
+                elif st == "pending":
+                    # held by a concurrent confirm (skipped), or cut by limit
+                    results.append({"deposit_id": i, "result": "skipped", "state": st})
+                else:
+                    results.append({"deposit_id": i, "result": "not_pending", "state": st})
+
+    return results
+
+
+def lock_slh_balances(db: Session, user_ids: list[int]) -> dict[int, Decimal]:
+    """
+    Row-lock the users' slh_balances rows (created at 0 if missing), in user_id order,
+    and return {user_id: balance}. Serialises balance-checked debits per user only.
+    """
+    uids = sorted({int(u) for u in user_ids})
+    if not uids:
+        return {}
+
+    now = datetime.utcnow()
+    db.execute(
+        pg_insert(SLHBalance)
+        .values([{"user_id": u, "balance_slh": Decimal("0"), "updated_at": now} for u in uids])
+        .on_conflict_do_nothing(index_elements=[SLHBalance.user_id])
+    )
+    rows = db.execute(
+        select(SLHBalance.user_id, SLHBalance.balance_slh)
+        .where(SLHBalance.user_id.in_(uids))
+        .order_by(SLHBalance.user_id)
+        .with_for_update()
+    ).all()
+    return {int(u): Decimal(str(b)) for u, b in rows}
+
+
+def approve_redeems(db: Session, items: list[tuple[int, Optional[str]]], admin_id: int = 0) -> list[dict]:
+    """
+    Approve redemption requests in the caller's transaction (caller commits).
+
+    items: (redeem_id, idempotency_key or None). Lock order is decision keys (advisory,
+    key order), then redeem rows (id order), then balance rows (user_id order), so single
+    and batch approvals cannot deadlock or overdraw, and two approvals reusing one key
+    for different redeems see each other's claim instead of racing on the unique index. Replaying a key that already approved the same redeem returns the
+    original outcome with idempotent=True.
+    """
+    keys_by_id: dict[int, Optional[str]] = {}
+    for rid, key in items:
+        keys_by_id.setdefault(int(rid), key)
+    ids = sorted(keys_by_id)
+    if not ids:
+        return []
+
+    keys = sorted({k for k in keys_by_id.values() if k})
+    for k in keys:
+        db.execute(
+            text("SELECT pg_advisory_xact_lock(:ns, hashtext(:key))"), {"ns": DECISION_KEY_LOCK_NS, "key": k}
+        )
+
+    rows = db.execute(
+        select(
+            RedemptionRequest.id,
+            RedemptionRequest.user_id,
+            RedemptionRequest.slh_amount,
+            RedemptionRequest.status,
+            RedemptionRequest.decision_key,
+        )
+        .where(RedemptionRequest.id.in_(ids))
+        .order_by(RedemptionRequest.id)
+        .with_for_update()
+    ).all()
+    by_id = {r.id: r for r in rows}
+
+    key_owner: dict[str, int] = {}
+    if keys:
+        key_owner = dict(
+            db.execute(
+                select(RedemptionRequest.decision_key, RedemptionRequest.id).where(RedemptionRequest.decision_key.in_(keys))
+            ).all()
+        )
+
+    balances = lock_slh_balances(db, [r.user_id for r in rows if r.status == "requested"])
+
+    now = datetime.utcnow()
+    results: list[dict] = []
+    updates: list[dict] = []
+    ledger: list[dict] = []
+    deltas: dict[int, Decimal] = {}
+
+    for rid in ids:
+        key = keys_by_id[rid]
+        r = by_id.get(rid)
+        if r is None:
+            results.append({"redeem_id": rid, "result": "not_found"})
+            continue
+        if key and key_owner.get(key, rid) != rid:
+            results.append({"redeem_id": rid, "result": "key_conflict", "state": r.status})
+            continue
+        if key and r.status == "approved" and r.decision_key == key:
+            results.append(
+                {"redeem_id": rid, "user_id": r.user_id, "result": "approved", "idempotent": True, "debited_slh": str(r.slh_amount)}
+            )
+            continue
+        if r.status != "requested":
+            results.append({"redeem_id": rid, "result": "not_requested", "state": r.status})
+            continue
+
+        bal = balances[int(r.user_id)]
+        if r.slh_amount > bal:
+            results.append({"redeem_id": rid, "user_id": r.user_id, "result": "insufficient", "balance": str(bal)})
+            continue
+
+        balances[int(r.user_id)] = bal - r.slh_amount
+        if key:
+            key_owner[key] = rid
+        deltas[int(r.user_id)] = deltas.get(int(r.user_id), Decimal("0")) - r.slh_amount
+        updates.append(
+            {"id": rid, "status": "approved", "decided_by_admin": admin_id, "decided_at": now, "decision_key": key}
+        )
+        ledger.append(
+            {
+                "user_id": r.user_id,
+                "amount_slh": Decimal("0") - r.slh_amount,
+                "reason": "redeem",
+                "ref_type": "redeem",
+                "ref_id": rid,
+                "created_at": now,
+            }
+        )
+        results.append(
+            {"redeem_id": rid, "user_id": r.user_id, "result": "approved", "idempotent": False, "debited_slh": str(r.slh_amount)}
+        )
+
+    if updates:
+        db.execute(update(RedemptionRequest), updates)
+        db.execute(insert(SLHLedger), ledger)
+        new_balances = apply_slh_deltas(db, deltas)
+        for res in results:
+            if res["result"] == "approved" and not res["idempotent"]:
+                res["new_balance"] = str(new_balances[int(res["user_id"])])
+
+    return results
@@ -39,6 +39,12 @@ def init_db() -> None:
     # Import models so they register on Base.metadata
     from app import models  # noqa: F401
     Base.metadata.create_all(bind=engine)
+    if engine.dialect.name == "postgresql":
+        # staking_events / staking_rewards are partitioned by month: rows need a partition
+        from app.core.staking.partitions import ensure_partitions
+
+        with engine.begin() as conn:
+            ensure_partitions(conn)
 
 
 def get_db():
@@ -1,3 +1,4 @@
+import asyncio
 import os
 import logging
 import json
@@ -6,6 +7,9 @@ import httpx
 from fastapi import Request, BackgroundTasks
 
 from app.api_core import router as core_router
+from app.routers.admin_accrual import router as admin_accrual_router
+from app.routers.portfolio import router as portfolio_router
+from app.routers.public_stats import router as public_stats_router
 
 log = logging.getLogger("bot_factory")
 
@@ -37,6 +41,9 @@ def ready(response: Response):
         return {"ok": False, "db": "down", "error": str(e)[:200]}
 
 app.include_router(core_router)
+app.include_router(admin_accrual_router)
+app.include_router(public_stats_router)
+app.include_router(portfolio_router)
 
 
 from fastapi import Request
@@ -186,6 +193,102 @@ async def startup():
     log.info("telegram bot initialized")
 
 
+@app.on_event("startup")
+async def start_accrual_scheduler():
+    from app.core.staking import scheduler as accrual_scheduler
+
+    if not accrual_scheduler.enabled():
+        return
+    from app.db import ENGINE
+
+    app.state.accrual_scheduler = accrual_scheduler.AccrualScheduler.from_env(ENGINE)
+    app.state.accrual_scheduler.start()
+
+
+@app.on_event("shutdown")
+async def stop_accrual_scheduler():
+    sched = getattr(app.state, "accrual_scheduler", None)
+    if sched is not None:
+        await sched.stop()
+
+
+@app.on_event("startup")
+async def start_pool_cache_listener():
+    if not os.getenv("DATABASE_URL"):
+        return
+    from app.core.staking import pool_cache
+    from app.db import ENGINE
+
+    app.state.pool_cache_listener = pool_cache.start_listener(ENGINE)
+
+
+@app.on_event("shutdown")
+async def stop_pool_cache_listener():
+    running = getattr(app.state, "pool_cache_listener", None)
+    if running is not None:
+        thread, stop = running
+        stop.set()
+        await asyncio.to_thread(thread.join, 5)
+
+
+@app.on_event("startup")
+async def start_partition_maintainer():
+    # not tied to the accrual scheduler: without it inserts start failing once the last month runs out
+    if not (os.getenv("DATABASE_URL") or "").startswith("postgres"):
+        return
+    from app.core.staking import partitions
+    from app.db import ENGINE
+
+    app.state.partition_maintainer = partitions.start_maintainer(ENGINE)
+
+
+@app.on_event("shutdown")
+async def stop_partition_maintainer():
+    running = getattr(app.state, "partition_maintainer", None)
+    if running is not None:
+        thread, stop = running
+        stop.set()
+        await asyncio.to_thread(thread.join, 5)
+
+
+@app.on_event("startup")
+async def start_staking_outbox():
+    from app.core.staking import outbox
+
+    if not outbox.enabled():
+        return
+    from app.db import ENGINE
+
+    consumer = outbox.telegram_consumer(ENGINE)
+    app.state.staking_outbox = (consumer,) + outbox.start_consumer_thread(consumer)
+    log.info("staking outbox consumer started: %s", consumer.name)
+
+
+@app.on_event("shutdown")
+async def stop_staking_outbox():
+    running = getattr(app.state, "staking_outbox", None)
+    if running is not None:
+        _, thread, stop = running
+        stop.set()
+        await asyncio.to_thread(thread.join, 10)
+
+
+@app.on_event("startup")
+async def start_stats_snapshot():
+    if not os.getenv("DATABASE_URL"):
+        return
+    from app.core.staking.stats_snapshot import STATS
+
+    STATS.start()
+
+
+@app.on_event("shutdown")
+async def stop_stats_snapshot():
+    from app.core.staking.stats_snapshot import STATS
+
+    await STATS.stop()
+
+
 def _extract_message(update: dict) -> dict:
     msg = update.get("message") or update.get("edited_message") or {}
     cbq = update.get("callback_query") or {}
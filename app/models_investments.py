@@ -67,6 +67,30 @@ class RedemptionRequest(Base):
     created_at: Mapped[datetime] = mapped_column(DateTime, default=_utcnow, nullable=False)
     decided_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
     decided_by_admin: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    # idempotency key of the approval that decided this request (unique)
+    decision_key: Mapped[str | None] = mapped_column(String(64), nullable=True)
 
 
-Index("ix_slh_ledger_ref", SLHLedger.ref_type, SLHLedger.ref_id)
\ No newline at end of file
+class SLHBalance(Base):
+    """
+    Maintained per-user SUM(slh_ledger.amount_slh).
+    Updated in the same transaction as every SLHLedger insert (see app.crud_investments).
+    """
+    __tablename__ = "slh_balances"
+
+    user_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    balance_slh: Mapped[Decimal] = mapped_column(Numeric(28, 8), nullable=False, default=Decimal("0"))
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=_utcnow, nullable=False)
+
+
+Index("ix_slh_ledger_ref", SLHLedger.ref_type, SLHLedger.ref_id)
+
+# keyset page of a user's ledger (user_id = ? ORDER BY id DESC)
+Index("ix_slh_ledger_user_id_id", SLHLedger.user_id, SLHLedger.id)
+
+# admin queues: status = ? [AND user_id = ?] ORDER BY id DESC, keyset on id
+Index("ix_deposits_status_id", Deposit.status, Deposit.id)
+Index("ix_deposits_user_status_id", Deposit.user_id, Deposit.status, Deposit.id)
+Index("ix_redemption_requests_status_id", RedemptionRequest.status, RedemptionRequest.id)
+Index("ix_redemption_requests_user_status_id", RedemptionRequest.user_id, RedemptionRequest.status, RedemptionRequest.id)
+Index("uq_redemption_requests_decision_key", RedemptionRequest.decision_key, unique=True)
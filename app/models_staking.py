@@ -1,5 +1,8 @@
 from __future__ import annotations
 
+import enum
+import uuid
+
 from sqlalchemy import (
     BigInteger,
     Boolean,
@@ -10,15 +13,50 @@ from sqlalchemy import (
     Index,
     Integer,
     Numeric,
+    Sequence,
     String,
     Text,
+    UniqueConstraint,
 )
 from sqlalchemy.dialects.postgresql import JSONB
-from sqlalchemy.sql import func
+from sqlalchemy.sql import func, text
 
 from app.database import Base
 
 
+def _uuid() -> str:
+    return str(uuid.uuid4())
+
+
+class StakingPositionState(str, enum.Enum):
+    CREATED = "CREATED"
+    ACTIVE = "ACTIVE"
+    COMPLETED = "COMPLETED"
+    WITHDRAWN = "WITHDRAWN"
+    CANCELLED = "CANCELLED"
+
+
+class StakingRewardType(str, enum.Enum):
+    ACCRUAL = "ACCRUAL"
+    CLAIM = "CLAIM"
+
+
+class StakingEventType(str, enum.Enum):
+    POSITION_CREATED = "POSITION_CREATED"
+    POSITION_ACTIVATED = "POSITION_ACTIVATED"
+    ACCRUAL_RECORDED = "ACCRUAL_RECORDED"
+    POSITION_COMPLETED = "POSITION_COMPLETED"
+    REWARD_CLAIMED = "REWARD_CLAIMED"
+    UNSTAKE_REQUESTED = "UNSTAKE_REQUESTED"
+    POSITION_WITHDRAWN = "POSITION_WITHDRAWN"
+
+
+class StakingActorType(str, enum.Enum):
+    USER = "USER"
+    SYSTEM = "SYSTEM"
+    ADMIN = "ADMIN"
+
+
 class StakingPool(Base):
     __tablename__ = "staking_pools"
 
@@ -42,6 +80,10 @@ class StakingPool(Base):
     starts_at = Column(DateTime(timezone=True), nullable=True)
     ends_at = Column(DateTime(timezone=True), nullable=True)
 
+    # cumulative sum of apy_bps * seconds, valid at reward_index_at (whole seconds); NULL = not started
+    reward_index = Column(Numeric(38, 0), nullable=False, server_default="0")
+    reward_index_at = Column(DateTime(timezone=True), nullable=True)
+
     created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.timezone("utc", func.now()))
     updated_at = Column(DateTime(timezone=True), nullable=False, server_default=func.timezone("utc", func.now()))
 
@@ -58,13 +100,13 @@ class StakingPool(Base):
 class StakingPosition(Base):
     __tablename__ = "staking_positions"
 
-    id = Column(String(36), primary_key=True)
+    id = Column(String(36), primary_key=True, default=_uuid)
 
-    user_telegram_id = Column(BigInteger, nullable=False, index=True)
+    user_telegram_id = Column(BigInteger, nullable=False)
     pool_id = Column(String(36), ForeignKey("staking_pools.id", ondelete="RESTRICT"), nullable=False)
 
     principal_amount = Column(Numeric(38, 18), nullable=False)
-    state = Column(String(16), nullable=False, server_default="CREATED", index=True)
+    state = Column(String(16), nullable=False, server_default="CREATED")
 
     created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.timezone("utc", func.now()))
     activated_at = Column(DateTime(timezone=True), nullable=True)
@@ -72,6 +114,8 @@ class StakingPosition(Base):
     closed_at = Column(DateTime(timezone=True), nullable=True)
 
     last_accrual_at = Column(DateTime(timezone=True), nullable=True)
+    # pool reward_index at last_accrual_at; NULL = accrued per position by the periodic job
+    reward_index_snapshot = Column(Numeric(38, 0), nullable=True)
 
     total_reward_accrued = Column(Numeric(38, 18), nullable=False, server_default="0")
     total_reward_claimed = Column(Numeric(38, 18), nullable=False, server_default="0")
@@ -83,15 +127,42 @@ class StakingPosition(Base):
         CheckConstraint("total_reward_accrued >= 0", name="ck_staking_positions_accrued_nonneg"),
         CheckConstraint("total_reward_claimed >= 0", name="ck_staking_positions_claimed_nonneg"),
         Index("ix_staking_positions_state", "state"),
-        Index("ix_staking_positions_user_state", "user_telegram_id", "state"),
+        # per-user listings: keyset pages on (created_at DESC, id DESC), optionally by state
+        Index("ix_staking_positions_user_state", "user_telegram_id", "state", text("created_at DESC"), text("id DESC")),
+        Index("ix_staking_positions_user_created", "user_telegram_id", text("created_at DESC"), text("id DESC")),
         Index("ix_staking_positions_user_telegram_id", "user_telegram_id"),
+        # keyset chunks for accrual runs: ACTIVE positions in id order
+        Index("ix_staking_positions_active_id", "id", postgresql_where=text("state = 'ACTIVE'")),
+    )
+
+
+class StakingPoolIndexPoint(Base):
+    """Pool reward_index checkpoints, so the index can be evaluated at past instants (maturity)."""
+
+    __tablename__ = "staking_pool_index_points"
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    pool_id = Column(String(36), ForeignKey("staking_pools.id", ondelete="CASCADE"), nullable=False)
+    at = Column(DateTime(timezone=True), nullable=False)
+    reward_index = Column(Numeric(38, 0), nullable=False)
+    apy_bps = Column(Integer, nullable=False)
+
+    created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.timezone("utc", func.now()))
+
+    __table_args__ = (
+        UniqueConstraint("pool_id", "at", name="uq_staking_pool_index_points_pool_at"),
     )
 
 
 class StakingReward(Base):
+    """
+    Range-partitioned by month on created_at (app/core/staking/partitions.py), so the
+    partition key is part of the primary key.
+    """
+
     __tablename__ = "staking_rewards"
 
-    id = Column(String(36), primary_key=True)
+    id = Column(String(36), primary_key=True, default=_uuid)
     position_id = Column(String(36), ForeignKey("staking_positions.id", ondelete="CASCADE"), nullable=False, index=True)
 
     reward_type = Column(String(16), nullable=False, index=True)
@@ -102,43 +173,195 @@ class StakingReward(Base):
 
     meta = Column(JSONB, nullable=True)
 
-    created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.timezone("utc", func.now()))
+    created_at = Column(
+        DateTime(timezone=True), primary_key=True, nullable=False, server_default=func.timezone("utc", func.now())
+    )
 
     __table_args__ = (
         CheckConstraint("amount >= 0", name="ck_staking_rewards_amount_nonneg"),
+        {"postgresql_partition_by": "RANGE (created_at)"},
     )
 
 
+_EVENTS_SEQ = Sequence("staking_events_seq_seq", metadata=Base.metadata)
+
+
 class StakingEvent(Base):
+    """
+    Range-partitioned by month on occurred_at (app/core/staking/partitions.py). A unique
+    index can't span partitions without the partition key, so request_id uniqueness is kept
+    by StakingEventRequest (filled by a row trigger on insert).
+    """
+
     __tablename__ = "staking_events"
 
-    id = Column(String(36), primary_key=True)
+    id = Column(String(36), primary_key=True, default=_uuid)
 
-    event_type = Column(String(40), nullable=False, index=True)
-    user_telegram_id = Column(BigInteger, nullable=False, index=True)
+    event_type = Column(String(40), nullable=False)
+    user_telegram_id = Column(BigInteger, nullable=False)
 
     pool_id = Column(String(36), nullable=True)
-    position_id = Column(String(36), nullable=True, index=True)
+    position_id = Column(String(36), nullable=True)
 
     # autogen showed DB is VARCHAR(36)
-    request_id = Column(String(36), nullable=True, unique=True)
+    request_id = Column(String(36), nullable=True)
 
-    occurred_at = Column(DateTime(timezone=True), nullable=False, server_default=func.timezone("utc", func.now()), index=True)
+    occurred_at = Column(
+        DateTime(timezone=True), primary_key=True, nullable=False, server_default=func.timezone("utc", func.now())
+    )
     actor_type = Column(String(16), nullable=False, server_default="SYSTEM")
     actor_id = Column(String(64), nullable=True)
 
     amount = Column(Numeric(38, 18), nullable=True)
     details = Column(JSONB, nullable=True)
 
+    # outbox ordering: insertion sequence + writing transaction (see app/core/staking/outbox.py)
+    seq = Column(BigInteger, _EVENTS_SEQ, server_default=_EVENTS_SEQ.next_value(), nullable=False)
+    tx_id = Column(BigInteger, nullable=False, server_default=text("txid_current()"))
+
     __table_args__ = (
         # DB indexes
+        # lookups by request_id; accrual events have none, so they skip this index
+        Index("ix_staking_events_request_id", "request_id", postgresql_where=text("request_id IS NOT NULL")),
+        Index("ix_staking_events_tx_seq", "tx_id", "seq"),
         Index("ix_staking_events_event_type", "event_type"),
         Index("ix_staking_events_occurred_at", "occurred_at"),
-        Index("ix_staking_events_position_id", "position_id"),
-        Index("ix_staking_events_position_time", "position_id", "occurred_at"),
-        Index("ix_staking_events_user_telegram_id", "user_telegram_id"),
-        Index("ix_staking_events_user_time", "user_telegram_id", "occurred_at"),
+        # timeline keysets (app/core/staking/timeline.py); also serve plain user / position lookups
+        Index("ix_staking_events_position_time", "position_id", text("occurred_at DESC"), text("id DESC")),
+        Index("ix_staking_events_user_time", "user_telegram_id", text("occurred_at DESC"), text("id DESC")),
+        Index(
+            "ix_staking_events_user_type_time",
+            "user_telegram_id", "event_type", text("occurred_at DESC"), text("id DESC"),
+        ),
         # autogen said DB has this index and model was missing it:
         Index("ix_staking_events_pool_id", "pool_id"),
         CheckConstraint("event_type <> ''", name="ck_staking_events_type_nonempty"),
-    )
\ No newline at end of file
+        {"postgresql_partition_by": "RANGE (occurred_at)"},
+    )
+
+
+class StakingEventRequest(Base):
+    """
+    One row per staking_events.request_id ever written: the idempotency key registry.
+    Kept outside the partitioned table, so keys stay unique across partitions and after
+    old partitions are detached.
+    """
+
+    __tablename__ = "staking_event_requests"
+
+    request_id = Column(String(36), primary_key=True)
+    event_id = Column(String(36), nullable=False)
+    occurred_at = Column(DateTime(timezone=True), nullable=False)
+
+
+class StakingEventConsumer(Base):
+    """
+    Persisted offset of one outbox consumer: the last (tx_id, seq) it has fully handled.
+    """
+
+    __tablename__ = "staking_event_consumers"
+
+    name = Column(String(64), primary_key=True)
+    last_tx_id = Column(BigInteger, nullable=False, server_default="0")
+    last_seq = Column(BigInteger, nullable=False, server_default="0")
+    delivered = Column(BigInteger, nullable=False, server_default="0")
+    last_error = Column(Text, nullable=True)
+
+    created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.timezone("utc", func.now()))
+    updated_at = Column(DateTime(timezone=True), nullable=False, server_default=func.timezone("utc", func.now()))
+
+
+class StakingAccrualRun(Base):
+    """
+    One accrual run over ACTIVE positions. Everything accrues up to the fixed `as_of`;
+    `cursor` is the last position id whose chunk has committed, so a crashed run
+    resumes after it (and a re-processed position is a no-op: last_accrual_at == as_of).
+    Also the run history: `positions_total` is the due count when the run (re)started,
+    `duration_ms` the wall time of finished segments, `resumed_at` the current segment start.
+    """
+
+    __tablename__ = "staking_accrual_runs"
+
+    id = Column(String(36), primary_key=True, default=_uuid)
+    status = Column(String(16), nullable=False, server_default="RUNNING")
+    trigger = Column(String(16), nullable=False, server_default="cli")  # cli / scheduler / admin_job
+
+    as_of = Column(DateTime(timezone=True), nullable=False)
+    chunk_size = Column(Integer, nullable=False)
+    cursor = Column(String(36), nullable=True)
+
+    positions_total = Column(Integer, nullable=True)
+    chunks_done = Column(Integer, nullable=False, server_default="0")
+    positions_done = Column(Integer, nullable=False, server_default="0")
+    rewards_inserted = Column(Integer, nullable=False, server_default="0")
+    reward_total = Column(Numeric(38, 18), nullable=False, server_default="0")
+    index_positions = Column(Integer, nullable=False, server_default="0")
+
+    error = Column(Text, nullable=True)
+
+    started_at = Column(DateTime(timezone=True), nullable=False, server_default=func.timezone("utc", func.now()))
+    resumed_at = Column(DateTime(timezone=True), nullable=True)
+    updated_at = Column(DateTime(timezone=True), nullable=False, server_default=func.timezone("utc", func.now()))
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+    duration_ms = Column(BigInteger, nullable=False, server_default="0")
+
+    __table_args__ = (
+        Index("ix_staking_accrual_runs_status_started", "status", "started_at"),
+        Index("ix_staking_accrual_runs_started", started_at.desc()),
+    )
+
+
+class UserStakingSummary(Base):
+    """
+    Maintained per-(user, pool) aggregates of staking_positions, updated in the same
+    transaction as every position write (see app.core.staking.summary).
+    """
+
+    __tablename__ = "user_staking_summary"
+
+    user_telegram_id = Column(BigInteger, primary_key=True)
+    pool_id = Column(String(36), primary_key=True)
+
+    positions_count = Column(Integer, nullable=False, server_default="0")
+    created_count = Column(Integer, nullable=False, server_default="0")
+    active_count = Column(Integer, nullable=False, server_default="0")
+    completed_count = Column(Integer, nullable=False, server_default="0")
+    withdrawn_count = Column(Integer, nullable=False, server_default="0")
+    cancelled_count = Column(Integer, nullable=False, server_default="0")
+
+    # principal of CREATED/ACTIVE/COMPLETED positions; principal_total includes closed ones
+    principal_staked = Column(Numeric(38, 18), nullable=False, server_default="0")
+    principal_total = Column(Numeric(38, 18), nullable=False, server_default="0")
+    total_reward_accrued = Column(Numeric(38, 18), nullable=False, server_default="0")
+    total_reward_claimed = Column(Numeric(38, 18), nullable=False, server_default="0")
+
+    updated_at = Column(DateTime(timezone=True), nullable=False, server_default=func.timezone("utc", func.now()))
+
+
+class StakingPoolSeries(Base):
+    """
+    Hourly per-pool metrics for charts: levels at the end of the bucket (tvl, positions,
+    apy_bps) and flows during it. Filled incrementally from staking_events (see
+    app.core.staking.pool_series).
+    """
+
+    __tablename__ = "staking_pool_series"
+
+    pool_id = Column(String(36), primary_key=True)
+    bucket_start = Column(DateTime(timezone=True), primary_key=True)
+
+    tvl = Column(Numeric(38, 18), nullable=False, server_default="0")
+    open_positions = Column(Integer, nullable=False, server_default="0")
+    active_positions = Column(Integer, nullable=False, server_default="0")
+    apy_bps = Column(Integer, nullable=True)
+
+    staked = Column(Numeric(38, 18), nullable=False, server_default="0")
+    withdrawn = Column(Numeric(38, 18), nullable=False, server_default="0")
+    rewards_accrued = Column(Numeric(38, 18), nullable=False, server_default="0")
+    rewards_claimed = Column(Numeric(38, 18), nullable=False, server_default="0")
+    positions_opened = Column(Integer, nullable=False, server_default="0")
+    positions_closed = Column(Integer, nullable=False, server_default="0")
+    claims = Column(Integer, nullable=False, server_default="0")
+    events = Column(Integer, nullable=False, server_default="0")
+
+    updated_at = Column(DateTime(timezone=True), nullable=False, server_default=func.timezone("utc", func.now()))
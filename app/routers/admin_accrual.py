@@ -1,13 +1,20 @@
 from __future__ import annotations
 
+import json
+import logging
 import os
+import threading
 import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Optional
 
-from fastapi import APIRouter, Header, HTTPException
-from starlette.responses import JSONResponse
+from fastapi import APIRouter, Header, HTTPException, Query, Request
+from starlette.responses import JSONResponse, StreamingResponse
 
 router = APIRouter(prefix="/admin", tags=["admin"])
 
+log = logging.getLogger("staking.accrual_jobs")
+
 
 def _env(name: str) -> str | None:
     v = os.getenv(name)
@@ -25,30 +32,181 @@ def _require_admin_key(x_admin_key: str | None) -> None:
         raise HTTPException(status_code=401, detail="unauthorized")
 
 
-_last_call_ts: float = 0.0
-_MIN_INTERVAL_SEC = 10.0
+# Accrual jobs run on one background thread per process; the job id is the
+# staking_accrual_runs id, so progress/history can be read from any replica.
+# Across processes the runner's advisory lock keeps a single run going.
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="accrual-job")
+_job_lock = threading.Lock()
+_current: Optional[Future] = None
+_current_job_id: Optional[str] = None
+
+_START_TIMEOUT_SEC = 30.0
+_STREAM_MAX_SEC = 3600.0
+
+
+def _log_job_result(fut: Future) -> None:
+    # nobody waits on the future once the request returned: surface failures here
+    exc = fut.exception()
+    if exc is not None:
+        log.error("accrual job failed: %s", str(exc)[:500], exc_info=exc)
+    else:
+        res = fut.result() or {}
+        log.info("accrual job done: run=%s status=%s", res.get("run_id"), res.get("status"))
+
+
+def _submit_job(chunk_size: Optional[int], resume: bool) -> dict:
+    """Start run_accrual in the background and wait only until its run row exists."""
+    global _current, _current_job_id
+    from app.core.staking.accrual_runner import DEFAULT_CHUNK_SIZE, run_accrual
+    from app.db import ENGINE
+
+    size = chunk_size or int(_env("ACCRUAL_CHUNK_SIZE") or DEFAULT_CHUNK_SIZE)
+    if size <= 0:
+        raise HTTPException(status_code=400, detail="chunk_size must be positive")
+
+    with _job_lock:
+        if _current is not None and not _current.done():
+            raise HTTPException(status_code=409, detail={"error": "job_running", "job_id": _current_job_id})
+
+        started = threading.Event()
+        info: dict = {}
+
+        def _on_start(run: dict) -> None:
+            info["run"] = run
+            started.set()
+
+        def _job() -> dict:
+            try:
+                return run_accrual(ENGINE, chunk_size=size, resume=resume, trigger="admin_job", on_start=_on_start)
+            finally:
+                started.set()
+
+        _current = _executor.submit(_job)
+        _current.add_done_callback(_log_job_result)
+        _current_job_id = None
+        fut = _current
+
+        if not started.wait(_START_TIMEOUT_SEC):
+            raise HTTPException(status_code=504, detail="job_start_timeout")
+        if "run" not in info:
+            # finished before a run existed: lock busy or start failed
+            exc = fut.exception() if fut.done() else None
+            if exc is not None:
+                raise HTTPException(status_code=500, detail=str(exc)[:500])
+            raise HTTPException(status_code=409, detail="advisory_lock_busy")
+
+        _current_job_id = info["run"]["id"]
+        return info["run"]
+
+
+@router.post("/accrual/jobs")
+def start_accrual_job(
+    chunk_size: Optional[int] = Query(default=None),
+    resume: bool = Query(default=True),
+    x_admin_key: str | None = Header(default=None, alias="X-Admin-Key"),
+):
+    """
+    Start a staking accrual run in the background (admin-only). Returns the job id at once;
+    follow it with GET /admin/accrual/jobs/{job_id}.
+    """
+    _require_admin_key(x_admin_key)
+    run = _submit_job(chunk_size, resume)
+    return JSONResponse(
+        {
+            "ok": True,
+            "job_id": run["id"],
+            "resumed": bool(run.get("resumed")),
+            "positions_total": run.get("positions_total"),
+            "status_url": f"/admin/accrual/jobs/{run['id']}",
+        },
+        status_code=202,
+    )
 
 
 @router.post("/accrual/run")
 def run_accrual(x_admin_key: str | None = Header(default=None, alias="X-Admin-Key")):
     """
-    Run staking accrual once (admin-only).
+    Run staking accrual once (admin-only). Kept for existing callers; same as POST /accrual/jobs.
+    """
+    return start_accrual_job(chunk_size=None, resume=True, x_admin_key=x_admin_key)
+
+
+def _load_progress(job_id: str) -> Optional[dict]:
+    from app.core.staking.accrual_runner import get_run, lock_held, run_progress
+    from app.db import ENGINE
+
+    with ENGINE.connect() as conn:
+        run = get_run(conn, job_id)
+        locked = lock_held(conn) if run else None
+    return run_progress(run, locked=locked) if run else None
+
+
+@router.get("/accrual/jobs/{job_id}")
+def accrual_job_status(
+    job_id: str,
+    stream: bool = Query(default=False),
+    interval: float = Query(default=1.0, ge=0.2, le=60.0),
+    x_admin_key: str | None = Header(default=None, alias="X-Admin-Key"),
+):
+    """
+    Progress of one accrual job: positions done/total, rewards written, elapsed, ETA.
+    stream=true: NDJSON, one line every `interval` seconds until the job stops running.
+    """
+    _require_admin_key(x_admin_key)
+    first = _load_progress(job_id)
+    if first is None:
+        raise HTTPException(status_code=404, detail="job_not_found")
+    if not stream:
+        return JSONResponse({"ok": True, "job": first})
+
+    def _lines():
+        progress = first
+        deadline = time.monotonic() + _STREAM_MAX_SEC
+        while True:
+            yield json.dumps(progress) + "\n"
+            if not progress["in_progress"] or time.monotonic() > deadline:
+                return
+            time.sleep(interval)
+            progress = _load_progress(job_id)
+            if progress is None:
+                return
+
+    return StreamingResponse(_lines(), media_type="application/x-ndjson")
+
+
+@router.get("/accrual/jobs")
+def accrual_job_history(
+    limit: int = Query(default=20, ge=1, le=200),
+    x_admin_key: str | None = Header(default=None, alias="X-Admin-Key"),
+):
+    """
+    Accrual run history (every trigger), newest first, with duration and row counts.
+    """
+    _require_admin_key(x_admin_key)
+    from app.core.staking.accrual_runner import list_runs, lock_held, run_progress
+    from app.db import ENGINE
+
+    with ENGINE.connect() as conn:
+        runs = list_runs(conn, limit=limit)
+        locked = lock_held(conn)
+    return JSONResponse({"ok": True, "jobs": [run_progress(r, locked=locked) for r in runs]})
+
+
+@router.get("/accrual/scheduler")
+def accrual_scheduler_status(request: Request, x_admin_key: str | None = Header(default=None, alias="X-Admin-Key")):
+    """
+    Scheduler state of this process plus live accrual lag (now - oldest last_accrual_at still owed).
     """
-    global _last_call_ts
     _require_admin_key(x_admin_key)
 
-    now = time.time()
-    if now - _last_call_ts < _MIN_INTERVAL_SEC:
-        raise HTTPException(status_code=429, detail="too_many_requests")
-    _last_call_ts = now
-
-    try:
-        # local import to avoid impacting app startup
-        from tools.run_staking_accrual_once import main as accrual_main  # type: ignore
-
-        res = accrual_main()
-        return JSONResponse({"ok": True, "ran": True, "result": res})
-    except HTTPException:
-        raise
-    except Exception as e:
-        return JSONResponse({"ok": False, "error": str(e)}, status_code=500)
+    from app.core.staking.scheduler import accrual_lag
+    from app.db import ENGINE
+
+    sched = getattr(request.app.state, "accrual_scheduler", None)
+    with ENGINE.connect() as conn:
+        lag = accrual_lag(conn)
+    return JSONResponse({
+        "ok": True,
+        "scheduler": sched.status() if sched is not None else {"running": False},
+        "lag": lag,
+    })
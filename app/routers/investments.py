@@ -2,16 +2,27 @@ from __future__ import annotations
 
 from datetime import datetime
 from decimal import Decimal
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Iterator
 
+import json
 import os
 from fastapi import APIRouter, Depends, HTTPException, Query, Header
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
-from sqlalchemy import func, select, desc
 from sqlalchemy.orm import Session
 
-from app.database import get_db
-from app.models_investments import Deposit, SLHLedger, RedemptionRequest
+from app.database import SessionLocal, get_db
+from app.models_investments import Deposit, RedemptionRequest
+from app.crud_investments import (
+    activity_page,
+    approve_redeems,
+    confirm_deposits,
+    estimate_status_counts,
+    lock_slh_balances,
+    post_slh,
+    queue_query,
+    slh_balance,
+)
 
 router = APIRouter(prefix="/invest", tags=["invest"])
 
@@ -47,6 +58,16 @@ class AdminConfirmDepositIn(BaseModel):
     admin_id: int = 0
 
 
+class AdminBulkConfirmDepositsIn(BaseModel):
+    # explicit ids, or a filter over pending deposits (or both)
+    deposit_ids: Optional[List[int]] = Field(default=None, max_length=5000)
+    user_id: Optional[int] = None
+    created_before: Optional[datetime] = None
+    limit: int = Field(default=1000, ge=1, le=5000)
+    slh_per_ils: Decimal = Field(default=Decimal("1.0"), gt=0)
+    admin_id: int = 0
+
+
 class RedeemRequestIn(BaseModel):
     user_id: int
     slh_amount: Decimal = Field(gt=0)
@@ -57,11 +78,18 @@ class RedeemRequestIn(BaseModel):
 class AdminApproveRedeemIn(BaseModel):
     redeem_id: int
     admin_id: int = 0
+    # retries with the same key return the original approval instead of failing
+    idempotency_key: Optional[str] = Field(default=None, min_length=8, max_length=64)
+
+
+class AdminApproveRedeemItem(BaseModel):
+    redeem_id: int
+    idempotency_key: Optional[str] = Field(default=None, min_length=8, max_length=64)
 
 
-def slh_balance(db: Session, user_id: int) -> Decimal:
-    q = select(func.coalesce(func.sum(SLHLedger.amount_slh), 0)).where(SLHLedger.user_id == user_id)
-    return Decimal(str(db.execute(q).scalar_one()))
+class AdminBulkApproveRedeemsIn(BaseModel):
+    items: List[AdminApproveRedeemItem] = Field(min_length=1, max_length=1000)
+    admin_id: int = 0
 
 
 @router.post("/deposit/request")
@@ -89,15 +117,10 @@ def get_slh_balance(user_id: int, db: Session = Depends(get_db)):
 def get_activity(
     user_id: int,
     limit: int = Query(default=50, ge=1, le=200),
+    before_id: Optional[int] = Query(default=None, ge=1),
     db: Session = Depends(get_db),
 ):
-    q = (
-        select(SLHLedger)
-        .where(SLHLedger.user_id == user_id)
-        .order_by(desc(SLHLedger.id))
-        .limit(limit)
-    )
-    rows = db.execute(q).scalars().all()
+    balance, rows, next_before_id = activity_page(db, user_id, limit, before_id)
 
     items: List[Dict[str, Any]] = []
     for r in rows:
@@ -114,15 +137,17 @@ def get_activity(
 
     return {
         "user_id": user_id,
-        "slh_balance": str(slh_balance(db, user_id)),
+        "slh_balance": str(balance),
         "count": len(items),
         "items": items,
+        "next_before_id": next_before_id,
     }
 
 
 @router.post("/redeem/request")
 def create_redeem(req: RedeemRequestIn, db: Session = Depends(get_db)):
-    bal = slh_balance(db, req.user_id)
+    # held until commit: approvals for this user wait instead of racing the check
+    bal = lock_slh_balances(db, [req.user_id])[req.user_id]
     if req.slh_amount > bal:
         raise HTTPException(status_code=400, detail=f"Insufficient SLH. balance={bal}")
 
@@ -141,7 +166,7 @@ def create_redeem(req: RedeemRequestIn, db: Session = Depends(get_db)):
 
 @router.post("/admin/deposit/confirm")
 def admin_confirm_deposit(req: AdminConfirmDepositIn, db: Session = Depends(get_db), _admin: None = Depends(require_admin)):
-    d = db.get(Deposit, req.deposit_id)
+    d = db.get(Deposit, req.deposit_id, with_for_update=True)
     if not d:
         raise HTTPException(status_code=404, detail="Deposit not found")
     if d.status != "pending":
@@ -152,128 +177,211 @@ def admin_confirm_deposit(req: AdminConfirmDepositIn, db: Session = Depends(get_
 
     minted = (d.amount_ils * req.slh_per_ils)
 
-    db.add(
-        SLHLedger(
-            user_id=d.user_id,
-            amount_slh=minted,
-            reason="deposit_reward",
-            ref_type="deposit",
-            ref_id=d.id,
-        )
-    )
+    new_balance = post_slh(db, d.user_id, minted, "deposit_reward", ref_type="deposit", ref_id=d.id)
 
     db.commit()
-    return {"status": "ok", "deposit_id": d.id, "minted_slh": str(minted), "new_balance": str(slh_balance(db, d.user_id))}
+    return {"status": "ok", "deposit_id": d.id, "minted_slh": str(minted), "new_balance": str(new_balance)}
+
+
+@router.post("/admin/deposits/confirm_bulk")
+def admin_confirm_deposits_bulk(req: AdminBulkConfirmDepositsIn, db: Session = Depends(get_db), _admin: None = Depends(require_admin)):
+    if req.deposit_ids is None and req.user_id is None and req.created_before is None:
+        raise HTTPException(status_code=400, detail="deposit_ids or a filter (user_id / created_before) is required")
+
+    results = confirm_deposits(
+        db,
+        req.slh_per_ils,
+        deposit_ids=req.deposit_ids,
+        user_id=req.user_id,
+        created_before=req.created_before,
+        limit=req.limit,
+    )
+    db.commit()
+
+    confirmed = [r for r in results if r["result"] == "confirmed"]
+    return {
+        "status": "ok",
+        "confirmed": len(confirmed),
+        "minted_slh_total": str(sum((Decimal(r["minted_slh"]) for r in confirmed), Decimal("0"))),
+        "results": results,
+    }
 
 
 @router.post("/admin/redeem/approve")
 def admin_approve_redeem(req: AdminApproveRedeemIn, db: Session = Depends(get_db), _admin: None = Depends(require_admin)):
-    r = db.get(RedemptionRequest, req.redeem_id)
-    if not r:
+    res = approve_redeems(db, [(req.redeem_id, req.idempotency_key)], admin_id=req.admin_id)[0]
+
+    if res["result"] == "not_found":
         raise HTTPException(status_code=404, detail="Redeem request not found")
-    if r.status != "requested":
-        raise HTTPException(status_code=400, detail=f"Redeem not requested (status={r.status})")
-
-    bal = slh_balance(db, r.user_id)
-    if r.slh_amount > bal:
-        raise HTTPException(status_code=400, detail=f"Insufficient SLH at approval time. balance={bal}")
-
-    r.status = "approved"
-    r.decided_by_admin = req.admin_id
-    r.decided_at = datetime.utcnow()
-
-    db.add(
-        SLHLedger(
-            user_id=r.user_id,
-            amount_slh=Decimal("0") - r.slh_amount,
-            reason="redeem",
-            ref_type="redeem",
-            ref_id=r.id,
-        )
-    )
+    if res["result"] == "not_requested":
+        raise HTTPException(status_code=400, detail=f"Redeem not requested (status={res['state']})")
+    if res["result"] == "key_conflict":
+        raise HTTPException(status_code=409, detail="idempotency_key already used for another redeem")
+    if res["result"] == "insufficient":
+        raise HTTPException(status_code=400, detail=f"Insufficient SLH at approval time. balance={res['balance']}")
+
+    db.commit()
+    new_balance = res.get("new_balance") or str(slh_balance(db, res["user_id"]))
+    return {
+        "status": "ok",
+        "redeem_id": req.redeem_id,
+        "debited_slh": res["debited_slh"],
+        "new_balance": new_balance,
+        "idempotent": res["idempotent"],
+    }
 
+
+@router.post("/admin/redeems/approve_bulk")
+def admin_approve_redeems_bulk(req: AdminBulkApproveRedeemsIn, db: Session = Depends(get_db), _admin: None = Depends(require_admin)):
+    results = approve_redeems(db, [(i.redeem_id, i.idempotency_key) for i in req.items], admin_id=req.admin_id)
     db.commit()
-    return {"status": "ok", "redeem_id": r.id, "debited_slh": str(r.slh_amount), "new_balance": str(slh_balance(db, r.user_id))}
+    return {
+        "status": "ok",
+        "approved": sum(1 for r in results if r["result"] == "approved" and not r["idempotent"]),
+        "results": results,
+    }
+
+
+_DEPOSIT_COLS = (
+    Deposit.id,
+    Deposit.user_id,
+    Deposit.amount_ils,
+    Deposit.method,
+    Deposit.reference,
+    Deposit.notes,
+    Deposit.status,
+    Deposit.created_at,
+    Deposit.confirmed_at,
+)
+
+_REDEEM_COLS = (
+    RedemptionRequest.id,
+    RedemptionRequest.user_id,
+    RedemptionRequest.slh_amount,
+    RedemptionRequest.target,
+    RedemptionRequest.notes,
+    RedemptionRequest.status,
+    RedemptionRequest.created_at,
+    RedemptionRequest.decided_at,
+    RedemptionRequest.decided_by_admin,
+)
+
+_EXPORT_CHUNK = 1000
+
+
+def _deposit_item(d) -> Dict[str, Any]:
+    return {
+        "deposit_id": d.id,
+        "user_id": d.user_id,
+        "amount_ils": str(d.amount_ils),
+        "method": d.method,
+        "reference": d.reference,
+        "notes": d.notes,
+        "state": d.status,
+        "created_at": d.created_at.isoformat(),
+        "confirmed_at": (d.confirmed_at.isoformat() if d.confirmed_at else None),
+    }
+
+
+def _redeem_item(r) -> Dict[str, Any]:
+    return {
+        "redeem_id": r.id,
+        "user_id": r.user_id,
+        "slh_amount": str(r.slh_amount),
+        "target": r.target,
+        "notes": r.notes,
+        "state": r.status,
+        "created_at": r.created_at.isoformat(),
+        "decided_at": (r.decided_at.isoformat() if r.decided_at else None),
+        "decided_by_admin": r.decided_by_admin,
+    }
+
+
+def _queue_page(db: Session, model, columns, to_item, status: str, user_id: Optional[int], after_id: Optional[int], limit: int) -> Dict[str, Any]:
+    rows = db.execute(queue_query(model, columns, status, user_id, after_id, limit + 1)).all()
+    next_after_id = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_after_id = rows[-1].id
+    return {
+        "status": status,
+        "count": len(rows),
+        "items": [to_item(r) for r in rows],
+        "next_after_id": next_after_id,
+    }
+
+
+def _stream_queue(model, columns, to_item, status: str, user_id: Optional[int]) -> Iterator[str]:
+    # own session: request-scoped dependencies are closed before the body is streamed
+    db = SessionLocal()
+    try:
+        after_id = None
+        while True:
+            rows = db.execute(queue_query(model, columns, status, user_id, after_id, _EXPORT_CHUNK)).all()
+            # don't hold a snapshot open while the client drains the chunk
+            db.rollback()
+            for r in rows:
+                yield json.dumps(to_item(r)) + "\n"
+            if len(rows) < _EXPORT_CHUNK:
+                break
+            after_id = rows[-1].id
+    finally:
+        db.close()
 
 
 @router.get("/admin/deposits")
 def admin_list_deposits(
     status: str = Query(default="pending"),
     user_id: Optional[int] = None,
+    after_id: Optional[int] = Query(default=None, ge=1),
     limit: int = Query(default=50, ge=1, le=200),
     db: Session = Depends(get_db),
     _admin: None = Depends(require_admin),
 ):
-    if user_id is None:
-        q = select(Deposit).where(Deposit.status == status).order_by(desc(Deposit.id)).limit(limit)
-    else:
-        q = (
-            select(Deposit)
-            .where(Deposit.status == status, Deposit.user_id == user_id)
-            .order_by(desc(Deposit.id))
-            .limit(limit)
-        )
+    return _queue_page(db, Deposit, _DEPOSIT_COLS, _deposit_item, status, user_id, after_id, limit)
 
-    items = db.execute(q).scalars().all()
-    return {
-        "status": status,
-        "count": len(items),
-        "items": [
-            {
-                "deposit_id": d.id,
-                "user_id": d.user_id,
-                "amount_ils": str(d.amount_ils),
-                "method": d.method,
-                "reference": d.reference,
-                "notes": d.notes,
-                "state": d.status,
-                "created_at": d.created_at.isoformat(),
-                "confirmed_at": (d.confirmed_at.isoformat() if d.confirmed_at else None),
-            }
-            for d in items
-        ],
-    }
+
+@router.get("/admin/deposits/counts")
+def admin_count_deposits(db: Session = Depends(get_db), _admin: None = Depends(require_admin)):
+    return {"table": Deposit.__tablename__, **estimate_status_counts(db, Deposit)}
+
+
+@router.get("/admin/deposits/export")
+def admin_export_deposits(
+    status: str = Query(default="pending"),
+    user_id: Optional[int] = None,
+    _admin: None = Depends(require_admin),
+):
+    return StreamingResponse(
+        _stream_queue(Deposit, _DEPOSIT_COLS, _deposit_item, status, user_id),
+        media_type="application/x-ndjson",
+    )
 
 
 @router.get("/admin/redeems")
 def admin_list_redeems(
     status: str = Query(default="requested"),
     user_id: Optional[int] = None,
+    after_id: Optional[int] = Query(default=None, ge=1),
     limit: int = Query(default=50, ge=1, le=200),
     db: Session = Depends(get_db),
     _admin: None = Depends(require_admin),
 ):
-    if user_id is None:
-        q = (
-            select(RedemptionRequest)
-            .where(RedemptionRequest.status == status)
-            .order_by(desc(RedemptionRequest.id))
-            .limit(limit)
-        )
-    else:
-        q = (
-            select(RedemptionRequest)
-            .where(RedemptionRequest.status == status, RedemptionRequest.user_id == user_id)
-            .order_by(desc(RedemptionRequest.id))
-            .limit(limit)
-        )
+    return _queue_page(db, RedemptionRequest, _REDEEM_COLS, _redeem_item, status, user_id, after_id, limit)
 
-    items = db.execute(q).scalars().all()
-    return {
-        "status": status,
-        "count": len(items),
-        "items": [
-            {
-                "redeem_id": r.id,
-                "user_id": r.user_id,
-                "slh_amount": str(r.slh_amount),
-                "target": r.target,
-                "notes": r.notes,
-                "state": r.status,
-                "created_at": r.created_at.isoformat(),
-                "decided_at": (r.decided_at.isoformat() if r.decided_at else None),
-                "decided_by_admin": r.decided_by_admin,
-            }
-            for r in items
-        ],
-    }
\ No newline at end of file
+
+@router.get("/admin/redeems/counts")
+def admin_count_redeems(db: Session = Depends(get_db), _admin: None = Depends(require_admin)):
+    return {"table": RedemptionRequest.__tablename__, **estimate_status_counts(db, RedemptionRequest)}
+
+
+@router.get("/admin/redeems/export")
+def admin_export_redeems(
+    status: str = Query(default="requested"),
+    user_id: Optional[int] = None,
+    _admin: None = Depends(require_admin),
+):
+    return StreamingResponse(
+        _stream_queue(RedemptionRequest, _REDEEM_COLS, _redeem_item, status, user_id),
+        media_type="application/x-ndjson",
+    )
@@ -0,0 +1,198 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict
+from decimal import Decimal
+from typing import Any, Callable, Optional
+
+from fastapi import APIRouter
+from sqlalchemy import select
+
+from app.database import SessionLocal
+from app.models_staking import StakingPosition
+
+router = APIRouter(tags=["portfolio"])
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name) or default)
+    except Exception:
+        return default
+
+
+# per-source settings: (timeout seconds, cache TTL seconds)
+SOURCES: dict[str, tuple[float, float]] = {
+    "ledger": (_env_float("PORTFOLIO_TIMEOUT_LEDGER", 2.0), _env_float("PORTFOLIO_TTL_LEDGER", 5.0)),
+    "slh": (_env_float("PORTFOLIO_TIMEOUT_SLH", 2.0), _env_float("PORTFOLIO_TTL_SLH", 5.0)),
+    "staking": (_env_float("PORTFOLIO_TIMEOUT_STAKING", 2.0), _env_float("PORTFOLIO_TTL_STAKING", 5.0)),
+    "onchain": (_env_float("PORTFOLIO_TIMEOUT_ONCHAIN", 4.0), _env_float("PORTFOLIO_TTL_ONCHAIN", 30.0)),
+}
+
+# Keys come from query parameters (telegram_id, address), so the cache is an LRU capped at
+# CACHE_SIZE entries: inserts evict the least recently used entry (and any expired ones at
+# the cold end), and an expired entry is dropped when read.
+CACHE_SIZE = max(int(_env_float("PORTFOLIO_CACHE_SIZE", 10000)), 0)
+
+_cache: OrderedDict[tuple[str, Any], tuple[float, Any]] = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _cache_get(key: tuple[str, Any]) -> Optional[Any]:
+    with _cache_lock:
+        hit = _cache.get(key)
+        if hit is None:
+            return None
+        expires, value = hit
+        if expires < time.monotonic():
+            _cache.pop(key, None)
+            return None
+        _cache.move_to_end(key)
+        return value
+
+
+def _cache_put(key: tuple[str, Any], value: Any, ttl: float) -> None:
+    if ttl <= 0 or not CACHE_SIZE:
+        return
+    now = time.monotonic()
+    with _cache_lock:
+        _cache[key] = (now + ttl, value)
+        _cache.move_to_end(key)
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+        while _cache:
+            oldest = next(iter(_cache.values()))
+            if oldest[0] >= now:
+                break
+            _cache.popitem(last=False)
+
+
+def _dec(x: Optional[Decimal]) -> Optional[str]:
+    return str(x) if x is not None else None
+
+
+# ---- sources (blocking; run in worker threads) ----
+
+def _src_ledger(telegram_id: int) -> Any:
+    from app.core.ledger import get_balance
+
+    return {"asset": "SLH", "balance": str(get_balance(telegram_id))}
+
+
+# slh_balances.user_id is an INTEGER column
+_INT4_MAX = 2**31 - 1
+
+
+def _src_slh(telegram_id: int) -> Any:
+    # The investments API (/invest) keys everything by a caller-supplied user_id; its
+    # clients send the Telegram user id, which is what this lookup relies on. Nothing in
+    # the schema ties the two together, and ids past INTEGER range can't be there at all.
+    from app.crud_investments import slh_balance
+
+    if not 0 < int(telegram_id) <= _INT4_MAX:
+        return {"slh_balance": None}
+    db = SessionLocal()
+    try:
+        return {"slh_balance": str(slh_balance(db, telegram_id))}
+    finally:
+        db.close()
+
+
+def _src_staking(telegram_id: int) -> Any:
+    db = SessionLocal()
+    try:
+        rows = db.execute(
+            select(
+                StakingPosition.id,
+                StakingPosition.pool_id,
+                StakingPosition.principal_amount,
+                StakingPosition.state,
+                StakingPosition.matures_at,
+                StakingPosition.total_reward_accrued,
+                StakingPosition.total_reward_claimed,
+            )
+            .where(StakingPosition.user_telegram_id == int(telegram_id))
+            .order_by(StakingPosition.created_at.desc())
+        ).all()
+    finally:
+        db.close()
+
+    return {
+        "count": len(rows),
+        "positions": [
+            {
+                "id": r.id,
+                "pool_id": r.pool_id,
+                "principal_amount": _dec(r.principal_amount),
+                "state": r.state,
+                "matures_at": r.matures_at.isoformat() if r.matures_at else None,
+                "total_reward_accrued": _dec(r.total_reward_accrued),
+                "total_reward_claimed": _dec(r.total_reward_claimed),
+            }
+            for r in rows
+        ],
+    }
+
+
+def _src_onchain(telegram_id: int, address: Optional[str]) -> Any:
+    from app import blockchain
+    from app.core.ledger import get_bnb_address
+
+    addr = address or get_bnb_address(telegram_id)
+    if not addr:
+        return {"address": None, "balances": None}
+    bal = blockchain.get_onchain_balances(addr)
+    return {
+        "address": addr,
+        "balances": {k: _dec(v) for k, v in bal.items()} if bal else None,
+    }
+
+
+async def _run_source(name: str, key: Any, fn: Callable[[], Any], fresh: bool) -> dict:
+    timeout, ttl = SOURCES[name]
+    t0 = time.perf_counter()
+
+    if not fresh:
+        cached = _cache_get((name, key))
+        if cached is not None:
+            return {"ok": True, "cached": True, "ms": round((time.perf_counter() - t0) * 1000, 2), "data": cached}
+
+    try:
+        data = await asyncio.wait_for(asyncio.to_thread(fn), timeout=timeout)
+    except asyncio.TimeoutError:
+        # the worker thread finishes in the background; its result is dropped
+        return {"ok": False, "cached": False, "ms": round((time.perf_counter() - t0) * 1000, 2), "error": "timeout"}
+    except Exception as e:
+        return {"ok": False, "cached": False, "ms": round((time.perf_counter() - t0) * 1000, 2), "error": str(e)[:200]}
+
+    _cache_put((name, key), data, ttl)
+    return {"ok": True, "cached": False, "ms": round((time.perf_counter() - t0) * 1000, 2), "data": data}
+
+
+@router.get("/portfolio/{telegram_id}")
+async def portfolio(telegram_id: int, address: Optional[str] = None, fresh: bool = False):
+    """
+    One investor's dashboard: off-chain ledger, SLH investments balance, staking
+    positions and on-chain balances, fetched concurrently.
+    Each source has its own timeout and short TTL cache; a failed or slow source
+    is reported in `sources` and the rest are still returned.
+    """
+    t0 = time.perf_counter()
+    jobs = {
+        "ledger": _run_source("ledger", telegram_id, lambda: _src_ledger(telegram_id), fresh),
+        "slh": _run_source("slh", telegram_id, lambda: _src_slh(telegram_id), fresh),
+        "staking": _run_source("staking", telegram_id, lambda: _src_staking(telegram_id), fresh),
+        "onchain": _run_source("onchain", (telegram_id, address), lambda: _src_onchain(telegram_id, address), fresh),
+    }
+    done = await asyncio.gather(*jobs.values())
+    sources = dict(zip(jobs.keys(), done))
+
+    return {
+        "telegram_id": telegram_id,
+        "partial": not all(s["ok"] for s in sources.values()),
+        "elapsed_ms": round((time.perf_counter() - t0) * 1000, 2),
+        "sources": sources,
+    }
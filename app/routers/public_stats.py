@@ -1,96 +1,37 @@
 from __future__ import annotations
 
-import os
-from datetime import datetime, timezone
-from typing import Any, Optional
+from typing import Optional
 
-from fastapi import APIRouter
-from sqlalchemy import create_engine, text
-
-router = APIRouter(tags=["public"])
-
-
-def utcnow() -> datetime:
-    return datetime.now(timezone.utc)
+from fastapi import APIRouter, Header, Response
 
+from app.core.staking.stats_snapshot import STATS
 
-def pick_db_url() -> str:
-    # Railway: internal DATABASE_URL (postgres.railway.internal)
-    return (os.getenv("DATABASE_URL") or "").strip()
+router = APIRouter(tags=["public"])
 
 
-def q1(engine, sql: str, params: Optional[dict[str, Any]] = None) -> Optional[dict[str, Any]]:
-    with engine.begin() as c:
-        r = c.execute(text(sql), params or {}).mappings().first()
-        return dict(r) if r else None
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # weak comparison (RFC 9110 13.1.2): W/ prefixes are ignored
+    opaque = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == opaque for tag in if_none_match.split(","))
 
 
 @router.get("/stats")
-def stats():
+def stats(if_none_match: Optional[str] = Header(default=None)):
     """
     Public, read-only, safe stats for landing/bot.
     Never returns secrets. If DB missing/unreachable, returns partial info.
+    Served from the in-memory snapshot (app.core.staking.stats_snapshot), refreshed in the
+    background; row counts are estimates.
     """
-    sha = os.getenv("RAILWAY_GIT_COMMIT_SHA") or os.getenv("GIT_SHA")
-    out: dict[str, Any] = {
-        "ok": True,
-        "ts": utcnow().isoformat(),
-        "service": os.getenv("RAILWAY_SERVICE_NAME") or "BOT_FACTORY",
-        "env": os.getenv("RAILWAY_ENVIRONMENT") or os.getenv("RAILWAY_ENVIRONMENT_NAME"),
-        "git_sha": sha,
-        "db": {"connected": False},
-        "staking": {},
+    snap = STATS.current()
+    headers = {
+        "ETag": snap.etag,
+        "Cache-Control": f"public, max-age={int(STATS.interval)}",
     }
-
-    db_url = pick_db_url()
-    if not db_url:
-        out["db"]["reason"] = "DATABASE_URL_missing"
-        return out
-
-    try:
-        e = create_engine(db_url, pool_pre_ping=True)
-
-        ping = q1(e, "select 1 as ok")
-        if not ping:
-            out["db"]["reason"] = "ping_failed"
-            return out
-
-        out["db"]["connected"] = True
-
-        counts = q1(
-            e,
-            """
-            select
-              (select count(*) from staking_pools) as pools,
-              (select count(*) from staking_positions) as positions_total,
-              (select count(*) from staking_positions where state='ACTIVE') as positions_active,
-              (select count(*) from staking_rewards) as rewards_rows,
-              (select count(*) from staking_events) as events_rows
-            """,
-        ) or {}
-
-        last = q1(
-            e,
-            """
-            select
-              (select max(created_at) from staking_rewards) as last_reward_at,
-              (select max(occurred_at) from staking_events) as last_event_at,
-              (select max(last_accrual_at) from staking_positions) as last_accrual_at
-            """,
-        ) or {}
-
-        tvl = q1(
-            e,
-            """
-            select coalesce(sum(principal_amount),0)::text as tvl_principal
-            from staking_positions
-            where state='ACTIVE'
-            """,
-        ) or {}
-
-        out["staking"] = {**counts, **last, **tvl}
-        return out
-
-    except Exception as ex:
-        out["db"]["error"] = str(ex)
-        return out
+    if _etag_matches(if_none_match, snap.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=snap.body, media_type="application/json", headers=headers)
@@ -1,30 +1,41 @@
 from __future__ import annotations
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
 from sqlalchemy import text
 from app.staking.service import accrue_position
 
 from app.database import get_db
 from app.models_staking import StakingPool, StakingPosition
-from app.core.staking import service
+from app.core.staking import pool_series, projections, service, summary, timeline
+from app.core.staking.fixed_point import from_units, to_units
+from app.core.staking.pool_cache import POOLS, CachedPool
 from app.schemas_staking import (
     PoolOut,
     CreatePositionIn,
     PositionOut,
+    EventOut,
     ClaimIn,
     ClaimOut,
+    ClaimAllIn,
+    ClaimAllOut,
     UnstakePrepareIn,
     UnstakePrepareOut,
     UnstakeConfirmIn,
     UnstakeConfirmOut,
+    ProjectionIn,
+    ProjectionsOut,
+    PoolSummaryOut,
+    StakingSummaryOut,
+    PoolSeriesOut,
 )
 
 router = APIRouter(prefix="/staking", tags=["staking"])
 
 
-def _pool_out(p: StakingPool) -> PoolOut:
+def _pool_out(p: StakingPool | CachedPool) -> PoolOut:
     return PoolOut(
         id=p.id,
         code=p.code,
@@ -60,6 +71,14 @@ def _pos_out(pos: StakingPosition) -> PositionOut:
     )
 
 
+def _row_out(r: dict) -> PositionOut:
+    return PositionOut(telegram_id=r["user_telegram_id"], **{k: v for k, v in r.items() if k != "user_telegram_id"})
+
+
+def _event_out(r: dict) -> EventOut:
+    return EventOut(telegram_id=r["user_telegram_id"], **{k: v for k, v in r.items() if k != "user_telegram_id"})
+
+
 @router.get("/pools", response_model=list[PoolOut])
 def list_pools(db: Session = Depends(get_db)):
     pools = service.list_active_pools(db)
@@ -74,6 +93,36 @@ def get_pool(code: str, db: Session = Depends(get_db)):
     return _pool_out(pool)
 
 
+@router.get("/pools/{code}/series", response_model=PoolSeriesOut)
+def get_pool_series(
+    code: str,
+    start: datetime | None = None,
+    end: datetime | None = None,
+    resolution: str = Query(default="auto", pattern="^(auto|hour|day|week|month)$"),
+    max_points: int = Query(default=500, ge=1, le=pool_series.MAX_POINTS),
+    db: Session = Depends(get_db),
+):
+    """
+    TVL, positions and APY over time plus per-bucket flows, from staking_pool_series.
+    Defaults to the last 30 days; resolution=auto picks the finest of hour/day/week/month
+    that fits in max_points. Levels are the last sample in a bucket, flows are summed.
+    """
+    pool = service.get_pool_by_code(db, code)
+    if not pool:
+        raise HTTPException(status_code=404, detail="Pool not found")
+    end = end or datetime.now(timezone.utc)
+    start = start or end - timedelta(days=30)
+    if end.tzinfo is None:
+        end = end.replace(tzinfo=timezone.utc)
+    if start.tzinfo is None:
+        start = start.replace(tzinfo=timezone.utc)
+    try:
+        resolution, points = pool_series.read_series(db, pool.id, start, end, resolution, max_points)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return PoolSeriesOut(pool_code=pool.code, resolution=resolution, start=start, end=end, points=points)
+
+
 @router.post("/positions", response_model=PositionOut)
 def create_position(body: CreatePositionIn, db: Session = Depends(get_db)):
     pool = service.get_pool_by_code(db, body.pool_code)
@@ -89,15 +138,49 @@ def create_position(body: CreatePositionIn, db: Session = Depends(get_db)):
         raise HTTPException(status_code=400, detail=str(e))
 
 
+@router.post("/projections", response_model=ProjectionsOut)
+def project(body: ProjectionIn, db: Session = Depends(get_db)):
+    """
+    What-if projections: explicit scenarios and/or a pool x amount x horizon grid
+    (an empty horizons list means each pool's lock period). Nothing is written.
+    X-Projection-Cache says whether the table came from the cache.
+    """
+    # size check before the grid is materialised (64 x 1000 x 1000 cells pass validation)
+    cells = len(body.scenarios)
+    if body.grid is not None:
+        g = body.grid
+        cells += len(g.pool_codes) * len(g.amounts) * max(len(g.horizons_seconds), 1)
+    if cells > projections.MAX_CELLS:
+        raise HTTPException(status_code=400, detail=f"Too many scenarios: {cells} > {projections.MAX_CELLS}")
+
+    scenarios = [projections.Scenario(s.pool_code, s.amount, s.horizon_seconds) for s in body.scenarios]
+    if body.grid is not None:
+        scenarios += projections.grid(g.pool_codes, g.amounts, g.horizons_seconds or [None])
+    if not scenarios:
+        raise HTTPException(status_code=400, detail="No scenarios")
+    try:
+        entry, cached = projections.project(db, scenarios, as_of=body.as_of)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if entry.body is None:
+        entry.body = ProjectionsOut(as_of=entry.as_of, count=entry.count, results=entry.results).model_dump_json().encode()
+    return Response(
+        content=entry.body,
+        media_type="application/json",
+        headers={"X-Projection-Cache": "hit" if cached else "miss"},
+    )
+
+
 # ---- Accrual (admin / internal) ----
 @router.post("/accrue")
-def accrue_all(db: Session = Depends(get_db)):
+def accrue_all(mode: str = Query(default="rows", pattern="^(rows|set)$"), db: Session = Depends(get_db)):
     """
     Accrue rewards for all ACTIVE positions (deterministic).
     Returns list of {position_id, reward} for rewards > 0.
+    mode=set runs the whole accrual as one set-based statement.
     """
     try:
-        results = service.accrue_all_active_positions(db)
+        results = service.accrue_all_active_positions(db, mode=mode)
         db.commit()
         return results
     except Exception as e:
@@ -106,14 +189,88 @@ def accrue_all(db: Session = Depends(get_db)):
 
 
 @router.get("/positions", response_model=list[PositionOut])
-def list_positions(telegram_id: int, db: Session = Depends(get_db)):
-    positions = (
-        db.query(StakingPosition)
-        .filter(StakingPosition.user_telegram_id == int(telegram_id))
-        .order_by(StakingPosition.created_at.desc())
-        .all()
+def list_positions(
+    response: Response,
+    telegram_id: int,
+    state: list[str] | None = Query(default=None),
+    limit: int = Query(default=100, ge=1, le=service.MAX_PAGE_SIZE),
+    cursor: str | None = None,
+    db: Session = Depends(get_db),
+):
+    """
+    Newest first, `limit` per page. Pass the X-Next-Cursor response header back as
+    `cursor` for the next page; no header means last page. `state` may repeat.
+    """
+    try:
+        rows, next_cursor = service.list_user_positions(db, telegram_id, states=state, limit=limit, cursor=cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return [_row_out(r) for r in rows]
+
+
+@router.get("/events", response_model=list[EventOut])
+def list_events(
+    response: Response,
+    telegram_id: int | None = None,
+    position_id: str | None = None,
+    type: list[str] | None = Query(default=None),
+    before: str | None = None,
+    limit: int = Query(default=100, ge=1, le=timeline.MAX_PAGE_SIZE),
+    format: str = Query(default="json", pattern="^(json|ndjson)$"),
+    db: Session = Depends(get_db),
+):
+    """
+    A user's or a position's staking events, newest first. `type` may repeat. `before` is
+    the X-Next-Cursor header of the previous page or an ISO timestamp; no header means last
+    page. format=ndjson streams every matching event (one JSON object per line, `limit`
+    ignored) for exports.
+    """
+    try:
+        if format == "ndjson":
+            pages = timeline.iter_event_pages(
+                db.get_bind(), telegram_id=telegram_id, position_id=position_id, types=type, before=before
+            )
+            # one chunk per page: a sync iterator costs a threadpool hop per chunk
+            chunks = (b"".join(_event_out(r).model_dump_json().encode() + b"\n" for r in page) for page in pages)
+            return StreamingResponse(chunks, media_type="application/x-ndjson")
+        rows, next_cursor = timeline.list_events(
+            db, telegram_id=telegram_id, position_id=position_id, types=type, limit=limit, before=before
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return [_event_out(r) for r in rows]
+
+
+@router.get("/summary/{telegram_id}", response_model=StakingSummaryOut)
+def staking_summary(telegram_id: int, db: Session = Depends(get_db)):
+    """
+    Per-pool and overall totals from user_staking_summary (primary-key range, no scan of
+    positions). Rewards are as of each position's last materialised accrual.
+    """
+    pools = []
+    totals = dict.fromkeys(("principal_staked", "total_reward_accrued", "total_reward_claimed"), 0)
+    positions_count = active_count = 0
+    for r in summary.get_user_summary(db, telegram_id):
+        pool = POOLS.get(db, r["pool_id"])
+        claimable = max(to_units(r["total_reward_accrued"]) - to_units(r["total_reward_claimed"]), 0)
+        pools.append(PoolSummaryOut(pool_code=pool.code if pool else None, claimable_reward=from_units(claimable), **r))
+        for k in totals:
+            totals[k] += to_units(r[k])
+        positions_count += r["positions_count"]
+        active_count += r["active_count"]
+
+    return StakingSummaryOut(
+        telegram_id=telegram_id,
+        positions_count=positions_count,
+        active_count=active_count,
+        claimable_reward=from_units(max(totals["total_reward_accrued"] - totals["total_reward_claimed"], 0)),
+        pools=pools,
+        **{k: from_units(v) for k, v in totals.items()},
     )
-    return [_pos_out(p) for p in positions]
 
 
 @router.get("/positions/{position_id}", response_model=PositionOut)
@@ -138,17 +295,30 @@ def claim(position_id: str, body: ClaimIn, db: Session = Depends(get_db)):
         raise HTTPException(status_code=400, detail=str(e))
 
 
+@router.post("/claim_all", response_model=ClaimAllOut)
+def claim_all(body: ClaimAllIn, db: Session = Depends(get_db)):
+    """
+    Claim all of a user's positions in one transaction. Replaying a request_id returns
+    the original per-position amounts with idempotent=true.
+    """
+    try:
+        out = service.claim_all_rewards(db, body.telegram_id, body.request_id)
+        db.commit()
+        return ClaimAllOut(**out)
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=400, detail=str(e))
+
+
 @router.post("/positions/{position_id}/unstake/prepare", response_model=UnstakePrepareOut)
 def unstake_prepare(position_id: str, body: UnstakePrepareIn, db: Session = Depends(get_db)):
     try:
+        # read-only: nothing to commit, get_db closes the read transaction
         quote = service.prepare_unstake_quote(db, position_id, body.telegram_id)
-        db.commit()
         return UnstakePrepareOut(**quote)
     except PermissionError as e:
-        db.rollback()
         raise HTTPException(status_code=403, detail=str(e))
     except Exception as e:
-        db.rollback()
         raise HTTPException(status_code=400, detail=str(e))
 
 
@@ -2,7 +2,7 @@ from __future__ import annotations
 
 from datetime import datetime
 from decimal import Decimal
-from typing import Optional
+from typing import Annotated, Optional
 
 from pydantic import BaseModel, Field
 
@@ -45,6 +45,21 @@ class PositionOut(BaseModel):
     total_reward_claimed: Decimal
 
 
+class EventOut(BaseModel):
+    id: str
+    seq: int
+    event_type: str
+    telegram_id: int
+    pool_id: Optional[str] = None
+    position_id: Optional[str] = None
+    request_id: Optional[str] = None
+    occurred_at: datetime
+    actor_type: str
+    actor_id: Optional[str] = None
+    amount: Optional[Decimal] = None
+    details: Optional[dict] = None
+
+
 class ClaimIn(BaseModel):
     telegram_id: int = Field(..., ge=1)
     request_id: Optional[str] = None
@@ -55,6 +70,18 @@ class ClaimOut(BaseModel):
     claimed: Decimal
 
 
+class ClaimAllIn(BaseModel):
+    telegram_id: int = Field(..., ge=1)
+    request_id: Optional[str] = Field(default=None, min_length=1, max_length=64)
+
+
+class ClaimAllOut(BaseModel):
+    request_id: str
+    idempotent: bool
+    total: Decimal
+    claims: list[ClaimOut]
+
+
 class UnstakePrepareIn(BaseModel):
     telegram_id: int = Field(..., ge=1)
 
@@ -80,4 +107,97 @@ class UnstakeConfirmOut(BaseModel):
     ok: bool
     penalty: str | None = None
     matured: bool | None = None
-    idempotent: bool | None = None
\ No newline at end of file
+    idempotent: bool | None = None
+
+HorizonSeconds = Annotated[int, Field(ge=1, le=10 * 365 * 24 * 60 * 60)]
+
+
+class ProjectionScenarioIn(BaseModel):
+    pool_code: str = Field(..., min_length=1, max_length=64)
+    amount: Decimal = Field(..., gt=0)
+    # default: the pool's lock period (one year for unlocked pools)
+    horizon_seconds: Optional[HorizonSeconds] = None
+
+
+class ProjectionGridIn(BaseModel):
+    pool_codes: list[str] = Field(..., min_length=1, max_length=64)
+    amounts: list[Decimal] = Field(..., min_length=1, max_length=1000)
+    horizons_seconds: list[HorizonSeconds] = Field(default_factory=list, max_length=1000)
+
+
+class ProjectionIn(BaseModel):
+    scenarios: list[ProjectionScenarioIn] = Field(default_factory=list)
+    grid: Optional[ProjectionGridIn] = None
+    as_of: Optional[datetime] = None
+
+
+class ProjectionOut(BaseModel):
+    pool_code: str
+    amount: Decimal
+    horizon_seconds: int
+    apy_bps: Optional[int] = None
+    accrual_seconds: Optional[int] = None
+    reward: Optional[Decimal] = None
+    matures_at: Optional[datetime] = None
+    matured: Optional[bool] = None
+    penalty: Optional[Decimal] = None
+    net_principal: Optional[Decimal] = None
+    total_at_horizon: Optional[Decimal] = None
+    error: Optional[str] = None
+
+
+class ProjectionsOut(BaseModel):
+    as_of: datetime
+    count: int
+    results: list[ProjectionOut]
+
+
+class PoolSummaryOut(BaseModel):
+    pool_id: str
+    pool_code: Optional[str] = None
+    positions_count: int
+    created_count: int
+    active_count: int
+    completed_count: int
+    withdrawn_count: int
+    cancelled_count: int
+    principal_staked: Decimal
+    principal_total: Decimal
+    total_reward_accrued: Decimal
+    total_reward_claimed: Decimal
+    claimable_reward: Decimal
+    updated_at: datetime
+
+
+class StakingSummaryOut(BaseModel):
+    telegram_id: int
+    positions_count: int
+    active_count: int
+    principal_staked: Decimal
+    total_reward_accrued: Decimal
+    total_reward_claimed: Decimal
+    claimable_reward: Decimal
+    pools: list[PoolSummaryOut]
+
+
+class PoolSeriesPointOut(BaseModel):
+    bucket_start: datetime
+    tvl: Decimal
+    open_positions: int
+    active_positions: int
+    apy_bps: Optional[int] = None
+    staked: Decimal
+    withdrawn: Decimal
+    rewards_accrued: Decimal
+    rewards_claimed: Decimal
+    positions_opened: int
+    positions_closed: int
+    claims: int
+
+
+class PoolSeriesOut(BaseModel):
+    pool_code: str
+    resolution: str
+    start: datetime
+    end: datetime
+    points: list[PoolSeriesPointOut]
@@ -1,5 +1,7 @@
 from decimal import Decimal
-from .constants import YEAR_SECONDS, ZERO
+
+from app.core.staking.fixed_point import accrue_units, from_units, to_units
+from .constants import ZERO
 
 def calculate_reward(
     principal: Decimal,
@@ -9,5 +11,4 @@ def calculate_reward(
     if elapsed_seconds <= 0 or apy_bps <= 0:
         return ZERO
 
-    rate = Decimal(apy_bps) / Decimal(10_000)
-    return principal * rate * (Decimal(elapsed_seconds) / YEAR_SECONDS)
+    return from_units(accrue_units(to_units(principal), int(apy_bps), int(elapsed_seconds)))
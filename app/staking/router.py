@@ -1,9 +1,10 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from sqlalchemy.orm import Session
 from sqlalchemy import text
 from datetime import datetime, timezone
 
-from app.db import get_db
+from app.database import get_db
+from app.core.staking.service import MAX_PAGE_SIZE, list_user_positions
 from .service import accrue_position
 from .schemas import AccrueResult, PositionsResponse, PositionOut
 
@@ -36,16 +37,23 @@ def accrue_all(db: Session = Depends(get_db)):
 
 
 @router.get("/positions/{telegram_id}", response_model=PositionsResponse)
-def list_positions(telegram_id: int, db: Session = Depends(get_db)):
-    rows = db.execute(text("""
-        select id, pool_id, principal_amount, state,
-               activated_at, last_accrual_at, total_reward_accrued
-        from staking_positions
-        where user_telegram_id = :uid
-        order by created_at desc
-    """), {"uid": telegram_id}).mappings().all()
+def list_positions(
+    telegram_id: int,
+    response: Response,
+    state: list[str] | None = Query(default=None),
+    limit: int = Query(default=100, ge=1, le=MAX_PAGE_SIZE),
+    cursor: str | None = None,
+    db: Session = Depends(get_db),
+):
+    try:
+        rows, next_cursor = list_user_positions(db, telegram_id, states=state, limit=limit, cursor=cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
 
     return PositionsResponse(
         telegram_id=telegram_id,
         positions=[PositionOut(**r) for r in rows],
+        next_cursor=next_cursor,
     )
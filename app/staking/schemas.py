@@ -22,3 +22,4 @@ class PositionOut(BaseModel):
 class PositionsResponse(BaseModel):
     telegram_id: int
     positions: List[PositionOut]
+    next_cursor: Optional[str] = None
@@ -0,0 +1,166 @@
+"""
+Property check + micro-benchmark for app.core.staking.fixed_point.
+
+check: random and boundary (principal, apy_bps, seconds) cases; accrue_units /
+accrue_units_batch / calc_reward must equal an exact Decimal reference
+(prec 200, one division, ROUND_DOWN to 18 dp) bit-for-bit. With --sql the same
+cases are also evaluated by the NUMERIC expression used by set-based accrual.
+
+bench: positions/sec for accrue_units_batch (ints in, ints out), accrue_batch
+(Decimal in/out) and the old three-step Decimal formula.
+
+Usage:
+    python tools/bench_fixed_point_accrual.py --cases 200000 --positions 2000000
+    DATABASE_URL=postgresql://... python tools/bench_fixed_point_accrual.py --sql
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from decimal import ROUND_DOWN, Context, Decimal
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from app.core.staking.calculator import calc_reward  # noqa: E402
+from app.core.staking.fixed_point import (  # noqa: E402
+    DENOMINATOR,
+    Q18,
+    UNIT,
+    accrue_batch,
+    accrue_units,
+    accrue_units_batch,
+    from_units,
+    to_units,
+)
+
+REF_CTX = Context(prec=200)
+MAX_PRINCIPAL_UNITS = 10**38 - 1  # NUMERIC(38,18)
+
+
+def reference(principal: Decimal, apy_bps: int, seconds: int) -> Decimal:
+    if principal <= 0 or apy_bps <= 0 or seconds <= 0:
+        return Decimal(0).quantize(Q18)
+    num = REF_CTX.multiply(REF_CTX.multiply(principal, Decimal(apy_bps)), Decimal(seconds))
+    return REF_CTX.divide(num, Decimal(DENOMINATOR)).quantize(Q18, rounding=ROUND_DOWN, context=REF_CTX)
+
+
+def gen_cases(n: int, seed: int) -> list[tuple[int, int, int]]:
+    rnd = random.Random(seed)
+    cases: list[tuple[int, int, int]] = [
+        (0, 500, 60), (1, 1, 1), (1, 10_000, 31_536_000), (UNIT, 0, 60), (UNIT, 500, 0),
+        (MAX_PRINCIPAL_UNITS, 100_000, 10 * 31_536_000), (DENOMINATOR, 1, 1),
+    ]
+    while len(cases) < n:
+        kind = rnd.random()
+        apy = rnd.choice((1, 500, 1200, 3333, 9999, 10_000, rnd.randint(1, 100_000)))
+        secs = rnd.choice((1, 59, 60, 3600, 86_400, 31_536_000, rnd.randint(1, 5 * 31_536_000)))
+        if kind < 0.2:
+            # exact boundaries: numerator is a multiple of the denominator, +/- 1 unit
+            q = rnd.randint(1, 10**12)
+            p = q * DENOMINATOR // (apy * secs) + rnd.choice((-1, 0, 1))
+            p = min(max(1, p), MAX_PRINCIPAL_UNITS)
+        elif kind < 0.6:
+            p = rnd.randint(1, 10**24)  # up to 1e6 with 18 dp tails
+        else:
+            p = rnd.randint(1, MAX_PRINCIPAL_UNITS)
+        cases.append((p, apy, secs))
+    return cases
+
+
+def check(n: int, seed: int) -> dict:
+    cases = gen_cases(n, seed)
+    t0 = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    batch = accrue_units_batch([c[0] for c in cases], [c[1] for c in cases], [c[2] for c in cases])
+    dec_batch = accrue_batch([from_units(c[0]) for c in cases], [c[1] for c in cases], [c[2] for c in cases])
+
+    mismatches = []
+    for (p, apy, secs), b, db in zip(cases, batch, dec_batch):
+        principal = from_units(p)
+        ref = reference(principal, apy, secs)
+        single = from_units(accrue_units(p, apy, secs))
+        calc = calc_reward(principal, apy, t0, t0 + timedelta(seconds=secs)).amount
+        if not (to_units(principal) == p and ref == single == from_units(b) == db == calc):
+            mismatches.append((p, apy, secs, str(ref), str(single), str(calc)))
+    return {"cases": len(cases), "mismatches": len(mismatches), "sample": mismatches[:5]}
+
+
+def check_sql(n: int, seed: int) -> dict:
+    from sqlalchemy import create_engine, text
+
+    cases = gen_cases(n, seed)
+    engine = create_engine(os.environ["DATABASE_URL"])
+    sql = text("""
+        SELECT (div(CAST(:p AS numeric(38,18)) * 1000000000000000000 * :apy * :secs, 315360000000)
+                * 0.000000000000000001)::text
+    """)
+    mismatches = []
+    with engine.connect() as c:
+        for p, apy, secs in cases:
+            got = c.execute(sql, {"p": str(from_units(p)), "apy": apy, "secs": secs}).scalar_one()
+            want = from_units(accrue_units(p, apy, secs))
+            if Decimal(got) != want:
+                mismatches.append((p, apy, secs, got, str(want)))
+    return {"cases": len(cases), "mismatches": len(mismatches), "sample": mismatches[:5]}
+
+
+def _old_formula(principal: Decimal, apy_bps: int, seconds: int) -> Decimal:
+    # the pre-fixed-point calc_reward body (global prec 60)
+    rate = REF_CTX.divide(Decimal(apy_bps), Decimal(10000))
+    frac = REF_CTX.divide(Decimal(seconds), Decimal(31_536_000))
+    return REF_CTX.multiply(REF_CTX.multiply(principal, rate), frac).quantize(Q18, rounding=ROUND_DOWN, context=REF_CTX)
+
+
+def bench(n: int, seed: int) -> dict:
+    rnd = random.Random(seed)
+    p = [rnd.randint(UNIT, 10**6 * UNIT) for _ in range(n)]
+    a = [rnd.choice((500, 1200, 3333)) for _ in range(n)]
+    s = [rnd.randint(60, 86_400) for _ in range(n)]
+    out: dict = {"positions": n}
+
+    t = time.perf_counter()
+    accrue_units_batch(p, a, s)
+    el = time.perf_counter() - t
+    out["units_batch_per_s"] = round(n / el)
+
+    dp = [from_units(x) for x in p]
+    t = time.perf_counter()
+    accrue_batch(dp, a, s)
+    el = time.perf_counter() - t
+    out["decimal_batch_per_s"] = round(n / el)
+
+    m = min(n, 200_000)
+    t = time.perf_counter()
+    for i in range(m):
+        _old_formula(dp[i], a[i], s[i])
+    el = time.perf_counter() - t
+    out["old_decimal_per_s"] = round(m / el)
+    return out
+
+
+def main() -> dict:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--cases", type=int, default=100_000)
+    ap.add_argument("--positions", type=int, default=1_000_000)
+    ap.add_argument("--seed", type=int, default=20261019)
+    ap.add_argument("--sql", action="store_true", help="also check against Postgres NUMERIC (DATABASE_URL)")
+    args = ap.parse_args()
+
+    out = {"check": check(args.cases, args.seed)}
+    print("check", out["check"])
+    if args.sql:
+        out["check_sql"] = check_sql(min(args.cases, 5000), args.seed)
+        print("check_sql", out["check_sql"])
+    out["bench"] = bench(args.positions, args.seed)
+    print("bench", out["bench"])
+    return out
+
+
+if __name__ == "__main__":
+    main()
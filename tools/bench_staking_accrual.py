@@ -0,0 +1,201 @@
+"""
+Staking accrual benchmark: per-row vs set-based accrue_all_active_positions.
+
+Seeds a scratch schema (default: bench_accrual) with pools and ACTIVE positions,
+runs each mode against the same data at the same `now` inside a transaction that
+is rolled back, compares the per-position rewards and prints timings.
+
+With --workers 1,2,4,8 it also measures the chunked runner: a serial run_accrual
+baseline, then run_accrual_parallel at each worker count on freshly seeded data,
+checking that every position's accrued total equals the serial run.
+
+Usage:
+    DATABASE_URL=postgresql://... python tools/bench_staking_accrual.py --positions 100000
+    DATABASE_URL=postgresql://... python tools/bench_staking_accrual.py --modes rows,set --workers 1,2,4,8
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from sqlalchemy import create_engine, text  # noqa: E402
+from sqlalchemy.orm import Session  # noqa: E402
+
+from app.database import Base  # noqa: E402
+from app.models_staking import (  # noqa: E402
+    StakingAccrualRun,
+    StakingEvent,
+    StakingPool,
+    StakingPoolIndexPoint,
+    StakingPosition,
+    StakingReward,
+    UserStakingSummary,
+)
+from app.core.staking.accrual_runner import run_accrual, run_accrual_parallel  # noqa: E402
+from app.core.staking.service import ACCRUAL_MODES, accrue_all_active_positions  # noqa: E402
+from app.core.staking.partitions import ensure_partitions  # noqa: E402
+from app.core.staking.pool_cache import POOLS  # noqa: E402
+from app.core.staking.summary import verify_batch  # noqa: E402
+
+TABLES = [
+    StakingPool.__table__,
+    StakingPosition.__table__,
+    StakingReward.__table__,
+    StakingEvent.__table__,
+    StakingAccrualRun.__table__,
+    StakingPoolIndexPoint.__table__,
+    UserStakingSummary.__table__,
+]
+
+
+def seed(engine, schema: str, positions: int, now: datetime) -> None:
+    POOLS.clear()  # pools are recreated; don't serve a previous schema's snapshot
+    with engine.begin() as c:
+        c.execute(text(f"DROP SCHEMA IF EXISTS {schema} CASCADE"))
+        c.execute(text(f"CREATE SCHEMA {schema}"))
+    mapped = engine.execution_options(schema_translate_map={None: schema})
+    with mapped.begin() as c:
+        Base.metadata.create_all(c, tables=TABLES)
+
+    with engine.begin() as c:
+        c.execute(text(f"SET LOCAL search_path TO {schema}"))
+        # monthly partitions of rewards / events: the seeded history plus what a run writes
+        ensure_partitions(c, now=max(now, datetime.now(timezone.utc)), start=now - timedelta(days=45))
+        c.execute(text("""
+            INSERT INTO staking_pools (id, code, name, asset_symbol, reward_asset_symbol, apy_bps, lock_seconds)
+            VALUES ('pool-a', 'A', 'A', 'SLH', 'SLH', 500, 0),
+                   ('pool-b', 'B', 'B', 'SLH', 'SLH', 1200, 2592000),
+                   ('pool-c', 'C', 'C', 'SLH', 'SLH', 3333, 31536000)
+        """))
+        # varied principals (with 18-dp tails), ages and maturities
+        c.execute(text("""
+            INSERT INTO staking_positions
+                (id, user_telegram_id, pool_id, principal_amount, state,
+                 created_at, activated_at, last_accrual_at, matures_at)
+            SELECT 'pos-' || g,
+                   1000 + (g % 5000),
+                   (ARRAY['pool-a', 'pool-b', 'pool-c'])[1 + g % 3],
+                   (1 + (g * 7919) % 100000) + ((g * 104729) % 1000000000000000000) / 1e18,
+                   'ACTIVE',
+                   CAST(:now AS timestamptz) - make_interval(secs => 86400 * 40),
+                   CAST(:now AS timestamptz) - make_interval(secs => 86400 * 40),
+                   CAST(:now AS timestamptz) - make_interval(secs => 60 + (g * 7) % 86400 + (g % 1000) / 1000.0),
+                   CASE WHEN g % 3 = 1 THEN CAST(:now AS timestamptz) - make_interval(secs => (g * 13) % 7200 - 3600)
+                        ELSE NULL END
+            FROM generate_series(1, CAST(:n AS bigint)) g
+        """), {"now": now, "n": positions})
+        # positions were inserted behind the service's back: build their summaries
+        verify_batch(c, batch=positions, fix=True)
+        c.execute(text("ANALYZE staking_positions"))
+
+
+def run_mode(scratch, mode: str, now: datetime) -> tuple[float, dict[str, str]]:
+    # scratch: an engine whose connections default to the schema (the pool cache probes on its own one)
+    with scratch.connect() as conn:
+        trans = conn.begin()
+        try:
+            db = Session(bind=conn)
+            t0 = time.perf_counter()
+            res = accrue_all_active_positions(db, now=now, mode=mode)
+            db.flush()
+            elapsed = time.perf_counter() - t0
+        finally:
+            trans.rollback()
+    return elapsed, {r["position_id"]: str(r["reward"]) for r in res}
+
+
+def _totals(engine, schema: str) -> dict[str, str]:
+    with engine.connect() as c:
+        rows = c.execute(text(f"SELECT id, total_reward_accrued FROM {schema}.staking_positions")).all()
+    return {r[0]: str(r[1]) for r in rows}
+
+
+def run_workers(url: str, schema: str, positions: int, now: datetime, workers: list[int], chunk_size: int) -> dict:
+    kw = {"connect_args": {"options": f"-csearch_path={schema}"}}
+    engine = create_engine(url)
+    out: dict = {}
+
+    seed(engine, schema, positions, now)
+    t0 = time.perf_counter()
+    run_accrual(create_engine(url, **kw), chunk_size=chunk_size, now=now)
+    serial_s = time.perf_counter() - t0
+    baseline = _totals(engine, schema)
+    out["serial"] = {"seconds": round(serial_s, 3), "positions_per_s": round(positions / serial_s, 1)}
+    print("serial", out["serial"])
+
+    for w in workers:
+        seed(engine, schema, positions, now)
+        res = run_accrual_parallel(url, workers=w, chunk_size=chunk_size, now=now, engine_kwargs=kw)
+        got = _totals(engine, schema)
+        diff = [k for k in baseline if baseline[k] != got.get(k)]
+        info = {
+            "seconds": res["elapsed_s"],
+            "worker_busy_s_max": res["worker_busy_s_max"],
+            "positions_per_s": res["positions_per_s"],
+            "speedup_vs_1": None,
+            "mismatches": len(diff),
+            "per_worker": res["per_worker"],
+        }
+        out[f"workers_{w}"] = info
+        if f"workers_{workers[0]}" in out and res["elapsed_s"]:
+            info["speedup_vs_1"] = round(out[f"workers_{workers[0]}"]["seconds"] / res["elapsed_s"], 2)
+        print(f"workers={w}", info)
+    return out
+
+
+def main() -> dict:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--positions", type=int, default=10000)
+    ap.add_argument("--schema", default="bench_accrual")
+    ap.add_argument("--modes", default=",".join(ACCRUAL_MODES))
+    ap.add_argument("--keep", action="store_true", help="keep the scratch schema")
+    ap.add_argument("--workers", default="", help="e.g. 1,2,4,8: also benchmark the parallel runner")
+    ap.add_argument("--chunk-size", type=int, default=1000)
+    args = ap.parse_args()
+
+    engine = create_engine(os.environ["DATABASE_URL"])
+    scratch = create_engine(os.environ["DATABASE_URL"], connect_args={"options": f"-csearch_path={args.schema}"})
+    now = datetime.now(timezone.utc).replace(microsecond=0) + timedelta(seconds=1)
+
+    seed(engine, args.schema, args.positions, now)
+
+    out: dict = {"positions": args.positions, "modes": {}}
+    baseline: dict[str, str] | None = None
+    for mode in filter(None, args.modes.split(",")):
+        elapsed, rewards = run_mode(scratch, mode, now)
+        info = {
+            "seconds": round(elapsed, 3),
+            "positions_per_s": round(args.positions / elapsed, 1) if elapsed > 0 else None,
+            "rewarded": len(rewards),
+        }
+        if baseline is None:
+            baseline = rewards
+        else:
+            diff = [k for k in set(baseline) | set(rewards) if baseline.get(k) != rewards.get(k)]
+            info["mismatches"] = len(diff)
+            info["mismatch_sample"] = [(k, baseline.get(k), rewards.get(k)) for k in sorted(diff)[:5]]
+        out["modes"][mode] = info
+        print(mode, info)
+
+    if args.workers:
+        workers = [int(w) for w in args.workers.split(",")]
+        out["workers"] = run_workers(
+            os.environ["DATABASE_URL"], args.schema, args.positions, now, workers, args.chunk_size
+        )
+
+    if not args.keep:
+        with engine.begin() as c:
+            c.execute(text(f"DROP SCHEMA IF EXISTS {args.schema} CASCADE"))
+    return out
+
+
+if __name__ == "__main__":
+    main()
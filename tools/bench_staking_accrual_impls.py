@@ -0,0 +1,378 @@
+"""
+Benchmark the three staking accrual implementations against each other and a reference.
+
+    core_rows / core_set  app.core.staking.service.accrue_all_active_positions(mode=...)
+    legacy                app.staking.service.accrue_position, once per ACTIVE position with a
+                          shared `now`, the way app/staking/router.py drives it
+    cli                   tools/run_staking_accrual_once.main (serial chunked runner)
+
+For every size in --sizes each implementation gets a freshly seeded scratch schema (the
+pools / positions of tools/bench_staking_accrual.py, autovacuum off) and is measured for:
+
+    seconds          wall time of the call, commit included
+    statements       cursor executions issued from this process (SQLAlchemy event), except the
+                     lock sampler's own polls
+    rows_written     n_tup_ins + n_tup_upd + n_tup_del of the schema's tables (pg_stat_user_tables,
+                     partitions folded into their parent), split by table
+    wal_bytes        pg_current_wal_lsn() difference: cluster-wide, run it on an idle server
+    lock_wait_s      backends of this database seen waiting on a heavyweight lock, sampled from
+                     pg_stat_activity every --sample-ms (waiter-samples x interval)
+
+Then each position's total_reward_accrued is diffed against an independent reference:
+floor(principal * apy_bps / 10000 * s / 31536000) to 1e-18, s = whole seconds from the last
+accrual to min(as_of, matures_at, pool.ends_at). `legacy` additionally gets its formula (no
+maturity cap) diffed against the reference without writing, since its run may fail.
+
+Usage:
+    DATABASE_URL=postgresql://... python tools/bench_staking_accrual_impls.py
+    DATABASE_URL=postgresql://... python tools/bench_staking_accrual_impls.py --sizes 10000 --impls core_set,cli
+"""
+from __future__ import annotations
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from pathlib import Path
+from urllib.parse import quote
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from sqlalchemy import create_engine, event, text  # noqa: E402
+from sqlalchemy.engine import Engine  # noqa: E402
+from sqlalchemy.orm import Session  # noqa: E402
+
+from app.core.staking.service import accrue_all_active_positions  # noqa: E402
+from app.models_staking import StakingPool, StakingPosition  # noqa: E402
+from app.staking.accrual import calculate_reward  # noqa: E402
+from app.staking.service import accrue_position  # noqa: E402
+
+from bench_staking_accrual import seed  # noqa: E402
+import run_staking_accrual_once  # noqa: E402
+
+IMPLEMENTATIONS = ("core_rows", "core_set", "legacy", "cli")
+
+YEAR_SECONDS = 365 * 86400
+UNITS = Decimal(10) ** 18
+
+# ---------------------------------------------------------------------------
+# process-wide instrumentation: every engine (the runner makes its own) is seen
+# ---------------------------------------------------------------------------
+
+_counter = {"statements": 0}
+_engines: set[Engine] = set()
+# measurement engines (LockSampler): their statements aren't the implementation's
+_uncounted: set[Engine] = set()
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _count(conn, cursor, statement, parameters, context, executemany):
+    if conn.engine not in _uncounted:
+        _counter["statements"] += 1
+
+
+@event.listens_for(Engine, "engine_connect")
+def _track(conn):
+    _engines.add(conn.engine)
+
+
+def _release_connections() -> None:
+    """Close every pooled backend: a backend flushes its table stats on exit."""
+    for e in list(_engines):
+        e.dispose()
+
+
+# ---------------------------------------------------------------------------
+# server-side measurements
+# ---------------------------------------------------------------------------
+
+_TABLE_STATS_SQL = text(r"""
+    SELECT regexp_replace(relname, '_p[0-9]{6}$', '') AS name,
+           SUM(n_tup_ins + n_tup_upd + n_tup_del) AS n
+    FROM pg_stat_user_tables
+    WHERE schemaname = :schema
+    GROUP BY 1
+""")
+
+_LOCK_WAITERS_SQL = text("""
+    SELECT count(*) FROM pg_stat_activity
+    WHERE datname = current_database() AND wait_event_type = 'Lock' AND pid <> pg_backend_pid()
+""")
+
+
+def _table_writes(engine, schema: str) -> dict[str, int]:
+    """Stats as of now, once exiting backends have reported (polled until stable)."""
+    prev = None
+    for _ in range(25):
+        with engine.connect() as c:
+            cur = {r[0]: int(r[1]) for r in c.execute(_TABLE_STATS_SQL, {"schema": schema})}
+        if cur == prev:
+            return cur
+        prev = cur
+        time.sleep(0.2)
+    return prev or {}
+
+
+def _wal_lsn(engine) -> str:
+    with engine.connect() as c:
+        return str(c.execute(text("SELECT pg_current_wal_lsn()")).scalar_one())
+
+
+def _wal_diff(engine, lsn_after: str, lsn_before: str) -> int:
+    with engine.connect() as c:
+        return int(c.execute(text("SELECT pg_wal_lsn_diff(:a, :b)"), {"a": lsn_after, "b": lsn_before}).scalar_one())
+
+
+class LockSampler(threading.Thread):
+    def __init__(self, url: str, interval_s: float):
+        super().__init__(daemon=True)
+        self.engine = create_engine(url)
+        _uncounted.add(self.engine)
+        self.interval_s = interval_s
+        self.waiter_samples = 0
+        self.max_waiters = 0
+        self.samples = 0
+        self._done = threading.Event()
+
+    def run(self) -> None:
+        with self.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as c:
+            while not self._done.wait(self.interval_s):
+                n = int(c.execute(_LOCK_WAITERS_SQL).scalar_one())
+                self.samples += 1
+                self.waiter_samples += n
+                self.max_waiters = max(self.max_waiters, n)
+
+    def stop(self) -> dict:
+        self._done.set()
+        self.join()
+        self.engine.dispose()
+        _uncounted.discard(self.engine)
+        return {
+            "lock_wait_s": round(self.waiter_samples * self.interval_s, 3),
+            "max_lock_waiters": self.max_waiters,
+            "lock_samples": self.samples,
+        }
+
+
+# ---------------------------------------------------------------------------
+# reference calculator
+# ---------------------------------------------------------------------------
+
+
+def reference_reward(principal: Decimal, apy_bps: int, seconds: int) -> Decimal:
+    """floor(principal * apy_bps/10000 * seconds/365d) to 18 decimals, in exact integers."""
+    if seconds <= 0 or apy_bps <= 0:
+        return Decimal(0)
+    units = int(Decimal(principal) * UNITS)
+    return Decimal(units * int(apy_bps) * int(seconds) // (10000 * YEAR_SECONDS)) / UNITS
+
+
+def _whole_seconds(start: datetime, end: datetime) -> int:
+    return (end - start) // timedelta(seconds=1)
+
+
+# the pre-run state every diff is computed from, kept next to the data it describes
+_SNAPSHOT_SQL = """
+    CREATE TABLE {schema}.bench_before AS
+    SELECT p.id, p.principal_amount, s.apy_bps, COALESCE(p.last_accrual_at, p.activated_at) AS last_at,
+           p.matures_at, s.ends_at, p.total_reward_accrued
+    FROM {schema}.staking_positions p
+    JOIN {schema}.staking_pools s ON s.id = p.pool_id
+    WHERE p.state = 'ACTIVE' AND p.reward_index_snapshot IS NULL
+"""
+
+_DIFF_SQL = """
+    SELECT b.id, b.principal_amount, b.apy_bps, b.last_at, b.matures_at, b.ends_at,
+           b.total_reward_accrued AS before, p.total_reward_accrued AS after
+    FROM {schema}.bench_before b
+    JOIN {schema}.staking_positions p ON p.id = b.id
+"""
+
+
+def _stream(engine, sql: str):
+    with engine.connect() as c:
+        yield from c.execution_options(yield_per=10000).execute(text(sql))
+
+
+def diff_totals(engine, schema: str, as_of: datetime) -> dict:
+    """Compare each position's accrued total with before + reference reward up to as_of."""
+    n = mismatches = 0
+    max_dev = expected_sum = got_sum = Decimal(0)
+    sample: list = []
+    for r in _stream(engine, _DIFF_SQL.format(schema=schema)):
+        end = min(t for t in (as_of, r.matures_at, r.ends_at) if t is not None)
+        expected = Decimal(r.before) + reference_reward(r.principal_amount, r.apy_bps, _whole_seconds(r.last_at, end))
+        got = Decimal(r.after)
+        n += 1
+        expected_sum += expected
+        got_sum += got
+        if got != expected:
+            mismatches += 1
+            max_dev = max(max_dev, abs(got - expected))
+            if len(sample) < 5:
+                sample.append((r.id, str(expected), str(got)))
+    return {
+        "positions": n,
+        "mismatches": mismatches,
+        "max_abs_deviation": str(max_dev),
+        "total_expected": str(expected_sum),
+        "total_diff": str(got_sum - expected_sum),
+        "mismatch_sample": sample,
+    }
+
+
+def diff_legacy_math(engine, schema: str, as_of: datetime) -> dict:
+    """The legacy reward (calculate_reward on now - last, no maturity cap) vs the reference."""
+    mismatches = over_maturity = 0
+    excess = Decimal(0)
+    for r in _stream(engine, _DIFF_SQL.format(schema=schema)):
+        end = min(t for t in (as_of, r.matures_at, r.ends_at) if t is not None)
+        expected = reference_reward(r.principal_amount, r.apy_bps, _whole_seconds(r.last_at, end))
+        legacy = calculate_reward(Decimal(r.principal_amount), int(r.apy_bps), int((as_of - r.last_at).total_seconds()))
+        if legacy != expected:
+            mismatches += 1
+            excess += legacy - expected
+            if end < as_of:
+                over_maturity += 1
+    return {"mismatches": mismatches, "past_maturity": over_maturity, "excess_reward": str(excess)}
+
+
+# ---------------------------------------------------------------------------
+# implementations: each returns the as_of it accrued to
+# ---------------------------------------------------------------------------
+
+
+def _run_core(scratch, now: datetime, mode: str) -> datetime:
+    # scratch: an engine whose connections default to the schema (the pool cache probes on its own one)
+    with scratch.connect() as conn, conn.begin():
+        db = Session(bind=conn)
+        accrue_all_active_positions(db, now=now, mode=mode)
+        db.flush()
+    return now
+
+
+def _run_legacy(scratch, now: datetime) -> datetime:
+    # router.accrue_all can't be called as is (type() of a RowMapping raises), and never
+    # commits: this is the loop it means to run, on mapped positions, committed at the end
+    with scratch.connect() as conn, conn.begin():
+        db = Session(bind=conn)
+        pools = {p.id: p for p in db.query(StakingPool).all()}
+        for pos in db.query(StakingPosition).filter(StakingPosition.state == "ACTIVE"):
+            accrue_position(db, pos, pools[pos.pool_id], now=now)
+        db.flush()
+    return now
+
+
+def _run_cli(url: str, chunk_size: int) -> datetime:
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = run_staking_accrual_once.main(
+            ["--db-url", url, "--no-resume", "--chunk-size", str(chunk_size), "--workers", "1"]
+        )
+    if result.get("skipped") or result.get("status") != "COMPLETED":
+        raise RuntimeError(f"runner did not complete: {result.get('status') or 'skipped'}")
+    return datetime.fromisoformat(result["as_of"])
+
+
+def _scratch_url(url: str, schema: str) -> str:
+    sep = "&" if "?" in url else "?"
+    return f"{url}{sep}options={quote(f'-csearch_path={schema}')}"
+
+
+def _prepare(engine, schema: str, positions: int, now: datetime) -> None:
+    seed(engine, schema, positions, now)
+    with engine.begin() as c:
+        for (name,) in c.execute(
+            text("SELECT relname FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace "
+                 "WHERE n.nspname = :s AND c.relkind = 'r'"),
+            {"s": schema},
+        ):
+            c.execute(text(f'ALTER TABLE {schema}."{name}" SET (autovacuum_enabled = false)'))
+        c.execute(text(_SNAPSHOT_SQL.format(schema=schema)))
+
+
+def bench_one(url: str, engine, scratch, schema: str, impl: str, positions: int, args) -> dict:
+    now = datetime.now(timezone.utc).replace(microsecond=0) + timedelta(seconds=1)
+    _prepare(engine, schema, positions, now)
+
+    _release_connections()
+    writes_before = _table_writes(engine, schema)
+    lsn_before = _wal_lsn(engine)
+    sampler = LockSampler(url, args.sample_ms / 1000.0)
+    sampler.start()
+    statements_before = _counter["statements"]
+
+    info: dict = {"error": None}
+    as_of = now
+    t0 = time.perf_counter()
+    try:
+        if impl in ("core_rows", "core_set"):
+            as_of = _run_core(scratch, now, impl.split("_", 1)[1])
+        elif impl == "legacy":
+            as_of = _run_legacy(scratch, now)
+        elif impl == "cli":
+            as_of = _run_cli(_scratch_url(url, schema), args.chunk_size)
+        else:
+            raise ValueError(f"Unknown implementation: {impl}")
+    except Exception as e:  # reported, not raised: the other implementations still run
+        info["error"] = f"{type(e).__name__}: {str(e).splitlines()[0][:200]}"
+    info["seconds"] = round(time.perf_counter() - t0, 3)
+    info["statements"] = _counter["statements"] - statements_before
+    info.update(sampler.stop())
+
+    _release_connections()
+    writes_after = _table_writes(engine, schema)
+    info["wal_bytes"] = _wal_diff(engine, _wal_lsn(engine), lsn_before)
+    by_table = {k: v - writes_before.get(k, 0) for k, v in writes_after.items() if v != writes_before.get(k, 0)}
+    by_table.pop("bench_before", None)
+    info["rows_written"] = sum(by_table.values())
+    info["rows_written_by_table"] = by_table
+    info["positions_per_s"] = round(positions / info["seconds"], 1) if info["seconds"] and not info["error"] else None
+
+    if info["error"] is None:
+        info["totals"] = diff_totals(engine, schema, as_of)
+    if impl == "legacy":
+        info["legacy_math"] = diff_legacy_math(engine, schema, as_of)
+    return info
+
+
+def main() -> dict:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", default="10000,100000,1000000")
+    ap.add_argument("--impls", default=",".join(IMPLEMENTATIONS))
+    ap.add_argument("--schema", default="bench_accrual_impls")
+    ap.add_argument("--chunk-size", type=int, default=1000, help="for the cli runner")
+    ap.add_argument("--sample-ms", type=int, default=50, help="lock wait sampling interval")
+    ap.add_argument("--json", default="", help="also write the results to this file")
+    ap.add_argument("--keep", action="store_true", help="keep the last scratch schema")
+    args = ap.parse_args()
+
+    url = os.environ["DATABASE_URL"]
+    engine = create_engine(url)
+    scratch = create_engine(_scratch_url(url, args.schema))
+
+    out: dict = {}
+    for size in [int(s) for s in args.sizes.split(",") if s]:
+        out[size] = {}
+        for impl in filter(None, args.impls.split(",")):
+            info = bench_one(url, engine, scratch, args.schema, impl, size, args)
+            out[size][impl] = info
+            print(size, impl, info, flush=True)
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(out, indent=2, default=str))
+    if not args.keep:
+        with engine.begin() as c:
+            c.execute(text(f"DROP SCHEMA IF EXISTS {args.schema} CASCADE"))
+    return out
+
+
+if __name__ == "__main__":
+    main()
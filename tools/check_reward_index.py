@@ -0,0 +1,115 @@
+"""
+Reward-index consistency check and periodic-cost comparison.
+
+Seeds a scratch schema with pools and legacy ACTIVE positions (same generator as
+bench_staking_accrual.py), enrolls them into index mode, then walks a random
+timeline: pool index advances (the periodic job), random materialisations
+(claim/unstake path: service.accrue_position) and maturities. Every ACCRUAL row
+written in index mode must equal calc_reward(principal, apy_bps, period_start,
+period_end) for its own period. Also times one periodic index step against
+set-based per-position accrual over the same positions.
+
+Usage:
+    DATABASE_URL=postgresql://... python tools/check_reward_index.py --positions 5000 --steps 20
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from sqlalchemy import create_engine, text  # noqa: E402
+from sqlalchemy.orm import Session  # noqa: E402
+
+from app.core.staking import service  # noqa: E402
+from app.core.staking.calculator import calc_reward  # noqa: E402
+from app.models_staking import StakingPosition  # noqa: E402
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from bench_staking_accrual import seed  # noqa: E402
+
+
+def main() -> dict:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--positions", type=int, default=5000)
+    ap.add_argument("--steps", type=int, default=20)
+    ap.add_argument("--schema", default="check_reward_index")
+    ap.add_argument("--seed", type=int, default=7)
+    ap.add_argument("--keep", action="store_true")
+    args = ap.parse_args()
+
+    rnd = random.Random(args.seed)
+    url = os.environ["DATABASE_URL"]
+    engine = create_engine(url)
+    t0 = datetime.now(timezone.utc).replace(microsecond=0) - timedelta(days=30)
+
+    seed(engine, args.schema, args.positions, t0 + timedelta(microseconds=rnd.randint(0, 999999)))
+
+    sess_engine = create_engine(url, connect_args={"options": f"-csearch_path={args.schema}"})
+    out: dict = {"positions": args.positions}
+
+    # periodic cost: set-based per-position accrual vs one index step, same positions, rolled back
+    with sess_engine.connect() as conn:
+        trans = conn.begin()
+        db = Session(bind=conn)
+        t = time.perf_counter()
+        service.accrue_all_active_positions(db, now=t0, mode="set")
+        out["periodic_set_based_s"] = round(time.perf_counter() - t, 4)
+        trans.rollback()
+
+    with Session(bind=sess_engine) as db:
+        enrolled = 0
+        for pos in db.query(StakingPosition).order_by(StakingPosition.id).all():
+            enrolled += service.enroll_position_in_reward_index(db, pos, t0)
+        db.commit()
+    out["enrolled"] = enrolled
+
+    now = t0
+    for _ in range(args.steps):
+        now = now + timedelta(seconds=rnd.randint(60, 36 * 3600), microseconds=rnd.randint(0, 999999))
+        with Session(bind=sess_engine) as db:
+            t = time.perf_counter()
+            service.accrue_index_positions(db, now)
+            out["periodic_index_s"] = round(time.perf_counter() - t, 4)
+            ids = db.execute(
+                text("SELECT id FROM staking_positions WHERE state = 'ACTIVE' AND reward_index_snapshot IS NOT NULL")
+            ).scalars().all()
+            for pid in rnd.sample(ids, min(len(ids), max(1, len(ids) // 20))):
+                service.accrue_position(db, service.get_position_for_update(db, pid), now)
+            db.commit()
+
+    with sess_engine.connect() as c:
+        rows = c.execute(text("""
+            SELECT r.position_id, r.amount, r.period_start, r.period_end, p.principal_amount, s.apy_bps
+            FROM staking_rewards r
+            JOIN staking_positions p ON p.id = r.position_id
+            JOIN staking_pools s ON s.id = p.pool_id
+            WHERE r.reward_type = 'ACCRUAL' AND r.meta->>'method' = 'reward_index'
+        """)).all()
+        completed = c.execute(text("SELECT count(*) FROM staking_positions WHERE state = 'COMPLETED'")).scalar_one()
+
+    bad = []
+    for r in rows:
+        want = calc_reward(Decimal(r.principal_amount), int(r.apy_bps), r.period_start, r.period_end).amount
+        if Decimal(r.amount) != want:
+            bad.append((r.position_id, str(r.amount), str(want)))
+    out.update(index_rewards=len(rows), mismatches=len(bad), mismatch_sample=bad[:5], completed=completed)
+    print(out)
+
+    if not args.keep:
+        with engine.begin() as c:
+            c.execute(text(f"DROP SCHEMA IF EXISTS {args.schema} CASCADE"))
+    return out
+
+
+if __name__ == "__main__":
+    main()
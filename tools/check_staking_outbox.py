@@ -0,0 +1,159 @@
+"""
+Outbox delivery check for app.core.staking.outbox.
+
+Writer threads insert staking_events in transactions that sleep a random time before
+committing (so commit order differs from seq order) and sometimes roll back. A consumer
+tails the table with LISTEN/NOTIFY while its handler fails at random. Every committed
+event must be delivered, no rolled-back one may be, and the first delivery of each
+event must come in (tx_id, seq) order. Reports commit -> handler latency.
+
+Usage:
+    DATABASE_URL=postgresql://... python tools/check_staking_outbox.py --writers 4 --txs 200
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+import uuid
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from sqlalchemy import create_engine, text  # noqa: E402
+
+from app.database import Base  # noqa: E402
+from app.core.staking.outbox import CHANNEL, OutboxConsumer  # noqa: E402
+from app.core.staking.partitions import ensure_partitions  # noqa: E402
+from app.models_staking import StakingEvent, StakingEventConsumer  # noqa: E402
+
+
+def main() -> dict:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--writers", type=int, default=4)
+    ap.add_argument("--txs", type=int, default=200, help="transactions per writer")
+    ap.add_argument("--fail-rate", type=float, default=0.1, help="handler failure probability")
+    ap.add_argument("--schema", default="check_staking_outbox")
+    ap.add_argument("--keep", action="store_true")
+    args = ap.parse_args()
+
+    url = os.environ["DATABASE_URL"]
+    engine = create_engine(url)
+    with engine.begin() as c:
+        c.execute(text(f"DROP SCHEMA IF EXISTS {args.schema} CASCADE"))
+        c.execute(text(f"CREATE SCHEMA {args.schema}"))
+    with engine.execution_options(schema_translate_map={None: args.schema}).begin() as c:
+        Base.metadata.create_all(c, tables=[StakingEvent.__table__, StakingEventConsumer.__table__])
+    with engine.begin() as c:
+        c.execute(text(f"SET LOCAL search_path TO {args.schema}"))
+        ensure_partitions(c, tables=["staking_events"])
+    with engine.begin() as c:
+        c.execute(text(f"""
+            CREATE OR REPLACE FUNCTION {args.schema}.notify() RETURNS trigger LANGUAGE plpgsql AS $$
+            BEGIN PERFORM pg_notify('{CHANNEL}', ''); RETURN NULL; END $$
+        """))
+        c.execute(text(f"""
+            CREATE TRIGGER trg_notify AFTER INSERT ON {args.schema}.staking_events
+            FOR EACH STATEMENT EXECUTE FUNCTION {args.schema}.notify()
+        """))
+
+    se = create_engine(url, connect_args={"options": f"-csearch_path={args.schema}"}, pool_size=args.writers + 2)
+    rnd = random.Random(11)
+    committed: dict[str, float] = {}
+    rolled_back: set[str] = set()
+    seen: dict[str, float] = {}
+    order: list[tuple[int, int]] = []
+    deliveries = 0
+    failures = 0
+    lock = threading.Lock()
+
+    def handler(events: list[dict]) -> None:
+        nonlocal deliveries, failures
+        with lock:
+            if rnd.random() < args.fail_rate:
+                failures += 1
+                raise RuntimeError("injected handler failure")
+            now = time.perf_counter()
+            for ev in events:
+                deliveries += 1
+                if ev["id"] not in seen:
+                    seen[ev["id"]] = now
+                    order.append((ev["tx_id"], ev["seq"]))
+
+    consumer = OutboxConsumer(se, "check", handler, batch_size=50, poll_interval=5.0, linger=0.0, from_start=True)
+    stop = threading.Event()
+    ct = threading.Thread(target=consumer.run, args=(stop,), daemon=True)
+    ct.start()
+
+    def writer(w: int) -> None:
+        wr = random.Random(w)
+        for _ in range(args.txs):
+            ids = [str(uuid.uuid4()) for _ in range(wr.randint(1, 3))]
+            with se.connect() as c:
+                trans = c.begin()
+                for i in ids:
+                    c.execute(
+                        text("INSERT INTO staking_events (id, event_type, user_telegram_id) VALUES (:id, 'CHECK', :u)"),
+                        {"id": i, "u": w},
+                    )
+                time.sleep(wr.random() * 0.02)
+                if wr.random() < 0.1:
+                    trans.rollback()
+                    with lock:
+                        rolled_back.update(ids)
+                else:
+                    trans.commit()
+                    t = time.perf_counter()
+                    with lock:
+                        for i in ids:
+                            committed[i] = t
+
+    threads = [threading.Thread(target=writer, args=(w,)) for w in range(args.writers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    deadline = time.time() + 120
+    while time.time() < deadline:
+        with lock:
+            if set(committed) <= set(seen):
+                break
+        time.sleep(0.2)
+    stop.set()
+    ct.join(30)
+
+    missing = set(committed) - set(seen)
+    phantom = (set(seen) - set(committed)) | (set(seen) & rolled_back)
+    latencies = sorted(seen[i] - committed[i] for i in committed if i in seen)
+    out = {
+        "committed": len(committed),
+        "rolled_back": len(rolled_back),
+        "delivered_unique": len(seen),
+        "deliveries": deliveries,
+        "handler_failures": failures,
+        "missing": len(missing),
+        "phantom": len(phantom),
+        "in_order": order == sorted(order),
+        "latency_ms_p50": round(statistics.median(latencies) * 1000, 1) if latencies else None,
+        "latency_ms_p99": round(latencies[int(len(latencies) * 0.99) - 1] * 1000, 1) if latencies else None,
+    }
+    with se.connect() as c:
+        out["offset"] = dict(c.execute(text("SELECT last_tx_id, last_seq, delivered FROM staking_event_consumers")).mappings().one())
+    print(out)
+
+    se.dispose()
+    if not args.keep:
+        with engine.begin() as c:
+            c.execute(text(f"DROP SCHEMA IF EXISTS {args.schema} CASCADE"))
+    return out
+
+
+if __name__ == "__main__":
+    main()
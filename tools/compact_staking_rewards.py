@@ -0,0 +1,96 @@
+"""
+Roll closed staking_rewards ACCRUAL rows into day / month buckets per position.
+
+Policy (defaults from STAKING_REWARDS_RAW_DAYS / STAKING_REWARDS_MONTHLY_AFTER_DAYS):
+raw rows older than --raw-days become day rollups, anything older than
+--monthly-after-days becomes month rollups. Each position batch is one short
+transaction. --verify checks per-position ACCRUAL sums and represented row
+counts are unchanged.
+
+Usage:
+    DATABASE_URL=postgresql://... python tools/compact_staking_rewards.py --verify
+"""
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from sqlalchemy import text  # noqa: E402
+
+from app.core.staking.compaction import (  # noqa: E402
+    DEFAULT_BATCH_POSITIONS,
+    MONTHLY_AFTER_DAYS,
+    RAW_DAYS,
+    compact_rewards,
+)
+from app.database import SessionLocal  # noqa: E402
+
+_SNAPSHOT_SQL = text("""
+    SELECT position_id,
+           sum(amount)::text AS amount,
+           sum(COALESCE(CAST(meta->>'rows' AS bigint), 1)) AS n_rows,
+           min(period_start) AS period_start,
+           max(period_end) AS period_end
+    FROM staking_rewards
+    WHERE reward_type = 'ACCRUAL'
+    GROUP BY position_id
+""")
+
+
+def _snapshot() -> dict:
+    db = SessionLocal()
+    try:
+        return {r.position_id: (r.amount, int(r.n_rows), r.period_start, r.period_end) for r in db.execute(_SNAPSHOT_SQL)}
+    finally:
+        db.close()
+
+
+def _table_rows() -> int:
+    db = SessionLocal()
+    try:
+        return int(db.execute(text("SELECT count(*) FROM staking_rewards")).scalar_one())
+    finally:
+        db.close()
+
+
+def main() -> dict:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--raw-days", type=int, default=RAW_DAYS)
+    ap.add_argument("--monthly-after-days", type=int, default=MONTHLY_AFTER_DAYS)
+    ap.add_argument("--batch", type=int, default=DEFAULT_BATCH_POSITIONS)
+    ap.add_argument("--verify", action="store_true")
+    args = ap.parse_args()
+
+    before = _snapshot() if args.verify else None
+    rows_before = _table_rows()
+    t0 = time.perf_counter()
+    out = compact_rewards(
+        SessionLocal,
+        raw_days=args.raw_days,
+        monthly_after_days=args.monthly_after_days,
+        batch=args.batch,
+    )
+    out["seconds"] = round(time.perf_counter() - t0, 3)
+    out["table_rows_before"] = rows_before
+    out["table_rows_after"] = _table_rows()
+
+    if before is not None:
+        after = _snapshot()
+        diff = [k for k in set(before) | set(after) if before.get(k) != after.get(k)]
+        out["verify_positions"] = len(before)
+        out["verify_mismatches"] = len(diff)
+        out["verify_sample"] = [(k, before.get(k), after.get(k)) for k in sorted(diff)[:5]]
+
+    for k, v in out.items():
+        print(f"{k}: {v}")
+    return out
+
+
+if __name__ == "__main__":
+    main()
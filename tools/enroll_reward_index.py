@@ -0,0 +1,66 @@
+"""
+Move ACTIVE per-position accrual into reward-index mode, in small committed batches.
+
+Each position is accrued the old way up to a whole second and then snapshots its
+pool's index (service.enroll_position_in_reward_index). Safe to re-run: enrolled
+positions are skipped. New positions use index mode when STAKING_REWARD_INDEX=1.
+
+Usage:
+    DATABASE_URL=postgresql://... python tools/enroll_reward_index.py --batch 500
+"""
+from __future__ import annotations
+
+import argparse
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from app.core.staking import service  # noqa: E402
+from app.database import SessionLocal  # noqa: E402
+from app.models_staking import StakingPosition, StakingPositionState  # noqa: E402
+
+
+def main() -> dict:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--batch", type=int, default=500)
+    args = ap.parse_args()
+
+    enrolled = skipped = 0
+    after = ""
+    while True:
+        db = SessionLocal()
+        try:
+            batch = (
+                db.query(StakingPosition)
+                .filter(
+                    StakingPosition.state == StakingPositionState.ACTIVE.value,
+                    StakingPosition.reward_index_snapshot.is_(None),
+                    StakingPosition.id > after,
+                )
+                .order_by(StakingPosition.id)
+                .limit(args.batch)
+                .with_for_update(skip_locked=True)
+                .all()
+            )
+            if not batch:
+                break
+            now = service.utcnow()
+            for pos in batch:
+                if service.enroll_position_in_reward_index(db, pos, now):
+                    enrolled += 1
+                else:
+                    skipped += 1
+            after = batch[-1].id
+            db.commit()
+        finally:
+            db.close()
+        print(f"enrolled={enrolled} skipped={skipped} last_id={after}")
+
+    return {"enrolled": enrolled, "skipped": skipped}
+
+
+if __name__ == "__main__":
+    main()
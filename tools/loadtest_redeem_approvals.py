@@ -0,0 +1,159 @@
+"""
+Parallel load test for redemption approval (app.crud_investments.approve_redeems).
+
+Everything runs in a scratch schema (LOADTEST_SCHEMA, default loadtest_redeem) holding
+its own copies of the investments tables, so the real ledger is never read or written:
+seeds N synthetic users with a balance and more redeem requests than the balance can
+cover, then approves them from 1/2/4/8 threads, each with its own session. Checks that
+no balance goes negative and that slh_balances still equals SUM(slh_ledger), and reports
+approvals/sec. The schema is dropped at the end.
+
+Usage:
+    DATABASE_URL=postgresql://... python tools/loadtest_redeem_approvals.py
+"""
+from __future__ import annotations
+
+import os
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from sqlalchemy import create_engine, text  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+from app.crud_investments import approve_redeems, post_slh  # noqa: E402
+from app.database import DATABASE_URL, Base  # noqa: E402
+from app.models_investments import Deposit, RedemptionRequest, SLHBalance, SLHLedger  # noqa: E402
+
+USER_BASE = int(os.getenv("LOADTEST_USER_BASE") or "900000000")
+USERS = int(os.getenv("LOADTEST_USERS") or "200")
+REDEEMS_PER_USER = int(os.getenv("LOADTEST_REDEEMS_PER_USER") or "6")
+BALANCE = Decimal("100")
+REDEEM_AMOUNT = Decimal("25")  # 6 x 25 > 100: every user has more requests than funds
+SCHEMA = os.getenv("LOADTEST_SCHEMA") or "loadtest_redeem"
+
+TABLES = [Deposit.__table__, SLHLedger.__table__, RedemptionRequest.__table__, SLHBalance.__table__]
+
+if not SCHEMA.isidentifier() or SCHEMA.lower() == "public":
+    raise SystemExit(f"LOADTEST_SCHEMA must be a scratch schema name, got {SCHEMA!r}")
+
+# every session lives in the scratch schema: unqualified table names never reach public
+ENGINE = create_engine(DATABASE_URL, connect_args={"options": f"-csearch_path={SCHEMA}"})
+SessionLocal = sessionmaker(bind=ENGINE, autocommit=False, autoflush=False)
+
+
+def _cleanup() -> None:
+    """(Re)create the scratch schema with empty investments tables."""
+    with ENGINE.begin() as c:
+        c.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+        c.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+    with ENGINE.execution_options(schema_translate_map={None: SCHEMA}).begin() as c:
+        Base.metadata.create_all(c, tables=TABLES)
+
+
+def _drop() -> None:
+    with ENGINE.begin() as c:
+        c.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+
+
+def _seed() -> list[int]:
+    db = SessionLocal()
+    try:
+        for u in range(USER_BASE, USER_BASE + USERS):
+            post_slh(db, u, BALANCE, "admin_adjust", ref_type="loadtest")
+        ids = db.execute(
+            text(
+                """
+                INSERT INTO redemption_requests (user_id, slh_amount, status, created_at)
+                SELECT u, :amt, 'requested', now()
+                FROM generate_series(:lo, :hi - 1) u, generate_series(1, :n)
+                RETURNING id
+                """
+            ),
+            {"amt": REDEEM_AMOUNT, "lo": USER_BASE, "hi": USER_BASE + USERS, "n": REDEEMS_PER_USER},
+        ).scalars().all()
+        db.commit()
+        return list(ids)
+    finally:
+        db.close()
+
+
+def _approve_one(redeem_id: int) -> str:
+    db = SessionLocal()
+    try:
+        res = approve_redeems(db, [(redeem_id, f"lt-{redeem_id}")])[0]
+        db.commit()
+        return res["result"]
+    finally:
+        db.close()
+
+
+def _check() -> dict:
+    db = SessionLocal()
+    try:
+        p = {"lo": USER_BASE, "hi": USER_BASE + USERS}
+        negative = db.execute(
+            text("SELECT count(*) FROM slh_balances WHERE user_id >= :lo AND user_id < :hi AND balance_slh < 0"), p
+        ).scalar_one()
+        drift = db.execute(
+            text(
+                """
+                SELECT count(*) FROM slh_balances b
+                WHERE b.user_id >= :lo AND b.user_id < :hi
+                  AND b.balance_slh <> (SELECT COALESCE(SUM(l.amount_slh), 0) FROM slh_ledger l WHERE l.user_id = b.user_id)
+                """
+            ),
+            p,
+        ).scalar_one()
+        return {"negative_balances": int(negative), "balance_drift": int(drift)}
+    finally:
+        db.close()
+
+
+def run(workers: int) -> dict:
+    _cleanup()
+    ids = _seed()
+    random.shuffle(ids)
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        outcomes = list(ex.map(_approve_one, ids))
+    elapsed = time.perf_counter() - t0
+
+    approved = outcomes.count("approved")
+    result = {
+        "workers": workers,
+        "requests": len(ids),
+        "approved": approved,
+        "insufficient": outcomes.count("insufficient"),
+        "elapsed_s": round(elapsed, 3),
+        "approvals_per_s": round(len(ids) / elapsed, 1) if elapsed > 0 else None,
+        "expected_approved": USERS * int(BALANCE // REDEEM_AMOUNT),
+        **_check(),
+    }
+    return result
+
+
+def main() -> list[dict]:
+    if not DATABASE_URL.startswith("postgresql"):
+        raise SystemExit("DATABASE_URL must point at PostgreSQL")
+    results = []
+    try:
+        for w in (1, 2, 4, 8):
+            r = run(w)
+            results.append(r)
+            print(r)
+    finally:
+        _drop()
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+List / create / detach the monthly partitions of staking_events and staking_rewards.
+
+By default creates any missing month up to --ahead months after the current one, then
+checks the runway: exits 1 when any table is covered for fewer than --min-runway-days
+(the API processes do the same every few hours; this is the cron fallback, e.g. daily
+`0 3 * * * cd /app && python tools/manage_staking_partitions.py`, so a short runway
+shows up as a failed job). With --keep-months N it also detaches the months that end more than N
+full months before the current one and moves them to --archive-schema (dump and drop them
+from there); an events month still holding events an outbox consumer hasn't read is kept.
+
+Usage:
+    DATABASE_URL=postgresql://... python tools/manage_staking_partitions.py --list
+    DATABASE_URL=postgresql://... python tools/manage_staking_partitions.py --ahead 6
+    DATABASE_URL=postgresql://... python tools/manage_staking_partitions.py --keep-months 12 --dry-run
+"""
+from __future__ import annotations
+
+import argparse
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from app.core.staking.partitions import (  # noqa: E402
+    AHEAD_MONTHS,
+    ARCHIVE_SCHEMA,
+    KEEP_MONTHS,
+    MIN_RUNWAY_DAYS,
+    TABLES,
+    check_runway,
+    detach_old,
+    ensure_partitions,
+    list_partitions,
+)
+from app.db import ENGINE  # noqa: E402
+
+
+def _print_partitions() -> None:
+    with ENGINE.connect() as conn:
+        for table in TABLES:
+            for p in list_partitions(conn, table):
+                pending = " (detach pending)" if p["detach_pending"] else ""
+                print(
+                    f"{p['name']}: {p['lower']:%Y-%m-%d} .. {p['upper']:%Y-%m-%d} "
+                    f"~{p['rows_estimate']} rows, {p['bytes'] // 1024} KiB{pending}"
+                )
+
+
+def main() -> dict:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--list", action="store_true", help="only list the partitions")
+    ap.add_argument("--ahead", type=int, default=AHEAD_MONTHS)
+    ap.add_argument("--keep-months", type=int, default=KEEP_MONTHS, help="0 detaches nothing")
+    ap.add_argument("--archive-schema", default=ARCHIVE_SCHEMA, help="'' leaves detached tables in place")
+    ap.add_argument("--dry-run", action="store_true", help="report what would be detached")
+    ap.add_argument("--min-runway-days", type=int, default=MIN_RUNWAY_DAYS)
+    args = ap.parse_args()
+
+    if args.list:
+        _print_partitions()
+        return {}
+
+    out: dict = {}
+    if not args.dry_run:
+        with ENGINE.begin() as conn:
+            out["created"] = ensure_partitions(conn, ahead=args.ahead)
+    out["detached"] = [
+        (d["name"], d["action"])
+        for d in detach_old(
+            ENGINE,
+            keep_months=args.keep_months,
+            archive_schema=args.archive_schema or None,
+            dry_run=args.dry_run,
+        )
+    ]
+    with ENGINE.connect() as conn:
+        out["runway"] = {
+            t: (f"{r['covered_until']:%Y-%m-%d}" if r["covered_until"] else None, r["days"], r["short"])
+            for t, r in check_runway(conn, min_days=args.min_runway_days).items()
+        }
+    for k, v in out.items():
+        print(f"{k}: {v}")
+    return out
+
+
+if __name__ == "__main__":
+    if any(short for _, _, short in main().get("runway", {}).values()):
+        sys.exit(1)
@@ -1,25 +1,17 @@
 from __future__ import annotations
 
+import argparse
 import os
-import uuid
-from datetime import datetime, timezone
-from decimal import Decimal, ROUND_DOWN, getcontext
+import sys
+from pathlib import Path
 
-from sqlalchemy import bindparam, create_engine, text
-from sqlalchemy.dialects.postgresql import JSONB
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
 
-getcontext().prec = 50
+from sqlalchemy import create_engine  # noqa: E402
 
-SECONDS_PER_YEAR = Decimal("31536000")  # 365 days
-LOCK_ID = 912345678
-
-
-def utcnow() -> datetime:
-    return datetime.now(timezone.utc)
-
-
-def quant18(x: Decimal) -> Decimal:
-    return x.quantize(Decimal("0.000000000000000001"), rounding=ROUND_DOWN)
+from app.core.staking.accrual_runner import DEFAULT_CHUNK_SIZE, run_accrual, run_accrual_parallel  # noqa: E402
 
 
 def pick_db_url() -> str:
@@ -53,218 +45,58 @@ def pick_db_url() -> str:
     return url
 
 
-def q1(conn, sql: str, params: dict | None = None):
-    return conn.execute(text(sql), params or {}).mappings().first()
-
-
-def qall(conn, sql: str, params: dict | None = None):
-    return conn.execute(text(sql), params or {}).mappings().all()
-
-
-def main() -> dict:
-    db_url = pick_db_url()
-    e = create_engine(db_url)
-
-    now = utcnow()
-
-    with e.begin() as c:
-        locked_row = q1(c, "SELECT pg_try_advisory_lock(:id) AS ok", {"id": LOCK_ID})
-        locked = bool(locked_row["ok"]) if locked_row else False
-        if not locked:
-            result = {
-                "ok": False,
-                "skipped": True,
-                "reason": "advisory_lock_busy",
-                "updated_positions": 0,
-                "inserted_rewards": 0,
-                "inserted_events": 0,
-                "completed_positions": 0,
-            }
+def main(argv: list[str] | None = None) -> dict:
+    ap = argparse.ArgumentParser(description="Chunked, restartable staking accrual run.")
+    ap.add_argument("--chunk-size", type=int, default=int(os.getenv("ACCRUAL_CHUNK_SIZE") or DEFAULT_CHUNK_SIZE))
+    ap.add_argument("--run-id", default=None, help="resume this run id")
+    ap.add_argument("--no-resume", action="store_true", help="start a new run even if an unfinished one exists")
+    ap.add_argument("--max-chunks", type=int, default=None, help="stop after N chunks (run stays resumable)")
+    ap.add_argument("--workers", type=int, default=int(os.getenv("ACCRUAL_WORKERS") or 1),
+                    help="N > 1: parallel worker processes claiming chunks with SKIP LOCKED")
+    ap.add_argument("--db-url", default=None, help="use this database instead of picking one from the environment")
+    args = ap.parse_args(argv)
+
+    db_url = args.db_url or pick_db_url()
+    if args.workers > 1:
+        result = run_accrual_parallel(
+            db_url,
+            workers=args.workers,
+            chunk_size=args.chunk_size,
+            run_id=args.run_id,
+            resume=not args.no_resume,
+        )
+        if result.get("skipped"):
             print("Another accrual is running (advisory lock busy). Exiting.")
             return result
-
-        updated_positions = 0
-        inserted_rewards = 0
-        inserted_events = 0
-        completed_positions = 0
-
-        try:
-            rows = qall(
-                c,
-                """
-                SELECT
-                    p.id              AS position_id,
-                    p.user_telegram_id,
-                    p.pool_id,
-                    p.principal_amount,
-                    p.state,
-                    p.activated_at,
-                    p.matures_at,
-                    p.last_accrual_at,
-                    p.total_reward_accrued,
-                    p.total_reward_claimed,
-                    p.version,
-                    pool.apy_bps,
-                    pool.ends_at AS pool_ends_at,
-                    pool.starts_at AS pool_starts_at
-                FROM staking_positions p
-                JOIN staking_pools pool ON pool.id = p.pool_id
-                WHERE p.state = 'ACTIVE'
-                ORDER BY p.created_at ASC
-                FOR UPDATE
-                """
-            )
-
-            if not rows:
-                result = {
-                    "ok": True,
-                    "skipped": True,
-                    "reason": "no_active_positions",
-                    "updated_positions": 0,
-                    "inserted_rewards": 0,
-                    "inserted_events": 0,
-                    "completed_positions": 0,
-                }
-                print("No ACTIVE positions found.")
-                return result
-
-            for r in rows:
-                pos_id = r["position_id"]
-                user_id = r["user_telegram_id"]
-                pool_id = r["pool_id"]
-
-                principal = Decimal(str(r["principal_amount"]))
-                apy_bps = Decimal(str(r["apy_bps"]))
-                apy = apy_bps / Decimal("10000")
-
-                start_ts = r["last_accrual_at"] or r["activated_at"] or now
-
-                end_ts = now
-                if r["matures_at"] is not None and r["matures_at"] < end_ts:
-                    end_ts = r["matures_at"]
-                if r["pool_ends_at"] is not None and r["pool_ends_at"] < end_ts:
-                    end_ts = r["pool_ends_at"]
-
-                if end_ts <= start_ts:
-                    continue
-
-                delta_seconds = Decimal(str((end_ts - start_ts).total_seconds()))
-                if delta_seconds <= 0:
-                    continue
-
-                reward = principal * apy * (delta_seconds / SECONDS_PER_YEAR)
-                reward = quant18(reward)
-
-                # Always advance last_accrual_at
-                if reward <= 0:
-                    c.execute(
-                        text(
-                            """
-                            UPDATE staking_positions
-                            SET last_accrual_at = :end_ts,
-                                version = version + 1
-                            WHERE id = :pid
-                            """
-                        ),
-                        {"end_ts": end_ts, "pid": pos_id},
-                    )
-                    updated_positions += 1
-                    continue
-
-                total_accrued = Decimal(str(r["total_reward_accrued"] or 0))
-                new_total_accrued = total_accrued + reward
-
-                c.execute(
-                    text(
-                        """
-                        UPDATE staking_positions
-                        SET last_accrual_at = :end_ts,
-                            total_reward_accrued = :new_total,
-                            version = version + 1
-                        WHERE id = :pid
-                        """
-                    ),
-                    {"end_ts": end_ts, "new_total": new_total_accrued, "pid": pos_id},
-                )
-                updated_positions += 1
-
-                reward_id = str(uuid.uuid4())
-                c.execute(
-                    text(
-                        """
-                        INSERT INTO staking_rewards (
-                            id, position_id, reward_type, amount,
-                            period_start, period_end, created_at
-                        ) VALUES (
-                            :id, :position_id, :reward_type, :amount,
-                            :period_start, :period_end, :created_at
-                        )
-                        """
-                    ),
-                    {
-                        "id": reward_id,
-                        "position_id": pos_id,
-                        "reward_type": "ACCRUAL",
-                        "amount": reward,
-                        "period_start": start_ts,
-                        "period_end": end_ts,
-                        "created_at": now,
-                    },
-                )
-                inserted_rewards += 1
-
-                event_id = str(uuid.uuid4())
-                details = {
-                    "reward_id": reward_id,
-                    "amount": str(reward),
-                    "from": start_ts.isoformat(),
-                    "to": end_ts.isoformat(),
-                }
-
-                c.execute(
-                    text(
-                        """
-                        INSERT INTO staking_events (
-                            id, event_type, user_telegram_id, pool_id, position_id,
-                            occurred_at, details
-                        ) VALUES (
-                            :id, :event_type, :user_telegram_id, :pool_id, :position_id,
-                            :occurred_at, :details
-                        )
-                        """
-                    ).bindparams(bindparam("details", type_=JSONB)),
-                    {
-                        "id": event_id,
-                        "event_type": "REWARD_ACCRUED",
-                        "user_telegram_id": user_id,
-                        "pool_id": pool_id,
-                        "position_id": pos_id,
-                        "occurred_at": now,
-                        "details": details,
-                    },
-                )
-                inserted_events += 1
-
-            result = {
-                "ok": True,
-                "skipped": False,
-                "updated_positions": updated_positions,
-                "inserted_rewards": inserted_rewards,
-                "inserted_events": inserted_events,
-                "completed_positions": completed_positions,
-            }
-
-            print("ACCRUAL DONE")
-            for k, v in result.items():
+        print("ACCRUAL DONE")
+        for k, v in result.items():
+            if k != "chunks":
                 print(f"{k}: {v}")
+        return result
 
-            return result
+    e = create_engine(db_url)
 
-        finally:
-            try:
-                c.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": LOCK_ID})
-            except Exception:
-                pass
+    def on_chunk(n: int, stats: dict) -> None:
+        print(f"chunk {n}: positions={stats['positions']} rewarded={stats['rewarded']} "
+              f"last_id={stats['last_id']} ms={stats['ms']}")
+
+    result = run_accrual(
+        e,
+        chunk_size=args.chunk_size,
+        run_id=args.run_id,
+        resume=not args.no_resume,
+        max_chunks=args.max_chunks,
+        on_chunk=on_chunk,
+    )
+    if result.get("skipped"):
+        print("Another accrual is running (advisory lock busy). Exiting.")
+        return result
+
+    print("ACCRUAL DONE" if result["status"] == "COMPLETED" else "ACCRUAL PAUSED (resumable)")
+    for k, v in result.items():
+        if k != "chunks":
+            print(f"{k}: {v}")
+    return result
 
 
 if __name__ == "__main__":
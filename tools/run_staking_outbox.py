@@ -0,0 +1,56 @@
+"""
+Standalone staking outbox consumer (Telegram notifications).
+
+Usage:
+    DATABASE_URL=postgresql://... python tools/run_staking_outbox.py [--dry-run] [--once]
+"""
+from __future__ import annotations
+
+import argparse
+import logging
+import signal
+import sys
+import threading
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from sqlalchemy import create_engine  # noqa: E402
+
+from app.core.staking.outbox import OutboxConsumer, TelegramNotifier  # noqa: E402
+from run_staking_accrual_once import pick_db_url  # noqa: E402
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Tail staking_events and send Telegram notifications.")
+    ap.add_argument("--name", default="telegram_notifications", help="consumer name (offset row)")
+    ap.add_argument("--batch", type=int, default=500)
+    ap.add_argument("--dry-run", action="store_true", help="log messages instead of sending")
+    ap.add_argument("--from-start", action="store_true", help="new consumer starts at the first event, not the head")
+    ap.add_argument("--once", action="store_true", help="drain what is there and exit")
+    args = ap.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(message)s")
+    engine = create_engine(pick_db_url())
+    notifier = TelegramNotifier(dry_run=args.dry_run)
+    consumer = OutboxConsumer(engine, args.name, notifier, batch_size=args.batch, from_start=args.from_start)
+
+    if args.once:
+        total = 0
+        while (n := consumer.poll_once()) > 0:
+            total += n
+        consumer.close()
+        print(f"delivered={total} sent={notifier.sent} dropped={notifier.dropped} leader={consumer.is_leader}")
+        return
+
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+    consumer.run(stop)
+
+
+if __name__ == "__main__":
+    main()
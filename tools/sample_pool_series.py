@@ -0,0 +1,43 @@
+"""
+Fold new staking_events into staking_pool_series (hourly per-pool metrics).
+
+Incremental: reads events after the "pool_series" consumer offset, one transaction per
+--batch events, until caught up. The first run seeds the levels from user_staking_summary.
+The in-app accrual scheduler does the same after every run; use this from cron when the
+scheduler is off.
+
+Usage:
+    DATABASE_URL=postgresql://... python tools/sample_pool_series.py
+    DATABASE_URL=postgresql://... python tools/sample_pool_series.py --batch 10000
+"""
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from app.core.staking.pool_series import DEFAULT_BATCH, sample  # noqa: E402
+from app.db import ENGINE  # noqa: E402
+
+
+def main() -> dict:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--batch", type=int, default=DEFAULT_BATCH)
+    ap.add_argument("--max-batches", type=int, default=None)
+    args = ap.parse_args()
+
+    t0 = time.perf_counter()
+    out = sample(ENGINE, batch=args.batch, max_batches=args.max_batches)
+    out["seconds"] = round(time.perf_counter() - t0, 3)
+    for k, v in out.items():
+        print(f"{k}: {v}")
+    return out
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+"""
+Recompute user_staking_summary from staking_positions and report (or repair) drift.
+
+Walks users in keyset batches of --batch, one short transaction each; --after resumes
+from a user_telegram_id. Without --fix nothing is written. With --fix drifted rows are
+rewritten (locks the batch's summary rows first, so concurrent writers stay consistent).
+
+Usage:
+    DATABASE_URL=postgresql://... python tools/verify_staking_summary.py
+    DATABASE_URL=postgresql://... python tools/verify_staking_summary.py --fix --batch 1000
+"""
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from app.core.staking.summary import DEFAULT_VERIFY_BATCH, verify_summaries  # noqa: E402
+from app.database import SessionLocal  # noqa: E402
+
+
+def main() -> dict:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--batch", type=int, default=DEFAULT_VERIFY_BATCH)
+    ap.add_argument("--after", type=int, default=0)
+    ap.add_argument("--fix", action="store_true")
+    args = ap.parse_args()
+
+    t0 = time.perf_counter()
+    out = verify_summaries(SessionLocal, fix=args.fix, batch=args.batch, after=args.after)
+    out["seconds"] = round(time.perf_counter() - t0, 3)
+    for k, v in out.items():
+        print(f"{k}: {v}")
+    return out
+
+
+if __name__ == "__main__":
+    main()